@@ -0,0 +1,291 @@
+"""
+Answer cache module - reuses LLM answers for repeated questions about a module
+Questions are normalized (case, punctuation, filler words, plurals) and matched
+exactly, or as near-duplicates: rewordings that keep every content word, in the
+same order, and only differ in function words ("causes of the war" / "the war's
+causes" don't match; "what happens in X" / "what happens during X" do).
+Prepositions that give a direction or a role ("from A to B", "by", "with") count
+as content words, so "convert X from A to B" and "convert X to A from B" don't
+match either. Entries
+live in an in-memory LRU in front of a persistent SQLite table, both scoped per
+pdf_id with a TTL. Answers written with a chat session's history in the prompt are
+stored under that session's scope (see conversation_memory.Memory.cache_scope) and
+only reused for that exact question within the same scope.
+"""
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import db
+from metrics import timed
+from search_index import tokenize
+
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', 1024))            # in-memory entries
+ANSWER_CACHE_MAX_ROWS = int(os.getenv('ANSWER_CACHE_MAX_ROWS', 50000))   # SQLite entries
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', 7 * 24 * 3600))   # seconds
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', 0.9))  # 1 disables near-duplicates
+SHINGLE_SIZE = 3
+# Cached questions of a module compared against on a near-duplicate lookup
+SIMILAR_SCAN_LIMIT = 2000
+# Prune the SQLite tier every this many stored answers
+PRUNE_EVERY = 200
+
+# Words that don't change what is being asked ("What is X?" == "Can you tell me what X is, please")
+FILLER_WORDS = {'a', 'an', 'the', 'please', 'kindly', 'can', 'could', 'would', 'you', 'me', 'tell',
+                'what', 'is', 'are', 'was', 'were', 'do', 'does'}
+# Words a near-duplicate may differ in; every other word must match, in order
+FUNCTION_WORDS = {'of', 'in', 'on', 'at', 'for', 'about', 'during', 'and',
+                  'it', 'its', 'this', 'that', 'these', 'those', 'there', 'some', 'any', 'my', 's'}
+
+_caches = weakref.WeakSet()
+
+
+def init_cache_table(conn):
+    """Create the answer_cache table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            pdf_id INTEGER NOT NULL,
+            question_key TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (pdf_id, question_key)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_answer_cache_last_used ON answer_cache(last_used)')
+
+
+def rekey(conn):
+    """Recompute the stored question_key of every row with the current normalize_question"""
+    rows = conn.execute('SELECT rowid, question_key, question FROM answer_cache').fetchall()
+    for rowid, key, question in rows:
+        scope = key[1:key.index(' ')] if key.startswith('@') else 0
+        conn.execute('UPDATE OR REPLACE answer_cache SET question_key = ? WHERE rowid = ?',
+                     (scoped_key(normalize_question(question), scope), rowid))
+
+
+def stem(word):
+    """Singular of a plural word; conservative, so different words are never merged"""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def normalize_question(question):
+    """Cache key for a question: its words in order, lowercased and singular, without filler words"""
+    words = [stem(w) for w in tokenize(question or '')]
+    kept = [w for w in words if w not in FILLER_WORDS]
+    return ' '.join(kept or words)
+
+
+def scoped_key(key, scope=0):
+    """Key of a normalized question within a cache scope; scope 0 is shared by everyone"""
+    return f'@{scope} {key}' if scope else key
+
+
+def content_words(key):
+    """The words of a normalized question that a near-duplicate must share, in order"""
+    return [w for w in key.split() if w not in FUNCTION_WORDS]
+
+
+def word_bigrams(words):
+    """Set of adjacent word pairs, with start/end markers so word order always counts"""
+    padded = ['^', *words, '$']
+    return set(zip(padded, padded[1:]))
+
+
+def near_duplicate_score(key, other_key):
+    """
+    Similarity of two normalized questions for answer reuse: 0 unless both have
+    the same content words, else the word-bigram Jaccard of those words (1 when
+    they come in the same order)
+    """
+    words, other = content_words(key), content_words(other_key)
+    if not words or sorted(words) != sorted(other):
+        # Any content word without a counterpart ("war i" vs "war ii") changes the question
+        return 0.0
+    return jaccard(word_bigrams(words), word_bigrams(other))
+
+
+def shingles(key, size=SHINGLE_SIZE):
+    """Set of overlapping character n-grams of a normalized question"""
+    padded = f' {key} '
+    if len(padded) <= size:
+        return {padded}
+    return {padded[i:i + size] for i in range(len(padded) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def invalidate_module(conn, pdf_id):
+    """
+    Drop cached answers for a module (it was deleted or its content re-indexed).
+    Rows are deleted on the caller's connection so it happens in the same transaction.
+    """
+    conn.execute('DELETE FROM answer_cache WHERE pdf_id = ?', (pdf_id,))
+    for cache in list(_caches):
+        cache.forget(pdf_id)
+
+
+class AnswerCache:
+    """Two-tier (memory LRU + SQLite) answer cache with hit/miss counters"""
+
+    def __init__(self, db_name, size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+                 similarity=ANSWER_CACHE_SIMILARITY, max_rows=ANSWER_CACHE_MAX_ROWS):
+        self.db_name = db_name
+        self.size = size
+        self.ttl = ttl
+        self.similarity = similarity
+        self.max_rows = max_rows
+        self.memory = OrderedDict()   # (pdf_id, key) -> (answer, created_at)
+        self.lock = threading.Lock()
+        self.counts = {'memory_hits': 0, 'disk_hits': 0, 'similar_hits': 0, 'misses': 0,
+                       'stores': 0, 'invalidations': 0}
+        self.puts_since_prune = 0
+        _caches.add(self)
+
+    def _connect(self):
+        return db.connect(self.db_name)
+
+    def _count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def _remember(self, pdf_id, key, answer, created_at):
+        with self.lock:
+            self.memory[(pdf_id, key)] = (answer, created_at)
+            self.memory.move_to_end((pdf_id, key))
+            while len(self.memory) > self.size:
+                self.memory.popitem(last=False)
+
+    @timed('answer_cache')
+    def get(self, pdf_id, question, scope=0):
+        """Cached answer for this question (or a near-duplicate of it, in scope 0), or None"""
+        key = normalize_question(question)
+        if not key:
+            return None
+        words, key = key, scoped_key(key, scope)
+        now = time.time()
+
+        with self.lock:
+            entry = self.memory.get((pdf_id, key))
+            if entry and now - entry[1] < self.ttl:
+                self.memory.move_to_end((pdf_id, key))
+                self.counts['memory_hits'] += 1
+                return entry[0]
+            if entry:
+                del self.memory[(pdf_id, key)]
+
+        conn = self._connect()
+        try:
+            c = conn.cursor()
+            c.execute('''
+                SELECT answer, created_at FROM answer_cache
+                WHERE pdf_id = ? AND question_key = ? AND created_at > ?
+            ''', (pdf_id, key, now - self.ttl))
+            row = c.fetchone()
+            hit, matched_key = 'disk_hits', key
+
+            if not row and not scope and self.similarity < 1:
+                # Near-duplicates among the module's recently used shared questions, compared
+                # by their stored keys (rows from older versions are rekeyed by a migration)
+                c.execute('''
+                    SELECT question_key, answer, created_at FROM answer_cache
+                    WHERE pdf_id = ? AND created_at > ? AND question_key NOT LIKE '@%'
+                    ORDER BY last_used DESC LIMIT ?
+                ''', (pdf_id, now - self.ttl, SIMILAR_SCAN_LIMIT))
+                best_score = self.similarity
+                for cached_key, answer, created_at in c.fetchall():
+                    score = near_duplicate_score(words, cached_key)
+                    if score >= best_score:
+                        best_score, row, matched_key = score, (answer, created_at), cached_key
+                hit = 'similar_hits'
+
+            if not row:
+                self._count('misses')
+                return None
+
+            conn.execute('''
+                UPDATE answer_cache SET last_used = ?, hits = hits + 1
+                WHERE pdf_id = ? AND question_key = ?
+            ''', (now, pdf_id, matched_key))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._count(hit)
+        self._remember(pdf_id, key, row[0], row[1])
+        return row[0]
+
+    def put(self, pdf_id, question, answer, scope=0):
+        """Store an answer in both tiers"""
+        key = normalize_question(question)
+        if not key or not answer:
+            return
+        key = scoped_key(key, scope)
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO answer_cache (pdf_id, question_key, question, answer, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (pdf_id, key, question, answer, now, now))
+            with self.lock:
+                self.counts['stores'] += 1
+                self.puts_since_prune += 1
+                prune = self.puts_since_prune >= PRUNE_EVERY
+                if prune:
+                    self.puts_since_prune = 0
+            if prune:
+                self._prune(conn, now)
+            conn.commit()
+        finally:
+            conn.close()
+        self._remember(pdf_id, key, answer, now)
+
+    def _prune(self, conn, now):
+        """Expire old rows and keep the table within max_rows (least recently used go first)"""
+        conn.execute('DELETE FROM answer_cache WHERE created_at <= ?', (now - self.ttl,))
+        conn.execute('''
+            DELETE FROM answer_cache WHERE rowid IN (
+                SELECT rowid FROM answer_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_rows,))
+
+    def forget(self, pdf_id):
+        """Drop a module's entries from the memory tier"""
+        with self.lock:
+            for cache_key in [k for k in self.memory if k[0] == pdf_id]:
+                del self.memory[cache_key]
+            self.counts['invalidations'] += 1
+
+    def stats(self):
+        """Hit/miss counters plus current entry counts"""
+        conn = self._connect()
+        try:
+            disk_entries = conn.execute('SELECT COUNT(*) FROM answer_cache').fetchone()[0]
+        finally:
+            conn.close()
+        with self.lock:
+            stats = dict(self.counts)
+            stats['memory_entries'] = len(self.memory)
+        hits = stats['memory_hits'] + stats['disk_hits'] + stats['similar_hits']
+        lookups = hits + stats['misses']
+        stats.update({
+            'hits': hits,
+            'lookups': lookups,
+            'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+            'disk_entries': disk_entries,
+            'ttl_seconds': self.ttl,
+            'similarity_threshold': self.similarity
+        })
+        return stats
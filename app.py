@@ -2,28 +2,65 @@
 Flask backend for Educational Content Assistant
 Handles PDF uploads, storage, retrieval, and LLM-powered Q&A
 """
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, g, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 import os
+import base64
+import multiprocessing
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
-import sqlite3
 import json
+import time
 from datetime import datetime
 import traceback
-from pdf_processor import extract_text_from_pdf
-from llm_handler import answer_question
-
-app = Flask(__name__, static_folder='static', static_url_path='')
-CORS(app)
+from ingest_jobs import IngestQueue
+from answer_cache import AnswerCache, invalidate_module, normalize_question, shingles
+from quiz_bank import QuizBank, delete_module as delete_quiz_bank
+import blob_store
+import compression
+import conversation_memory
+import conversations
+import db
+import fulltext
+import llm_usage
+import local_mcq
+import metrics
+import pages
+from llm_handler import answer_question, stream_answer, is_llm_answer
+import mcq_engine
+import retrieval
+import token_budget
 
 # Configuration
-UPLOAD_FOLDER = 'uploads'
-DB_NAME = 'assistant.db'
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')
+DB_NAME = db.DB_NAME
 ALLOWED_EXTENSIONS = {'pdf'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+MODULES_PAGE_SIZE = 50
+MODULES_MAX_PAGE_SIZE = 200
+MAX_PAGES_PER_REQUEST = 50
+CONVERSATIONS_PAGE_SIZE = 50
+CONVERSATIONS_MAX_PAGE_SIZE = 200
+
+
+class UploadRequest(Request):
+    """
+    Request whose multipart file parts are written straight into the blob store,
+    hashed and size-checked as they arrive, instead of werkzeug's temp file
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return blob_store.BlobWriter(BLOB_FOLDER, max_bytes=MAX_FILE_SIZE)
+
+
+app = Flask(__name__, static_folder='static', static_url_path='')
+app.request_class = UploadRequest
+CORS(app)
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -33,32 +70,79 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
 # Initialize database
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS pdfs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT NOT NULL,
-            filepath TEXT NOT NULL,
-            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            content_text TEXT,
-            module_name TEXT
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            pdf_id INTEGER NOT NULL,
-            question TEXT NOT NULL,
-            answer TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(pdf_id) REFERENCES pdfs(id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Create or upgrade the schema (see db.py for the migrations)"""
+    db.migrate(DB_NAME)
 
 init_db()
+token_budget.report_counting()
+
+# Repeated questions about a module are answered from here instead of the LLM
+answer_cache = AnswerCache(DB_NAME)
+
+# Precomputed quiz questions, filled in the background after ingest
+quiz_bank = QuizBank(DB_NAME)
+
+# Folds older turns of each chat session into its summary after answers are saved
+memory_updater = conversation_memory.SummaryUpdater(DB_NAME)
+
+def archive_conversations(older_than_days=None):
+    """Move old conversations to the archive table; returns how many moved"""
+    conn = db.connect()
+    try:
+        return conversations.archive(conn, older_than_days or conversations.CONVERSATION_ARCHIVE_DAYS)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def archive_on_startup():
+    try:
+        moved = archive_conversations()
+        if moved:
+            print(f"Archived {moved} conversations older than {conversations.CONVERSATION_ARCHIVE_DAYS} days")
+    except Exception as e:
+        print(f"Archiving conversations failed: {e}")
+
+# Background extraction/indexing for uploads; pick up jobs interrupted by a restart
+ingest_queue = IngestQueue(DB_NAME, on_ingested=quiz_bank.schedule_fill)
+if multiprocessing.parent_process() is None:
+    # Skip in PDF extraction workers, which re-import this module on spawn platforms
+    ingest_queue.resume()
+    # Move old conversation history to the archive table without holding up startup
+    if conversations.CONVERSATION_ARCHIVE_DAYS > 0:
+        threading.Thread(target=archive_on_startup, daemon=True).start()
+
+# --- Request tracing ---
+# Every request is timed by route; stages timed inside it (retrieval, the LLM
+# call, SQLite statements, ...) are returned in a Server-Timing header.
+# Streamed responses are timed until their headers are sent.
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+    g.profiler = metrics.start_profile() if metrics.wants_profile(request.headers) else None
+
+@app.after_request
+def finish_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe_request(request.method, route, response.status_code,
+                            time.perf_counter() - g.get('request_started', time.perf_counter()))
+    stages = metrics.finish_request()
+    if stages:
+        response.headers['Server-Timing'] = metrics.server_timing(stages)
+    if g.get('profiler') is not None:
+        response.headers['X-Profile-File'] = metrics.stop_profile(g.profiler, f"{request.method} {request.path}")
+        g.profiler = None
+    return response
+
+@app.teardown_request
+def stop_request_profiler(error=None):
+    # after_request doesn't run when a view raises
+    if g.get('profiler') is not None:
+        g.profiler.disable()
+        g.profiler = None
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -72,10 +156,70 @@ def index():
     """Serve the main index page"""
     return send_from_directory('static', 'index.html')
 
+def _too_large():
+    return jsonify({'error': f'File too large (max {MAX_FILE_SIZE // (1024 * 1024)}MB)'}), 413
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return _too_large()
+
+def _queue_upload(content_hash, filepath, filename, module_name):
+    """
+    Reuse an ingested or in-flight copy of the same content, else start an ingest job.
+    A duplicate keeps the name it was first uploaded under; the response says so.
+    """
+    conn = db.connect()
+    try:
+        existing = blob_store.find_module_by_hash(conn, content_hash)
+    finally:
+        conn.close()
+    if existing:
+        # Already ingested: reuse its extraction and indexes
+        return jsonify({
+            'success': True,
+            'pdf_id': existing[0],
+            'filename': filename,
+            'module_name': existing[1],
+            'requested_module_name': module_name,
+            'deduplicated': True,
+            'message': f"This PDF was already uploaded as '{existing[1]}'"
+        }), 200
+    
+    # Extract and index in the background; clients poll /api/jobs/<job_id>.
+    # submit() hands back the active job instead if the same content is already queued
+    job_id, created = ingest_queue.submit(filename, filepath, module_name, content_hash)
+    if not created:
+        active_name = (ingest_queue.get(job_id) or {}).get('module_name', module_name)
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/api/jobs/{job_id}',
+            'filename': filename,
+            'module_name': active_name,
+            'requested_module_name': module_name,
+            'deduplicated': True,
+            'message': f"This PDF is already being processed as '{active_name}'"
+        }), 202
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/api/jobs/{job_id}',
+        'filename': filename,
+        'module_name': module_name,
+        'message': 'PDF uploaded, processing started'
+    }), 202
+
 @app.route('/api/upload', methods=['POST'])
 def upload_pdf():
     """Upload a PDF module"""
     try:
+        # Refuse before reading the body when the client says it is too big
+        if request.content_length and request.content_length > MAX_FILE_SIZE:
+            return _too_large()
+        
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
         
@@ -89,56 +233,125 @@ def upload_pdf():
             return jsonify({'error': 'Only PDF files allowed'}), 400
         
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Extract text from PDF
-        content_text = extract_text_from_pdf(filepath)
-        
-        # Store in database
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO pdfs (filename, filepath, content_text, module_name)
-            VALUES (?, ?, ?, ?)
-        ''', (filename, filepath, content_text, module_name))
-        pdf_id = c.lastrowid
-        conn.commit()
-        conn.close()
         
-        return jsonify({
-            'success': True,
-            'pdf_id': pdf_id,
-            'filename': filename,
-            'module_name': module_name,
-            'message': 'PDF uploaded successfully'
-        }), 201
+        # Store under the content hash so identical files are kept once and names can't collide.
+        # UploadRequest already wrote and hashed the part, so this is just a rename
+        if isinstance(file.stream, blob_store.BlobWriter):
+            if not file.stream.looks_like_pdf():
+                return jsonify({'error': 'File is not a PDF'}), 400
+            content_hash, filepath, _ = file.stream.commit()
+        else:
+            content_hash, filepath, _ = blob_store.save_stream(file.stream, BLOB_FOLDER)
+        
+        return _queue_upload(content_hash, filepath, filename, module_name)
+    
+    except (RequestEntityTooLarge, blob_store.BlobTooLarge):
+        return _too_large()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/upload/stream', methods=['POST', 'PUT'])
+def upload_pdf_stream():
+    """
+    Upload a PDF as the raw request body (no multipart encoding), e.g.
+    curl -T notes.pdf '/api/upload/stream?filename=notes.pdf&module_name=Notes'
+    """
+    try:
+        if request.content_length and request.content_length > MAX_FILE_SIZE:
+            return _too_large()
+        
+        filename = request.args.get('filename') or request.headers.get('X-Filename', '')
+        module_name = request.args.get('module_name') or request.headers.get('X-Module-Name', 'Untitled Module')
+        if not allowed_file(filename):
+            return jsonify({'error': 'Only PDF files allowed'}), 400
+        filename = secure_filename(filename)
+        
+        with blob_store.BlobWriter(BLOB_FOLDER, max_bytes=MAX_FILE_SIZE) as writer:
+            if not writer.copy_from(request.stream):
+                return jsonify({'error': 'No file provided'}), 400
+            if not writer.looks_like_pdf():
+                return jsonify({'error': 'File is not a PDF'}), 400
+            content_hash, filepath, _ = writer.commit()
+        
+        return _queue_upload(content_hash, filepath, filename, module_name)
     
+    except (RequestEntityTooLarge, blob_store.BlobTooLarge):
+        return _too_large()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status and page progress of an ingestion job"""
+    try:
+        job = ingest_queue.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def encode_cursor(upload_date, pdf_id):
+    """Opaque keyset cursor for the module listing"""
+    return base64.urlsafe_b64encode(json.dumps([upload_date, pdf_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    upload_date, pdf_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return upload_date, int(pdf_id)
+
 @app.route('/api/modules', methods=['GET'])
 def get_modules():
-    """Get all uploaded modules"""
+    """
+    List modules newest first, without their content (see /api/modules/<id>).
+    Paginated with ?limit= and the `next_cursor` of the previous page as ?cursor=.
+    """
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute('SELECT id, filename, module_name, upload_date, content_text FROM pdfs ORDER BY upload_date DESC')
-        modules = c.fetchall()
-        conn.close()
+        limit = min(max(request.args.get('limit', MODULES_PAGE_SIZE, type=int), 1), MODULES_MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
         
-        return jsonify({
+        conn = db.connect()
+        try:
+            c = conn.cursor()
+            query = '''
+                SELECT id, filename, module_name, upload_date, page_count, text_length, content_hash
+                FROM pdfs
+            '''
+            params = ()
+            if after:
+                query += ' WHERE (upload_date, id) < (?, ?)'
+                params = after
+            c.execute(query + ' ORDER BY upload_date DESC, id DESC LIMIT ?', (*params, limit + 1))
+            modules = c.fetchall()
+        finally:
+            conn.close()
+        
+        has_more = len(modules) > limit
+        modules = modules[:limit]
+        
+        resp = jsonify({
             'modules': [
                 {
                     'id': m[0],
                     'filename': m[1],
                     'module_name': m[2],
                     'upload_date': m[3],
-                    'content_text': m[4]
+                    'page_count': m[4],
+                    'text_length': m[5],
+                    'content_hash': m[6]
                 }
                 for m in modules
-            ]
-        }), 200
+            ],
+            'next_cursor': encode_cursor(modules[-1][3], modules[-1][0]) if has_more else None
+        })
+        # Clients revalidate with If-None-Match and get a 304 while the listing is unchanged
+        resp.headers['Cache-Control'] = 'no-cache'
+        resp.add_etag()
+        return resp.make_conditional(request)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -147,25 +360,134 @@ def get_modules():
 def get_module(pdf_id):
     """Get specific module content"""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute('SELECT id, filename, module_name, content_text FROM pdfs WHERE id = ?', (pdf_id,))
-        module = c.fetchone()
-        conn.close()
+        conn = db.connect()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT id, filename, module_name, page_count FROM pdfs WHERE id = ?', (pdf_id,))
+            module = c.fetchone()
+            content = pages.load_text(conn, pdf_id) if module else None
+        finally:
+            conn.close()
         
         if not module:
             return jsonify({'error': 'Module not found'}), 404
         
-        return jsonify({
+        resp = jsonify({
             'id': module[0],
             'filename': module[1],
             'module_name': module[2],
-            'content': module[3]
+            'page_count': module[3],
+            'content': content
+        })
+        resp.headers['Cache-Control'] = 'no-cache'
+        resp.add_etag()
+        return resp.make_conditional(request)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/modules/<int:pdf_id>/pages', methods=['GET'])
+def get_module_pages(pdf_id):
+    """Get a range of a module's pages (?start=1&end=10, inclusive)"""
+    try:
+        start = max(request.args.get('start', 1, type=int), 1)
+        end = request.args.get('end', start + MAX_PAGES_PER_REQUEST - 1, type=int)
+        if end < start:
+            return jsonify({'error': 'end must not be before start'}), 400
+        end = min(end, start + MAX_PAGES_PER_REQUEST - 1)
+        
+        conn = db.connect()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT page_count FROM pdfs WHERE id = ?', (pdf_id,))
+            module = c.fetchone()
+            page_list = pages.load_pages(conn, pdf_id, start, end) if module else []
+        finally:
+            conn.close()
+        
+        if not module:
+            return jsonify({'error': 'Module not found'}), 404
+        
+        resp = jsonify({
+            'pdf_id': pdf_id,
+            'page_count': module[0],
+            'start': start,
+            'end': end,
+            'pages': page_list
+        })
+        resp.headers['Cache-Control'] = 'no-cache'
+        resp.add_etag()
+        return resp.make_conditional(request)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search', methods=['GET'])
+def search_library():
+    """Full-text search across every module (?q=...&limit=20, optional &pdf_id=)"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Missing q'}), 400
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        pdf_id = request.args.get('pdf_id', type=int)
+        
+        started = time.perf_counter()
+        conn = db.connect()
+        try:
+            if not fulltext.has_table(conn):
+                return jsonify({'error': 'Full-text search needs SQLite with FTS5'}), 501
+            results = fulltext.search(conn, query, limit, pdf_id)
+        finally:
+            conn.close()
+        
+        return jsonify({
+            'query': query,
+            'results': results,
+            'took_ms': round((time.perf_counter() - started) * 1000, 2)
         }), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def save_answer(conn, pdf_id, question, answer, content_text, cached=False, session_id=None, cache_scope=0):
+    """
+    Add an answer to the module's conversation history, caching it in `cache_scope` if it is
+    a fresh LLM answer. Answers to follow-ups depend on their session (scope None), so they aren't cached.
+    """
+    if cached:
+        llm_usage.recorder.record_cache_hit()
+    elif content_text and is_llm_answer(answer) and cache_scope is not None:
+        answer_cache.put(pdf_id, question, answer, cache_scope)
+    conversations.add(conn, pdf_id, question, answer, session_id)
+    conn.commit()
+    if session_id:
+        memory_updater.schedule(session_id, pdf_id)
+
+def prepare_answer(conn, pdf_id, question, session_id):
+    """
+    Blocking work before answering a question about a module:
+    returns (cached answer or None, context, search index, session memory, cache scope)
+    """
+    # Earlier turns of this session, so follow-ups like "explain that more" make sense
+    memory = conversation_memory.load(conn, session_id, pdf_id, question=question)
+    cache_scope = memory.cache_scope(question)
+    cached = answer_cache.get(pdf_id, question, cache_scope) if cache_scope is not None else None
+    if cached is not None:
+        return cached, "", None, memory, cache_scope
+    # Modules stored before indexing existed get indexed on first ask
+    if not retrieval.ensure_indexed(conn, pdf_id):
+        return None, "", None, memory, cache_scope
+    content_text = retrieval.select_context(conn, pdf_id, memory.search_query(question))
+    return None, content_text, retrieval.get_search_index(conn, pdf_id), memory, cache_scope
+
+def request_session_id(data):
+    """The chat session the client sent (None without one); raises ValueError if it is malformed"""
+    session_id = data.get('session_id')
+    if session_id is not None and not conversation_memory.valid_session_id(session_id):
+        raise ValueError('Invalid session_id')
+    return session_id
+
 @app.route('/api/ask', methods=['POST'])
 def ask_doubt():
     """Submit a doubt/question about a module"""
@@ -176,96 +498,230 @@ def ask_doubt():
         
         if not question:
             return jsonify({'error': 'Missing question'}), 400
+        try:
+            session_id = request_session_id(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         content_text = ""
+        cached, cache_scope = False, None
         
-        # Get PDF content from database if pdf_id is provided
+        # Get PDF content and the session's earlier turns if pdf_id is provided
         if pdf_id:
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute('SELECT content_text FROM pdfs WHERE id = ?', (pdf_id,))
-            result = c.fetchone()
-            
-            if result:
-                content_text = result[0]
-            conn.close()
-        
-        # Get answer from LLM
-        answer = answer_question(question, content_text)
+            conn = db.connect()
+            try:
+                answer, content_text, index, memory, cache_scope = prepare_answer(conn, pdf_id, question, session_id)
+                cached = answer is not None
+                # Get answer from LLM
+                if not cached:
+                    answer = answer_question(question, content_text, index=index, memory=memory)
+            finally:
+                conn.close()
+        else:
+            answer = answer_question(question, content_text)
         
-        # Store conversation
         # Store conversation if pdf_id is present
         if pdf_id:
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO conversations (pdf_id, question, answer)
-                VALUES (?, ?, ?)
-            ''', (pdf_id, question, answer))
-            conn.commit()
-            conn.close()
+            conn = db.connect()
+            try:
+                save_answer(conn, pdf_id, question, answer, content_text, cached, session_id, cache_scope)
+            finally:
+                conn.close()
         
         return jsonify({
             'success': True,
             'question': question,
-            'answer': answer
+            'answer': answer,
+            'cached': cached,
+            'session_id': session_id
         }), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/ask/stream', methods=['POST'])
+def ask_doubt_stream():
+    """Submit a doubt and stream the answer back as Server-Sent Events"""
+    data = request.get_json() or {}
+    pdf_id = data.get('pdf_id')
+    question = data.get('question')
+    
+    if not question:
+        return jsonify({'error': 'Missing question'}), 400
+    try:
+        session_id = request_session_id(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    started = time.perf_counter()
+    
+    def generate():
+        conn = None
+        try:
+            cached_answer, content_text, index, memory, cache_scope = None, "", None, None, None
+            if pdf_id:
+                conn = db.connect()
+                cached_answer, content_text, index, memory, cache_scope = prepare_answer(conn, pdf_id, question,
+                                                                                         session_id)
+            
+            parts = []
+            ttft_ms = None
+            deltas = ([cached_answer] if cached_answer is not None
+                      else stream_answer(question, content_text, index=index, memory=memory))
+            for delta in deltas:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                    metrics.observe_first_token(ttft_ms / 1000, cached_answer is not None)
+                parts.append(delta)
+                yield sse_event('token', {'delta': delta})
+            answer = ''.join(parts)
+            
+            # Store the finished answer once streaming is complete
+            if pdf_id:
+                save_answer(conn, pdf_id, question, answer, content_text, cached_answer is not None,
+                            session_id, cache_scope)
+            
+            total_ms = (time.perf_counter() - started) * 1000
+            yield sse_event('done', {
+                'question': question,
+                'answer': answer,
+                'ttft_ms': round(ttft_ms or total_ms, 1),
+                'total_ms': round(total_ms, 1),
+                'cached': cached_answer is not None,
+                'session_id': session_id
+            })
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            if conn:
+                conn.close()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Answer cache hit/miss counters"""
+    try:
+        return jsonify(answer_cache.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/metrics/compression', methods=['GET'])
+def compression_metrics():
+    """Tokens saved and latency added by prompt compression"""
+    try:
+        return jsonify({'compressor': compression.get_compressor().name, 'stats': compression.stats.snapshot()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, stage and SQLite latency histograms in the Prometheus text format"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/metrics/llm', methods=['GET'])
+def llm_metrics():
+    """LLM calls, tokens, estimated cost, latency and cache hits per kind and model (?hours= limits the window)"""
+    try:
+        hours = request.args.get('hours', type=float)
+        since = time.time() - hours * 3600 if hours else None
+        # Include calls still waiting in the write queue
+        llm_usage.recorder.flush()
+        conn = db.connect()
+        try:
+            result = llm_usage.summary(conn, since)
+        finally:
+            conn.close()
+        result['since'] = since
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/conversations/<int:pdf_id>', methods=['GET'])
 def get_conversations(pdf_id):
-    """Get conversation history for a module"""
+    """
+    Get conversation history for a module, newest first. Paginated with ?limit=
+    and the `next_cursor` of the previous page as ?cursor=. ?since=<id> returns
+    only conversations added after that id, oldest first (`has_more` means
+    ask again with the last id).
+    """
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute('''
-            SELECT question, answer, timestamp
-            FROM conversations
-            WHERE pdf_id = ?
-            ORDER BY timestamp DESC
-        ''', (pdf_id,))
-        conversations = c.fetchall()
-        conn.close()
+        limit = min(max(request.args.get('limit', CONVERSATIONS_PAGE_SIZE, type=int), 1),
+                    CONVERSATIONS_MAX_PAGE_SIZE)
+        try:
+            before = int(request.args['cursor']) if request.args.get('cursor') else None
+            since = int(request.args['since']) if request.args.get('since') else None
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        conn = db.connect()
+        try:
+            rows, has_more = conversations.history(conn, pdf_id, limit, before=before, since=since)
+        finally:
+            conn.close()
         
         return jsonify({
-            'conversations': [
-                {
-                    'question': conv[0],
-                    'answer': conv[1],
-                    'timestamp': conv[2]
-                }
-                for conv in conversations
-            ]
+            'conversations': rows,
+            'has_more': has_more,
+            'next_cursor': str(rows[-1]['id']) if has_more and since is None else None
         }), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/conversations/archive', methods=['POST'])
+def archive_old_conversations():
+    """Archive conversations older than `older_than_days` (default CONVERSATION_ARCHIVE_DAYS)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        older_than_days = int(data.get('older_than_days') or conversations.CONVERSATION_ARCHIVE_DAYS)
+        if older_than_days < 1:
+            return jsonify({'error': 'older_than_days must be at least 1'}), 400
+        moved = archive_conversations(older_than_days)
+        return jsonify({'success': True, 'archived': moved, 'older_than_days': older_than_days}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/modules/<int:pdf_id>', methods=['DELETE'])
 def delete_module(pdf_id):
     """Delete a module"""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute('SELECT filepath FROM pdfs WHERE id = ?', (pdf_id,))
-        result = c.fetchone()
-        
-        if not result:
-            return jsonify({'error': 'Module not found'}), 404
-        
-        filepath = result[0]
-        
-        # Delete from database
-        c.execute('DELETE FROM pdfs WHERE id = ?', (pdf_id,))
-        c.execute('DELETE FROM conversations WHERE pdf_id = ?', (pdf_id,))
-        conn.commit()
-        conn.close()
-        
-        # Delete file (only if it's an actual file, not manual content)
-        if filepath and os.path.exists(filepath):
-            os.remove(filepath)
+        conn = db.connect()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT filepath FROM pdfs WHERE id = ?', (pdf_id,))
+            result = c.fetchone()
+            
+            if not result:
+                return jsonify({'error': 'Module not found'}), 404
+            
+            filepath = result[0]
+            
+            # Delete from database; the indexes go first, while the module's text is still stored
+            retrieval.delete_module_index(conn, pdf_id)
+            local_mcq.delete_sentence_index(conn, pdf_id)
+            invalidate_module(conn, pdf_id)
+            delete_quiz_bank(conn, pdf_id)
+            c.execute('DELETE FROM pdfs WHERE id = ?', (pdf_id,))
+            conversations.delete_module(conn, pdf_id)
+            conversation_memory.delete_module(conn, pdf_id)
+            pages.delete_pages(conn, pdf_id)
+            conn.commit()
+            
+            # Delete file (only if it's an actual file, not manual content, and no other module uses it)
+            if filepath and os.path.exists(filepath) and not blob_store.is_referenced(conn, filepath):
+                os.remove(filepath)
+        finally:
+            conn.close()
         
         return jsonify({'success': True, 'message': 'Module deleted'}), 200
     
@@ -284,15 +740,20 @@ def save_concept():
             return jsonify({'error': 'Content cannot be empty'}), 400
         
         # Store in database (no file path for manual concepts)
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO pdfs (filename, filepath, content_text, module_name)
-            VALUES (?, ?, ?, ?)
-        ''', (f'{module_name}.txt', '', content, module_name))
-        module_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        conn = db.connect()
+        try:
+            c = conn.cursor()
+            c.execute('''
+                INSERT INTO pdfs (filename, filepath, content_text, module_name, text_length)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (f'{module_name}.txt', '', content, module_name, len(content)))
+            module_id = c.lastrowid
+            retrieval.index_module(conn, module_id, content)
+            local_mcq.build_sentence_index(conn, module_id, content)
+            conn.commit()
+        finally:
+            conn.close()
+        quiz_bank.schedule_fill(module_id)
         
         return jsonify({
             'success': True,
@@ -310,32 +771,42 @@ def generate_mcq():
     try:
         data = request.get_json()
         pdf_id = data.get('pdf_id')
-        count = data.get('count', 5)
+        count = max(1, min(int(data.get('count', 5)), mcq_engine.MCQ_MAX_COUNT))
+        difficulty = (data.get('difficulty') or '').lower() or None
         
         if not pdf_id:
             return jsonify({'error': 'Missing pdf_id'}), 400
+        if difficulty and difficulty not in mcq_engine.DIFFICULTIES:
+            return jsonify({'error': f"difficulty must be one of {', '.join(mcq_engine.DIFFICULTIES)}"}), 400
         
-        # Get module content
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute('SELECT content_text, module_name FROM pdfs WHERE id = ?', (pdf_id,))
-        result = c.fetchone()
-        conn.close()
-        
-        if not result or not result[0]:
-            return jsonify({'error': 'Module content not found'}), 404
-        
-        content_text = result[0]
-        module_name = result[1]
+        conn = db.connect()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT module_name FROM pdfs WHERE id = ?', (pdf_id,))
+            result = c.fetchone()
+            
+            # Served from the precomputed bank when it has questions at this difficulty;
+            # a short draw is topped up live while the bank refills in the background
+            questions = quiz_bank.draw(conn, pdf_id, count, difficulty) if result else []
+            from_bank = len(questions) == count
+            
+            if not from_bank:
+                if not result or not retrieval.ensure_indexed(conn, pdf_id):
+                    return jsonify({'error': 'Module content not found'}), 404
+                # One batch per section of the module, generated in parallel
+                seen = [shingles(normalize_question(q['question'])) for q in questions]
+                live = mcq_engine.generate_module_mcqs(conn, pdf_id, count - len(questions), difficulty=difficulty)
+                questions += mcq_engine.dedupe_mcqs(live, seen)
+        finally:
+            conn.close()
         
-        # Generate MCQs using LLM
-        from llm_handler import generate_mcqs
-        questions = generate_mcqs(content_text, count)
+        module_name = result[0]
         
         return jsonify({
             'success': True,
             'questions': questions,
-            'module_name': module_name
+            'module_name': module_name,
+            'from_bank': from_bank
         }), 200
     
     except Exception as e:
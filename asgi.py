@@ -0,0 +1,203 @@
+"""
+ASGI entry point - async serving mode for the backend
+/api/ask and /api/ask/stream run on an asyncio event loop with the async LLM
+client, so a question waiting on the provider holds no thread and thousands can
+be in flight at once. Every other route is the Flask app, mounted as WSGI.
+Database work still runs in a thread pool since sqlite3 is blocking.
+
+Needs starlette, uvicorn, httpx (and optionally a2wsgi):
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import time
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    WSGIMiddleware = None
+
+import db
+import metrics
+import retrieval
+from app import app as flask_app, prepare_answer, request_session_id, save_answer, sse_event
+from llm_handler import answer_question_async, local_answer, stream_answer_async
+
+# Threads for the mounted Flask routes (uploads, listings, ...)
+WSGI_WORKERS = 16
+
+
+def _prepare(pdf_id, question, session_id):
+    """
+    Blocking work before the LLM call: returns
+    (cached answer or None, context, session memory, cache_scope) (see app.prepare_answer)
+    """
+    if not pdf_id:
+        return None, "", None, None
+    conn = db.connect()
+    try:
+        cached, content_text, _, memory, cache_scope = prepare_answer(conn, pdf_id, question, session_id)
+        return cached, content_text, memory, cache_scope
+    finally:
+        conn.close()
+
+
+def _fallback(pdf_id, question, content_text, memory):
+    """Local answer builder for llm_handler; searches the module's stored index"""
+    query = memory.search_query(question) if memory else None
+
+    def local(reason):
+        if not pdf_id:
+            return local_answer(question, content_text, None, reason)
+        conn = db.connect()
+        try:
+            return local_answer(question, content_text, retrieval.get_search_index(conn, pdf_id), reason, query)
+        finally:
+            conn.close()
+    return local
+
+
+def _save(pdf_id, question, answer, content_text, cached, session_id, cache_scope):
+    conn = db.connect()
+    try:
+        save_answer(conn, pdf_id, question, answer, content_text, cached, session_id, cache_scope)
+    finally:
+        conn.close()
+
+
+async def _once(text):
+    yield text
+
+
+async def _json_body(request):
+    """The request's JSON object, or None if the body is malformed or not an object"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def ask_doubt(request):
+    """Submit a doubt/question about a module"""
+    try:
+        data = await _json_body(request)
+        if data is None:
+            return JSONResponse({'error': 'Request body must be a JSON object'}, status_code=400)
+        pdf_id = data.get('pdf_id')
+        question = data.get('question')
+
+        if not question:
+            return JSONResponse({'error': 'Missing question'}, status_code=400)
+        try:
+            session_id = request_session_id(data)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        answer, content_text, memory, cache_scope = await run_in_threadpool(_prepare, pdf_id, question, session_id)
+        cached = answer is not None
+        if not cached:
+            answer = await answer_question_async(question, content_text, memory=memory,
+                                                 local=_fallback(pdf_id, question, content_text, memory))
+
+        if pdf_id:
+            await run_in_threadpool(_save, pdf_id, question, answer, content_text, cached, session_id, cache_scope)
+
+        return JSONResponse({
+            'success': True,
+            'question': question,
+            'answer': answer,
+            'cached': cached,
+            'session_id': session_id
+        })
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def ask_doubt_stream(request):
+    """Submit a doubt and stream the answer back as Server-Sent Events"""
+    data = await _json_body(request)
+    if data is None:
+        return JSONResponse({'error': 'Request body must be a JSON object'}, status_code=400)
+    pdf_id = data.get('pdf_id')
+    question = data.get('question')
+
+    if not question:
+        return JSONResponse({'error': 'Missing question'}, status_code=400)
+    try:
+        session_id = request_session_id(data)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    started = time.perf_counter()
+
+    async def generate():
+        try:
+            cached_answer, content_text, memory, cache_scope = await run_in_threadpool(_prepare, pdf_id, question,
+                                                                                     session_id)
+            if cached_answer is not None:
+                deltas = _once(cached_answer)
+            else:
+                deltas = stream_answer_async(question, content_text, memory=memory,
+                                             local=_fallback(pdf_id, question, content_text, memory))
+
+            parts = []
+            ttft_ms = None
+            async for delta in deltas:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                    metrics.observe_first_token(ttft_ms / 1000, cached_answer is not None)
+                parts.append(delta)
+                yield sse_event('token', {'delta': delta})
+            answer = ''.join(parts)
+
+            # Store the finished answer once streaming is complete
+            if pdf_id:
+                await run_in_threadpool(_save, pdf_id, question, answer, content_text, cached_answer is not None,
+                                        session_id, cache_scope)
+
+            total_ms = (time.perf_counter() - started) * 1000
+            yield sse_event('done', {
+                'question': question,
+                'answer': answer,
+                'ttft_ms': round(ttft_ms or total_ms, 1),
+                'total_ms': round(total_ms, 1),
+                'cached': cached_answer is not None,
+                'session_id': session_id
+            })
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+if WSGIMiddleware is not None:
+    wsgi_app = WSGIMiddleware(flask_app, workers=WSGI_WORKERS)
+else:
+    # Starlette's own (deprecated) adapter; runs Flask in the default thread pool
+    from starlette.middleware.wsgi import WSGIMiddleware as StarletteWSGIMiddleware
+    wsgi_app = StarletteWSGIMiddleware(flask_app)
+
+# CORS and request timing only on the async routes; the mounted Flask app has its own
+route_middleware = [Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(metrics.ASGIMetricsMiddleware)]
+
+app = Starlette(routes=[
+    Route('/api/ask', ask_doubt, methods=['POST', 'OPTIONS'], middleware=route_middleware),
+    Route('/api/ask/stream', ask_doubt_stream, methods=['POST', 'OPTIONS'], middleware=route_middleware),
+    Mount('/', app=wsgi_app),
+])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
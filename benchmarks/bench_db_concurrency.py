@@ -0,0 +1,187 @@
+"""
+Benchmark: concurrent /api/ask and /api/upload traffic against one SQLite database
+
+Starts the app on a threaded local server with a fresh database, seeds a few
+modules, then hammers /api/ask from many threads while other threads upload
+PDFs. Reports latency percentiles, throughput and "database is locked" errors.
+Set DB_JOURNAL_MODE=DELETE to compare against the old rollback journal.
+
+Usage:
+    python benchmarks/bench_db_concurrency.py --ask-threads 16 --upload-threads 2 --duration 20
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests  # noqa: E402
+from synthetic_pdf import write_pdf  # noqa: E402
+
+QUESTIONS = [
+    "What is a digital signature?",
+    "How does public key encryption work?",
+    "Explain message integrity",
+    "What is a certificate authority?",
+    "Why does privacy law matter?",
+]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def start_server(tmp):
+    """Import the app against a fresh database in `tmp` and serve it on a free port"""
+    os.environ['ASSISTANT_DB'] = os.path.join(tmp, 'bench.db')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(tmp, 'uploads')
+    os.environ.pop('OPENAI_API_KEY', None)   # local answers: measure the database, not an LLM
+    os.chdir(tmp)
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api"
+
+
+def seed_modules(base_url, count):
+    session = requests.Session()
+    ids = []
+    for i in range(count):
+        response = session.post(f"{base_url}/save-concept", json={
+            'module_name': f'Seed {i}',
+            'content': '\n\n'.join(f"Paragraph {n}: digital signature hash encryption key public private "
+                                   f"network security certificate authority trust privacy law {i} {n}."
+                                   for n in range(200))
+        })
+        ids.append(response.json()['module_id'])
+    return ids
+
+
+def ask_worker(base_url, pdf_ids, stop, results, worker_no):
+    session = requests.Session()
+    n = worker_no
+    while not stop.is_set():
+        n += 1
+        # Vary the question so the answer cache doesn't hide the database work
+        payload = {'pdf_id': pdf_ids[n % len(pdf_ids)], 'question': f"{QUESTIONS[n % len(QUESTIONS)]} ({n})"}
+        start = time.perf_counter()
+        try:
+            response = session.post(f"{base_url}/ask", json=payload, timeout=60)
+            ok = response.status_code == 200
+            error = None if ok else response.text[:200]
+        except requests.RequestException as e:
+            ok, error = False, str(e)
+        results.append(('ask', time.perf_counter() - start, ok, error))
+
+
+def upload_worker(base_url, pdf_dir, pages, stop, results, worker_no):
+    session = requests.Session()
+    n = 0
+    while not stop.is_set():
+        n += 1
+        # A new seed per upload so content-hash dedup doesn't skip the work
+        path = write_pdf(os.path.join(pdf_dir, f'w{worker_no}_{n}.pdf'), pages, seed=worker_no * 100000 + n)
+        start = time.perf_counter()
+        try:
+            with open(path, 'rb') as f:
+                response = session.post(f"{base_url}/upload", files={'file': (os.path.basename(path), f)},
+                                        data={'module_name': f'Upload {worker_no}-{n}'}, timeout=60)
+            data = response.json()
+            ok = response.status_code in (200, 202)
+            error = None if ok else data.get('error')
+            # Wait for the ingest job so the writes it does overlap with the asks
+            while ok and data.get('job_id') and not stop.is_set():
+                job = session.get(f"{base_url}/jobs/{data['job_id']}", timeout=60).json()
+                if job.get('status') in ('done', 'failed'):
+                    ok = job['status'] == 'done'
+                    error = job.get('error')
+                    break
+                time.sleep(0.1)
+        except requests.RequestException as e:
+            ok, error = False, str(e)
+        results.append(('upload', time.perf_counter() - start, ok, error))
+
+
+def summarize(results, duration):
+    summary = {}
+    for kind in ('ask', 'upload'):
+        rows = [r for r in results if r[0] == kind]
+        latencies = [r[1] * 1000 for r in rows if r[2]]
+        errors = [r[3] or '' for r in rows if not r[2]]
+        summary[kind] = {
+            'requests': len(rows),
+            'errors': len(errors),
+            'locked_errors': sum('locked' in e for e in errors),
+            'per_second': round(len(rows) / duration, 1),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+        }
+    return summary
+
+
+def run(ask_threads, upload_threads, duration, modules, pages):
+    with tempfile.TemporaryDirectory() as tmp:
+        server, base_url = start_server(tmp)
+        pdf_ids = seed_modules(base_url, modules)
+        pdf_dir = os.path.join(tmp, 'pdfs')
+        os.makedirs(pdf_dir)
+
+        stop = threading.Event()
+        results = []
+        threads = [threading.Thread(target=ask_worker, args=(base_url, pdf_ids, stop, results, i))
+                   for i in range(ask_threads)]
+        threads += [threading.Thread(target=upload_worker, args=(base_url, pdf_dir, pages, stop, results, i))
+                    for i in range(upload_threads)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        server.shutdown()
+
+        import app as app_module
+        app_module.ingest_queue.executor.shutdown(wait=True)
+        os.chdir(ROOT)
+        return summarize(results, duration)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent ask + upload database benchmark')
+    parser.add_argument('--ask-threads', type=int, default=16)
+    parser.add_argument('--upload-threads', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load')
+    parser.add_argument('--modules', type=int, default=5, help='Modules seeded before the run')
+    parser.add_argument('--pages', type=int, default=20, help='Pages per uploaded PDF')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    summary = run(args.ask_threads, args.upload_threads, args.duration, args.modules, args.pages)
+    journal_mode = os.getenv('DB_JOURNAL_MODE', 'WAL')
+
+    print(f"journal_mode={journal_mode}")
+    print(f"{'endpoint':>8} {'requests':>9} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'locked':>7}")
+    for kind, s in summary.items():
+        print(f"{kind:>8} {s['requests']:>9} {s['per_second']:>7} {s['p50_ms']:>8} {s['p95_ms']:>8} "
+              f"{s['p99_ms']:>8} {s['errors']:>7} {s['locked_errors']:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'db_concurrency', 'journal_mode': journal_mode,
+                       'ask_threads': args.ask_threads, 'upload_threads': args.upload_threads,
+                       'duration_s': args.duration, 'results': summary}, f, indent=2)
@@ -0,0 +1,70 @@
+"""
+Benchmark: serial vs process-pool PDF text extraction throughput
+
+Usage:
+    python benchmarks/bench_extraction.py --pages 100 300 600 --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_processor import extract_text_from_pdf  # noqa: E402
+from synthetic_pdf import write_pdf  # noqa: E402
+
+
+def time_extraction(path, parallel, workers, repeat):
+    """Best-of-`repeat` wall time and the extracted text length"""
+    best = None
+    length = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = extract_text_from_pdf(path, parallel=parallel, workers=workers)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        length = len(text)
+    return best, length
+
+
+def run(page_counts, workers, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            path = write_pdf(os.path.join(tmp, f'synthetic_{pages}.pdf'), pages)
+            serial, serial_len = time_extraction(path, False, 1, repeat)
+            parallel, parallel_len = time_extraction(path, True, workers, repeat)
+            if serial_len != parallel_len:
+                print(f"WARNING: output length differs for {pages} pages ({serial_len} vs {parallel_len})")
+            results.append({
+                'pages': pages,
+                'workers': workers,
+                'serial_s': round(serial, 4),
+                'parallel_s': round(parallel, 4),
+                'serial_pages_per_s': round(pages / serial, 1),
+                'parallel_pages_per_s': round(pages / parallel, 1),
+                'speedup': round(serial / parallel, 2),
+            })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PDF extraction throughput benchmark')
+    parser.add_argument('--pages', type=int, nargs='+', default=[100, 300, 600])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    results = run(args.pages, args.workers, args.repeat)
+
+    print(f"{'pages':>6} {'serial p/s':>11} {'parallel p/s':>13} {'speedup':>8}")
+    for r in results:
+        print(f"{r['pages']:>6} {r['serial_pages_per_s']:>11} {r['parallel_pages_per_s']:>13} {r['speedup']:>7}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'extraction', 'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
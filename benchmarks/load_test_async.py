@@ -0,0 +1,166 @@
+"""
+Load test: slow LLM calls under the threaded Flask server vs the ASGI app
+
+Starts the stub LLM with a fixed response delay, then sends the same burst of
+concurrent /api/ask requests to the Flask app (on a server with a fixed pool of
+worker threads, like gunicorn --threads) and to asgi:app under uvicorn.
+Every request waits on the stub, so throughput shows how many questions each
+mode can keep in flight at once.
+
+Usage:
+    python benchmarks/load_test_async.py --llm-delay 1.0 --concurrency 200 --requests 600
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+import stub_llm_server  # noqa: E402
+from bench_db_concurrency import QUESTIONS, percentile, seed_modules  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_flask(flask_app, threads):
+    """Serve the WSGI app with a fixed-size worker pool instead of a thread per request"""
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledWSGIServer(BaseWSGIServer):
+        executor = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.executor.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledWSGIServer('127.0.0.1', 0, flask_app)
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api"
+
+
+def start_asgi(asgi_app):
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host='127.0.0.1', port=port, log_level='error',
+                                           backlog=1024))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}/api"
+
+
+async def burst(base_url, pdf_ids, total, concurrency, tag):
+    """Send `total` asks with at most `concurrency` in flight; returns (latency s, ok, error) rows"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=300) as client:
+        async def one(n):
+            # Distinct questions so the answer cache doesn't short-circuit the LLM
+            payload = {'pdf_id': pdf_ids[n % len(pdf_ids)],
+                       'question': f"{QUESTIONS[n % len(QUESTIONS)]} ({tag} {n})"}
+            async with sem:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(f"{base_url}/ask", json=payload)
+                    ok = response.status_code == 200 and not response.json()['answer'].startswith('Using Local')
+                    error = None if ok else response.text[:200]
+                except httpx.HTTPError as e:
+                    ok, error = False, repr(e)
+                results.append((time.perf_counter() - start, ok, error))
+
+        await asyncio.gather(*(one(n) for n in range(total)))
+    return results
+
+
+def summarize(results, elapsed):
+    latencies = [r[0] * 1000 for r in results if r[1]]
+    return {
+        'requests': len(results),
+        'errors': sum(not r[1] for r in results),
+        'wall_s': round(elapsed, 2),
+        'per_second': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+    }
+
+
+def run(llm_delay, concurrency, requests, flask_threads, modules):
+    stub, stub_url = stub_llm_server.start_in_background(delay=llm_delay)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['ASSISTANT_DB'] = os.path.join(tmp, 'load.db')
+        os.environ['UPLOAD_FOLDER'] = os.path.join(tmp, 'uploads')
+        os.environ['OPENAI_API_KEY'] = 'stub'
+        os.environ['OPENAI_BASE_URL'] = stub_url
+        os.chdir(tmp)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        import app as app_module
+        import asgi
+
+        flask_server, flask_url = start_flask(app_module.app, flask_threads)
+        asgi_server, asgi_url = start_asgi(asgi.app)
+        pdf_ids = seed_modules(flask_url, modules)
+
+        summary = {}
+        for mode, base_url in (('flask', flask_url), ('asgi', asgi_url)):
+            start = time.perf_counter()
+            results = asyncio.run(burst(base_url, pdf_ids, requests, concurrency, mode))
+            summary[mode] = summarize(results, time.perf_counter() - start)
+
+        flask_server.shutdown()
+        asgi_server.should_exit = True
+        stub.shutdown()
+        time.sleep(0.2)
+        os.chdir(ROOT)
+        return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Flask vs ASGI under slow LLM calls')
+    parser.add_argument('--llm-delay', type=float, default=1.0, help='Seconds the stub LLM takes per answer')
+    parser.add_argument('--concurrency', type=int, default=200, help='Requests in flight at once')
+    parser.add_argument('--requests', type=int, default=600, help='Requests per mode')
+    parser.add_argument('--flask-threads', type=int, default=16, help='Worker threads for the Flask server')
+    parser.add_argument('--modules', type=int, default=3, help='Modules seeded before the run')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    summary = run(args.llm_delay, args.concurrency, args.requests, args.flask_threads, args.modules)
+
+    print(f"llm_delay={args.llm_delay}s concurrency={args.concurrency} flask_threads={args.flask_threads}")
+    print(f"{'mode':>6} {'requests':>9} {'wall s':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for mode, s in summary.items():
+        print(f"{mode:>6} {s['requests']:>9} {s['wall_s']:>7} {s['per_second']:>7} {s['p50_ms']:>8} "
+              f"{s['p95_ms']:>8} {s['p99_ms']:>8} {s['errors']:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'load_test_async', 'llm_delay_s': args.llm_delay,
+                       'concurrency': args.concurrency, 'flask_threads': args.flask_threads,
+                       'results': summary}, f, indent=2)
@@ -0,0 +1,390 @@
+"""
+Benchmark suite: extraction, ingest, fallback search and /api/ask under load
+
+Runs every section in its own process, against a fresh database and the local
+stub LLM, on synthetic PDFs generated from fixed seeds, so runs are repeatable:
+  - extraction: pages/s of extract_pages for each PDF size
+  - ingest: upload-to-indexed latency through /api/upload and the ingest queue,
+    then local fallback search latency (BM25 lookup) on each ingested module
+  - ask: /api/ask p50/p95/p99 with concurrent clients, with a stub LLM delay
+    (fresh questions), and again for repeated questions (answer cache)
+Each section also reports its memory high-water mark (peak RSS).
+Results are written as JSON; --compare reports regressions against an earlier run.
+
+Usage:
+    python benchmarks/run_benchmarks.py                       # full run -> benchmarks/results/<commit>.json
+    python benchmarks/run_benchmarks.py --quick --json new.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/abc1234.json
+    python benchmarks/run_benchmarks.py --compare old.json --against new.json   # compare without running
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_db_concurrency import QUESTIONS, percentile  # noqa: E402
+from synthetic_pdf import write_pdf  # noqa: E402
+
+SECTIONS = ('extraction', 'ingest', 'ask')
+FULL = {'pages': [10, 100, 1000], 'ask_pages': 100, 'ask_requests': 400, 'concurrency': 16,
+        'search_queries': 200, 'repeat': 3}
+QUICK = {'pages': [10, 100], 'ask_pages': 20, 'ask_requests': 100, 'concurrency': 8,
+         'search_queries': 50, 'repeat': 1}
+# Relative change that counts as a regression in --compare
+DEFAULT_THRESHOLD = 0.10
+# Latency changes smaller than this are timer noise, whatever their relative size
+MIN_CHANGE_MS = 1.0
+
+
+def latency_summary(seconds):
+    ms = [s * 1000 for s in seconds]
+    return {
+        'count': len(ms),
+        'p50_ms': round(percentile(ms, 50), 2),
+        'p95_ms': round(percentile(ms, 95), 2),
+        'p99_ms': round(percentile(ms, 99), 2),
+        'max_ms': round(max(ms), 2) if ms else 0.0,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children (Linux reports KB, macOS bytes)"""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {'self_mb': round(own / scale, 1), 'children_mb': round(children / scale, 1)}
+
+
+# --- Sections (each runs in a fresh process, see run_section) ---
+
+def bench_extraction(config, tmp):
+    from pdf_processor import extract_pages
+
+    results = []
+    for pages in config['pages']:
+        path = write_pdf(os.path.join(tmp, f'extract_{pages}.pdf'), pages, seed=pages)
+        best = None
+        for _ in range(config['repeat']):
+            started = time.perf_counter()
+            texts = extract_pages(path)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({
+            'pages': pages,
+            'extracted_pages': len(texts),
+            'best_s': round(best, 4),
+            'pages_per_s': round(pages / best, 1),
+        })
+    return {'results': results}
+
+
+def start_app(tmp, llm_url=None):
+    """Import the app against a fresh database in `tmp` and serve it on a free port"""
+    os.environ['ASSISTANT_DB'] = os.path.join(tmp, 'bench.db')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(tmp, 'uploads')
+    if llm_url:
+        os.environ['OPENAI_API_KEY'] = 'benchmark'
+        os.environ['OPENAI_BASE_URL'] = llm_url
+    else:
+        os.environ.pop('OPENAI_API_KEY', None)
+    os.chdir(tmp)
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api"
+
+
+def upload_and_wait(session, base_url, path, name):
+    """Upload a PDF and wait for its ingest job; returns (pdf_id, upload seconds, total seconds)"""
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        response = session.post(f"{base_url}/upload", files={'file': (os.path.basename(path), f)},
+                                data={'module_name': name}, timeout=600)
+    uploaded = time.perf_counter() - started
+    data = response.json()
+    if response.status_code not in (200, 202):
+        raise RuntimeError(f"Upload of {name} failed: {data.get('error')}")
+    pdf_id = data.get('pdf_id')
+    while pdf_id is None:
+        job = session.get(f"{base_url}/jobs/{data['job_id']}", timeout=60).json()
+        if job.get('status') == 'done':
+            pdf_id = job['pdf_id']
+        elif job.get('status') == 'failed':
+            raise RuntimeError(f"Ingest of {name} failed: {job.get('error')}")
+        else:
+            time.sleep(0.02)
+    return pdf_id, uploaded, time.perf_counter() - started
+
+
+def bench_search(pdf_id, queries):
+    """
+    The /api/ask work without an LLM: context selection, then the local
+    fallback lookup in the module's keyword index
+    """
+    import db
+    import retrieval
+    from llm_handler import local_answer
+
+    timings = []
+    conn = db.connect()
+    try:
+        # local_answer logs every fallback; keep the benchmark output readable
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for n in range(queries):
+                question = f"{QUESTIONS[n % len(QUESTIONS)]} {n}"
+                started = time.perf_counter()
+                context = retrieval.select_context(conn, pdf_id, question)
+                local_answer(question, context, retrieval.get_search_index(conn, pdf_id))
+                timings.append(time.perf_counter() - started)
+    finally:
+        conn.close()
+    return latency_summary(timings)
+
+
+def bench_ingest(config, tmp):
+    import requests
+
+    server, base_url = start_app(tmp)
+    session = requests.Session()
+    ingest = []
+    search = []
+    try:
+        for pages in config['pages']:
+            path = write_pdf(os.path.join(tmp, f'ingest_{pages}.pdf'), pages, seed=1000 + pages)
+            pdf_id, uploaded, total = upload_and_wait(session, base_url, path, f'Ingest {pages}')
+            ingest.append({
+                'pages': pages,
+                'upload_ms': round(uploaded * 1000, 1),
+                'ingest_ms': round(total * 1000, 1),
+                'pages_per_s': round(pages / total, 1),
+            })
+            search.append(dict(pages=pages, **bench_search(pdf_id, config['search_queries'])))
+    finally:
+        server.shutdown()
+    return {'results': ingest, 'fallback_search': search}
+
+
+def ask_load(session_factory, base_url, pdf_id, requests_total, concurrency, fresh):
+    """Send `requests_total` asks from `concurrency` clients; fresh=False repeats questions"""
+    local = threading.local()
+
+    def ask(n):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = session_factory()
+        # Numbered questions miss the answer cache; repeated ones hit it after the first round
+        question = f"{QUESTIONS[n % len(QUESTIONS)]} ({n})" if fresh else QUESTIONS[n % len(QUESTIONS)]
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{base_url}/ask", json={'pdf_id': pdf_id, 'question': question}, timeout=120)
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(ask, range(requests_total)))
+    elapsed = time.perf_counter() - started
+    summary = latency_summary([t for t, ok in results if ok])
+    summary['errors'] = sum(not ok for _, ok in results)
+    summary['requests_per_s'] = round(len(results) / elapsed, 1)
+    return summary
+
+
+def bench_ask(config, tmp):
+    import requests
+    import stub_llm_server
+
+    llm_server, llm_url = stub_llm_server.start_in_background(delay=config['llm_delay'])
+    server, base_url = start_app(tmp, llm_url)
+    try:
+        path = write_pdf(os.path.join(tmp, 'ask.pdf'), config['ask_pages'], seed=7)
+        pdf_id, _, _ = upload_and_wait(requests.Session(), base_url, path, 'Ask')
+        fresh = ask_load(requests.Session, base_url, pdf_id, config['ask_requests'], config['concurrency'], True)
+        cached = ask_load(requests.Session, base_url, pdf_id, config['ask_requests'], config['concurrency'], False)
+    finally:
+        server.shutdown()
+        llm_server.shutdown()
+    return {'pages': config['ask_pages'], 'concurrency': config['concurrency'],
+            'llm_delay_s': config['llm_delay'], 'fresh_questions': fresh, 'repeated_questions': cached}
+
+
+BENCHES = {'extraction': bench_extraction, 'ingest': bench_ingest, 'ask': bench_ask}
+
+
+def run_section(name, config, out):
+    """Child process entry point: run one section and write its results to `out`"""
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        result = BENCHES[name](config, tmp)
+        result['wall_s'] = round(time.perf_counter() - started, 2)
+        result['peak_rss'] = peak_rss_mb()
+        os.chdir(ROOT)
+    with open(out, 'w') as f:
+        json.dump(result, f)
+    # Background workers (ingest queue, quiz bank) don't need a clean shutdown here
+    os._exit(0)
+
+
+# --- Driver ---
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(config, sections):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in sections:
+            out = os.path.join(tmp, f'{name}.json')
+            print(f"Running {name}...", flush=True)
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--section', name,
+                            '--config', json.dumps(config), '--out', out], check=True)
+            with open(out) as f:
+                results[name] = json.load(f)
+    return {
+        'benchmark': 'suite',
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'env': {key: os.environ[key] for key in ('DB_JOURNAL_MODE', 'KEYWORD_BACKEND', 'RETRIEVAL_MODE',
+                                                 'PDF_EXTRACT_WORKERS', 'CONTEXT_COMPRESSOR') if key in os.environ},
+        'config': config,
+        'sections': results,
+    }
+
+
+def flatten(value, prefix=''):
+    """{'a': {'b': 1}, 'c': [{'pages': 10, 'x': 2}]} -> {'a.b': 1, 'c[pages=10].x': 2}"""
+    items = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            items.update(flatten(item, f'{prefix}.{key}' if prefix else key))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            label = f"pages={item['pages']}" if isinstance(item, dict) and 'pages' in item else str(i)
+            items.update(flatten(item, f'{prefix}[{label}]'))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        items[prefix] = value
+    return items
+
+
+def direction(key):
+    """+1 if higher is better, -1 if lower is better, 0 if the metric isn't compared"""
+    name = key.rsplit('.', 1)[-1]
+    if name.endswith('per_s'):
+        return 1
+    if name.endswith(('_ms', '_s', '_mb')) and name != 'llm_delay_s':
+        return -1
+    return 0
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Print the change of every comparable metric; returns the regressed keys"""
+    old = flatten(baseline.get('sections', {}))
+    new = flatten(current.get('sections', {}))
+    regressions = []
+    print(f"Comparing {baseline.get('commit') or 'baseline'} -> {current.get('commit') or 'current'}")
+    print(f"{'metric':<58} {'before':>10} {'after':>10} {'change':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        sign = direction(key)
+        if not sign or not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        regressed = sign * change < -threshold
+        if key.endswith('_ms') and abs(new[key] - old[key]) < MIN_CHANGE_MS:
+            regressed = False
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<58} {old[key]:>10} {new[key]:>10} {change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+    print(f"{len(regressions)} regression(s) beyond {threshold:.0%}")
+    return regressions
+
+
+def print_summary(report):
+    sections = report['sections']
+    if 'extraction' in sections:
+        for r in sections['extraction']['results']:
+            print(f"extraction  {r['pages']:>5} pages  {r['pages_per_s']:>8} pages/s")
+    if 'ingest' in sections:
+        for r, s in zip(sections['ingest']['results'], sections['ingest']['fallback_search']):
+            print(f"ingest      {r['pages']:>5} pages  {r['ingest_ms']:>9} ms   "
+                  f"fallback search p50 {s['p50_ms']} ms, p99 {s['p99_ms']} ms")
+    if 'ask' in sections:
+        for label in ('fresh_questions', 'repeated_questions'):
+            s = sections['ask'][label]
+            print(f"ask         {label:<19} p50 {s['p50_ms']} ms, p99 {s['p99_ms']} ms, "
+                  f"{s['requests_per_s']} req/s, {s['errors']} errors")
+    for name, section in sections.items():
+        print(f"peak RSS    {name:<11} {section['peak_rss']['self_mb']} MB "
+              f"(+{section['peak_rss']['children_mb']} MB in worker processes)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reproducible ingest/ask/MCQ benchmark suite')
+    parser.add_argument('--quick', action='store_true', help='Smaller PDFs and fewer requests')
+    parser.add_argument('--sections', nargs='+', choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument('--pages', type=int, nargs='+', help='PDF sizes (default 10 100 1000)')
+    parser.add_argument('--concurrency', type=int, help='Concurrent /api/ask clients')
+    parser.add_argument('--llm-delay', type=float, default=0.05, help='Stub LLM response delay in seconds')
+    parser.add_argument('--json', help='Results file (default benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--against', help='With --compare: compare this results file instead of running')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    # Internal: run one section in this process
+    parser.add_argument('--section', choices=SECTIONS, help=argparse.SUPPRESS)
+    parser.add_argument('--config', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.section:
+        run_section(args.section, json.loads(args.config), args.out)
+
+    if args.against:
+        if not args.compare:
+            parser.error('--against needs --compare')
+        with open(args.compare) as f, open(args.against) as g:
+            sys.exit(1 if compare(json.load(f), json.load(g), args.threshold) else 0)
+
+    config = dict(QUICK if args.quick else FULL, llm_delay=args.llm_delay)
+    if args.pages:
+        config['pages'] = args.pages
+    if args.concurrency:
+        config['concurrency'] = args.concurrency
+
+    report = run_suite(config, args.sections)
+    print_summary(report)
+
+    path = args.json or os.path.join(BENCH_DIR, 'results', f"{report['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(json.load(f), report, args.threshold) else 0)
@@ -0,0 +1,72 @@
+"""
+Synthetic PDF generator for benchmarks - writes text-only PDFs of any page
+count without extra dependencies
+"""
+import random
+
+WORDS = (
+    "ethics privacy signature hash encryption key public private network security "
+    "law policy data message integrity authentication certificate authority trust "
+    "student module lesson concept theory example practice review question answer "
+    "system process method analysis result evidence principle framework model"
+).split()
+
+LINES_PER_PAGE = 40
+WORDS_PER_LINE = 12
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def page_lines(page_no, rng):
+    """Deterministic pseudo-random lines for one page"""
+    lines = [f"Section {page_no}: {rng.choice(WORDS).title()} and {rng.choice(WORDS)}"]
+    for _ in range(LINES_PER_PAGE - 1):
+        lines.append(' '.join(rng.choice(WORDS) for _ in range(WORDS_PER_LINE)) + '.')
+    return lines
+
+
+def write_pdf(path, pages, seed=0):
+    """Write a `pages`-page PDF of generated text to `path`"""
+    rng = random.Random(seed)
+    objects = []  # object bodies; object number = index + 1
+
+    page_object_numbers = []
+    # 1: catalog, 2: pages tree, 3: font; page/content pairs follow
+    for page_no in range(1, pages + 1):
+        stream = ["BT", "/F1 10 Tf", "12 TL", "50 760 Td"]
+        for line in page_lines(page_no, rng):
+            stream.append(f"({_escape(line)}) Tj T*")
+        stream.append("ET")
+        content = "\n".join(stream).encode('latin-1')
+        content_no = 4 + len(objects)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_no_obj = 4 + len(objects)
+        objects.append((
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_no} 0 R >>"
+        ).encode('latin-1'))
+        page_object_numbers.append(page_no_obj)
+
+    kids = ' '.join(f'{n} 0 R' for n in page_object_numbers)
+    header_objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode('latin-1'),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    all_objects = header_objects + objects
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(all_objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref_offset = f.tell()
+        f.write(b"xref\n0 %d\n" % (len(all_objects) + 1))
+        f.write(b"0000000000 65535 f \n")
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(all_objects) + 1, xref_offset))
+    return path
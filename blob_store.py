@@ -0,0 +1,150 @@
+"""
+Blob store module - content-addressed storage for uploaded files
+Uploads are hashed while they are written and stored once under their SHA-256
+digest, so identical files (even under different names) share one copy on disk.
+"""
+import hashlib
+import os
+import tempfile
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+# Bytes kept from the start of a blob so callers can check its file type
+HEAD_SIZE = 1024
+PDF_MAGIC = b'%PDF-'
+
+
+class BlobTooLarge(ValueError):
+    """More bytes were written than the writer's limit allows"""
+
+
+class BlobWriter:
+    """
+    File-like temp file in the blob directory that hashes everything written to
+    it and refuses to grow past `max_bytes`. commit() moves it to its content
+    address; closing it uncommitted deletes it. Werkzeug can write multipart
+    uploads straight into one (see app.UploadRequest), so an upload is written once.
+    """
+
+    def __init__(self, blob_dir, max_bytes=None):
+        os.makedirs(blob_dir, exist_ok=True)
+        self.blob_dir = blob_dir
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.head = b''
+        self.sha = hashlib.sha256()
+        fd, self.tmp_path = tempfile.mkstemp(dir=blob_dir, suffix='.part')
+        self.file = os.fdopen(fd, 'w+b')
+        self.committed = None
+
+    def write(self, data):
+        if self.max_bytes is not None and self.size + len(data) > self.max_bytes:
+            raise BlobTooLarge(f"File is larger than {self.max_bytes} bytes")
+        if len(self.head) < HEAD_SIZE:
+            self.head += bytes(data[:HEAD_SIZE - len(self.head)])
+        self.sha.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def looks_like_pdf(self):
+        # Readers accept the header anywhere in the first 1KB
+        return PDF_MAGIC in self.head
+
+    def copy_from(self, stream, chunk_size=CHUNK_SIZE):
+        """Write a binary stream in chunks; returns the bytes written so far"""
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return self.size
+            self.write(chunk)
+
+    def commit(self, ext='pdf'):
+        """Store the blob under its digest; returns (digest, path, created)"""
+        if self.committed is None:
+            self.file.close()
+            digest = self.sha.hexdigest()
+            path = blob_path(self.blob_dir, digest, ext)
+            if os.path.exists(path):
+                os.remove(self.tmp_path)
+                self.committed = (digest, path, False)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(self.tmp_path, path)
+                self.committed = (digest, path, True)
+        return self.committed
+
+    def close(self):
+        if self.committed is None:
+            self.file.close()
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+    def __getattr__(self, name):
+        # read/seek/tell/flush etc. go to the temp file
+        return getattr(self.file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def blob_path(blob_dir, digest, ext='pdf'):
+    """Location of a blob: <blob_dir>/<first two hex chars>/<digest>.<ext>"""
+    return os.path.join(blob_dir, digest[:2], f'{digest}.{ext}')
+
+
+def save_stream(stream, blob_dir, ext='pdf'):
+    """
+    Copy a binary stream into the blob store, hashing it on the way.
+    Returns (digest, path, created) where `created` is False if the blob already existed.
+    """
+    with BlobWriter(blob_dir) as writer:
+        writer.copy_from(stream)
+        return writer.commit(ext)
+
+
+def hash_file(path):
+    """SHA-256 of a file on disk"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def find_module_by_hash(conn, digest):
+    """Return (pdf_id, module_name) of a module with this content hash, or None"""
+    c = conn.cursor()
+    c.execute('SELECT id, module_name FROM pdfs WHERE content_hash = ? ORDER BY id LIMIT 1', (digest,))
+    return c.fetchone()
+
+
+def backfill_content_hashes(conn):
+    """Hash the files of modules uploaded before content hashing existed"""
+    c = conn.cursor()
+    c.execute("SELECT id, filepath FROM pdfs WHERE content_hash IS NULL AND filepath != ''")
+    for pdf_id, filepath in c.fetchall():
+        # Paths may have been stored on another OS (e.g. uploads\file.pdf)
+        filepath = filepath.replace('\\', os.sep).replace('/', os.sep)
+        if os.path.exists(filepath):
+            c.execute('UPDATE pdfs SET content_hash = ? WHERE id = ?', (hash_file(filepath), pdf_id))
+
+
+def remove_unreferenced(conn, filepath):
+    """Delete a blob unless a module or an unfinished ingest job still uses it; returns whether it was deleted"""
+    if not filepath or is_referenced(conn, filepath) or not os.path.exists(filepath):
+        return False
+    os.remove(filepath)
+    return True
+
+
+def is_referenced(conn, filepath):
+    """True if any module row, or an ingest job that hasn't finished, still points at this file"""
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM pdfs WHERE filepath = ? LIMIT 1', (filepath,))
+    if c.fetchone():
+        return True
+    c.execute("SELECT 1 FROM ingest_jobs WHERE filepath = ? AND status IN ('queued', 'running') LIMIT 1",
+              (filepath,))
+    return c.fetchone() is not None
@@ -0,0 +1,338 @@
+"""
+Bulk import - load a directory of PDFs into the module library from the command line
+
+Files are hashed and de-duplicated against modules already in the database (and
+against each other), then copied into the blob store, extracted and indexed in
+a process pool. Each worker indexes into a private in-memory database and hands
+back the rows; the main process writes them to the real database with
+executemany, many modules per transaction. Re-running an interrupted or partly
+failed import picks up where it stopped, because anything already imported is
+skipped by its content hash.
+
+Quiz banks are not filled here; the app fills a module's bank the first time a
+quiz is requested from it. With RETRIEVAL_MODE=embedding, chunk vectors are
+likewise computed on first use.
+
+Usage:
+    python bulk_import.py path/to/term1 path/to/term2
+    python bulk_import.py library/ --workers 8 --batch-size 50
+    python bulk_import.py library/ --dry-run
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pdf_processor import EXTRACT_WORKERS, iter_pages
+import blob_store
+import db
+import fulltext
+import local_mcq
+import pages
+import retrieval
+
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 25))   # modules per transaction
+
+# Files handed to the pool ahead of the results being written, per worker
+PREFETCH_PER_WORKER = 2
+# Stand-in module id inside the workers' scratch databases (real ids start at 1)
+SCRATCH_PDF_ID = 0
+# Content hashes per `IN (...)` lookup
+HASH_LOOKUP_SIZE = 500
+
+_scratch = None
+# (table, columns) of every scratch table holding per-module rows
+_module_tables = []
+
+
+# --- Worker side ---
+
+def _init_worker():
+    """Create this worker's scratch database with the full schema"""
+    global _scratch
+    _scratch = sqlite3.connect(':memory:')
+    for migration in db.MIGRATIONS:
+        migration(_scratch)
+    # Full-text rows can't be read back out of the contentless pages_fts, so the
+    # main process indexes them from the copied pages instead
+    _scratch.execute('DROP TABLE IF EXISTS pages_fts')
+    _scratch.commit()
+    tables = _scratch.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name").fetchall()
+    for (table,) in tables:
+        columns = [row[1] for row in _scratch.execute(f'PRAGMA table_info({table})')]
+        if 'pdf_id' in columns:
+            _module_tables.append((table, columns))
+
+
+def _prepare(path, blob_dir):
+    """
+    Process pool task: store one file in the blob store, extract and index it.
+    Returns the module's rows as {table: (columns, rows)}, with SCRATCH_PDF_ID
+    where the module id goes.
+    """
+    with open(path, 'rb') as file:
+        digest, blob, created = blob_store.save_stream(file, blob_dir)
+
+    conn = _scratch
+    try:
+        rows = pages.encode_pages(iter_pages(blob, parallel=False))
+        page_count, text_length = pages.store_encoded_pages(conn, SCRATCH_PDF_ID, rows)
+        if not page_count:
+            raise ValueError("no pages could be read")
+        retrieval.index_pages(conn, SCRATCH_PDF_ID, pages.StoredPages(conn, SCRATCH_PDF_ID), embed=False)
+        local_mcq.build_page_sentence_index(conn, SCRATCH_PDF_ID, pages.StoredPages(conn, SCRATCH_PDF_ID))
+
+        tables = {}
+        for table, columns in _module_tables:
+            found = conn.execute(f'SELECT {", ".join(columns)} FROM {table} WHERE pdf_id = ?',
+                                 (SCRATCH_PDF_ID,)).fetchall()
+            if found:
+                tables[table] = (columns, found)
+    except Exception:
+        # Don't leave a blob behind that no module points to
+        if created:
+            os.remove(blob)
+        raise
+    finally:
+        # Nothing in the scratch database outlives the task
+        conn.rollback()
+
+    return {'path': path, 'content_hash': digest, 'filepath': blob, 'created': created,
+            'page_count': page_count, 'text_length': text_length, 'tables': tables}
+
+
+# --- Main process ---
+
+def find_pdfs(directories):
+    """Every .pdf file under the directories, sorted"""
+    found = []
+    for directory in directories:
+        if os.path.isfile(directory):
+            found.append(directory)
+            continue
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            found.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith('.pdf'))
+    return found
+
+
+def imported_hashes(conn, digests):
+    """The subset of content hashes that already belong to a module"""
+    digests = list(digests)
+    existing = set()
+    for i in range(0, len(digests), HASH_LOOKUP_SIZE):
+        batch = digests[i:i + HASH_LOOKUP_SIZE]
+        placeholders = ','.join('?' * len(batch))
+        existing.update(row[0] for row in conn.execute(
+            f'SELECT content_hash FROM pdfs WHERE content_hash IN ({placeholders})', batch))
+    return existing
+
+
+def module_name_for(path):
+    """Module name from the file name, e.g. 'week_3-ethics.pdf' -> 'week 3 ethics'"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return ' '.join(stem.replace('_', ' ').replace('-', ' ').split()) or 'Untitled Module'
+
+
+def _move_row(columns, row, pdf_id):
+    """A scratch database row, moved from SCRATCH_PDF_ID to module `pdf_id`"""
+    row = list(row)
+    row[columns.index('pdf_id')] = pdf_id
+    return tuple(row)
+
+
+def discard_blob(conn, module):
+    """Delete the blob a module that failed to import created, unless something uses it by now"""
+    if module['created']:
+        blob_store.remove_unreferenced(conn, module['filepath'])
+
+
+def write_modules(conn, modules):
+    """
+    Insert a batch of prepared modules in one transaction; returns how many were
+    new (modules whose content arrived meanwhile, e.g. through the app, are skipped)
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        existing = imported_hashes(conn, {m['content_hash'] for m in modules})
+        fresh = []
+        for module in modules:
+            if module['content_hash'] not in existing:
+                existing.add(module['content_hash'])
+                fresh.append(module)
+
+        # Ids are assigned here so every table can be written with executemany
+        c = conn.cursor()
+        c.execute("SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'pdfs'), 0), "
+                  "COALESCE((SELECT MAX(id) FROM pdfs), 0))")
+        next_id = c.fetchone()[0] + 1
+        c.executemany('''
+            INSERT INTO pdfs (id, filename, filepath, module_name, content_hash, page_count, text_length)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(next_id + i, os.path.basename(m['path']), m['filepath'], module_name_for(m['path']),
+               m['content_hash'], m['page_count'], m['text_length']) for i, m in enumerate(fresh)])
+
+        by_table = {}
+        for i, module in enumerate(fresh):
+            for table, (columns, rows) in module['tables'].items():
+                target = by_table.setdefault(table, (columns, []))[1]
+                target.extend(_move_row(columns, row, next_id + i) for row in rows)
+        for table, (columns, rows) in by_table.items():
+            c.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                          rows)
+        for i in range(len(fresh)):
+            fulltext.index_pages(conn, next_id + i, pages.StoredPages(conn, next_id + i))
+        conn.commit()
+        return len(fresh)
+    except Exception:
+        conn.rollback()
+        raise
+
+
+class Progress:
+    """One status line, redrawn in place on a terminal and printed every few seconds otherwise"""
+
+    def __init__(self, total, interval=5.0):
+        self.total = total
+        self.started = time.monotonic()
+        self.tty = sys.stdout.isatty()
+        self.interval = interval
+        self.last = 0.0
+        self.done = self.imported = self.skipped = self.failed = 0
+
+    def show(self, final=False):
+        now = time.monotonic()
+        if not (final or self.tty or now - self.last >= self.interval):
+            return
+        self.last = now
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        line = (f"[{self.done}/{self.total}] {rate:.1f} files/s  imported {self.imported}, "
+                f"skipped {self.skipped}, failed {self.failed}")
+        if self.tty:
+            print('\r' + line, end='\n' if final else '', flush=True)
+        else:
+            print(line, flush=True)
+
+
+def run_import(paths, db_name=None, workers=None, batch_size=IMPORT_BATCH_SIZE, blob_dir=BLOB_FOLDER,
+               dry_run=False):
+    """Import PDF files; returns (imported, skipped, failed) where failed is [(path, error)]"""
+    workers = workers or EXTRACT_WORKERS
+    db.migrate(db_name)
+    conn = db.open_connection(db_name)
+    failed = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            print(f"Hashing {len(paths)} files...")
+            digests = list(executor.map(blob_store.hash_file, paths, chunksize=8))
+
+            # Keep the first copy of each content that isn't in the library yet
+            existing = imported_hashes(conn, set(digests))
+            todo = []
+            for path, digest in zip(paths, digests):
+                if digest not in existing:
+                    existing.add(digest)
+                    todo.append(path)
+            skipped = len(paths) - len(todo)
+            print(f"{skipped} already imported or duplicated, {len(todo)} to import")
+            if dry_run:
+                for path in todo:
+                    print(f"  {path}")
+                return 0, skipped, []
+
+            progress = Progress(len(todo))
+            progress.skipped = skipped
+            batch = []
+            imported = 0
+
+            def flush():
+                nonlocal imported
+                if not batch:
+                    return
+                try:
+                    imported += write_modules(conn, batch)
+                except Exception as e:
+                    # Find the module that broke the batch by writing the rest one by one
+                    print(f"\nBatch write failed ({e}), retrying its modules one at a time")
+                    for module in batch:
+                        try:
+                            imported += write_modules(conn, [module])
+                        except Exception as module_error:
+                            failed.append((module['path'], str(module_error)))
+                            discard_blob(conn, module)
+                batch.clear()
+                progress.imported, progress.failed = imported, len(failed)
+
+            pending = set()
+            queue = iter(todo)
+            try:
+                while True:
+                    while len(pending) < workers * PREFETCH_PER_WORKER:
+                        path = next(queue, None)
+                        if path is None:
+                            break
+                        future = executor.submit(_prepare, path, blob_dir)
+                        future.path = path
+                        pending.add(future)
+                    if not pending:
+                        break
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        progress.done += 1
+                        try:
+                            batch.append(future.result())
+                        except Exception as e:
+                            failed.append((future.path, str(e)))
+                            progress.failed = len(failed)
+                    if len(batch) >= batch_size:
+                        flush()
+                    progress.show()
+            except KeyboardInterrupt:
+                print("\nInterrupted; saving the modules already extracted (re-run to continue)")
+                for future in pending:
+                    future.cancel()
+                raise
+            finally:
+                flush()
+                progress.show(final=True)
+            return imported, skipped, failed
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a directory of PDFs as modules')
+    parser.add_argument('paths', nargs='+', help='Directories (searched recursively) or PDF files')
+    parser.add_argument('--db', default=db.DB_NAME, help='Database file (default: ASSISTANT_DB or assistant.db)')
+    parser.add_argument('--workers', type=int, default=EXTRACT_WORKERS, help='Extraction processes')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Modules per transaction')
+    parser.add_argument('--blob-dir', default=BLOB_FOLDER, help='Blob store the app serves uploads from')
+    parser.add_argument('--dry-run', action='store_true', help='Only list the files that would be imported')
+    args = parser.parse_args()
+
+    paths = find_pdfs(args.paths)
+    if not paths:
+        print("No PDF files found")
+        return 1
+    started = time.perf_counter()
+    try:
+        imported, skipped, failed = run_import(paths, args.db, args.workers, args.batch_size,
+                                               args.blob_dir, args.dry_run)
+    except KeyboardInterrupt:
+        return 130
+
+    if not args.dry_run:
+        print(f"Imported {imported} modules in {time.perf_counter() - started:.1f}s ({skipped} skipped)")
+    for path, error in failed:
+        print(f"  failed: {path}: {error}")
+    if failed:
+        print(f"{len(failed)} files failed; fix or remove them and re-run to retry")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Compression module - shrinks prompt context before it is sent to the LLM
+Every compressor takes (context, question, budget) and returns shorter text:
+  - extractive: keeps the sentences that best match the question (BM25), drops
+    near-duplicate sentences and packs the rest into the token budget
+  - scaledown: the ScaleDown /compress/raw/ API, falling back to extractive
+  - none: plain truncation to the budget (the old behaviour)
+Tokens saved and time added are counted per compressor in `stats`.
+"""
+import math
+import os
+import re
+import threading
+import time
+import requests
+from retrieval import estimate_tokens, truncate_to_tokens
+from search_index import bm25_rank, build_postings, tokenize
+
+CONTEXT_COMPRESSOR = os.getenv('CONTEXT_COMPRESSOR', 'extractive')   # extractive, scaledown or none
+# Compressed context aims for this share of the caller's token budget
+SCALEDOWN_URL = os.getenv('SCALEDOWN_URL', 'https://api.scaledown.xyz/compress/raw/')
+SCALEDOWN_API_KEY = os.getenv('SCALEDOWN_API_KEY')
+SCALEDOWN_TIMEOUT = float(os.getenv('SCALEDOWN_TIMEOUT', 5))
+
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+# Sentences sharing this much of their vocabulary with a kept one are dropped
+REDUNDANCY_THRESHOLD = 0.7
+# Fragments shorter than this (headings, list numbers) are kept only if they match the question
+MIN_SENTENCE_TERMS = 4
+GAP_MARKER = ' ... '
+
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_RE.split(text or '') if s.strip()]
+
+
+def _overlap(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class NoCompressor:
+    name = 'none'
+
+    def compress(self, context, question, budget):
+        return truncate_to_tokens(context, budget)
+
+
+class ExtractiveCompressor:
+    """Question-aware sentence selection within a token budget"""
+    name = 'extractive'
+
+    def _scores(self, sentences, question):
+        lengths, postings = build_postings(sentences)
+        avg_length = sum(lengths) / len(lengths)
+        scores = [0.0] * len(sentences)
+        for score, i in bm25_rank(tokenize(question or ''), postings, lengths, len(sentences), avg_length,
+                                  top_k=len(sentences)):
+            scores[i] = score
+        # Small prior for informative sentences (rarer terms), so sentences that
+        # don't mention the question (or MCQ context with no question) still rank sensibly
+        df = {term: len(p) for term, p in postings.items()}
+        for i, sentence in enumerate(sentences):
+            terms = set(tokenize(sentence))
+            if len(terms) < MIN_SENTENCE_TERMS and not scores[i]:
+                scores[i] = -1.0
+            elif terms:
+                info = sum(math.log(len(sentences) / df[t]) for t in terms) / len(terms)
+                scores[i] += 0.1 * info
+        return scores
+
+    def compress(self, context, question, budget):
+        sentences = split_sentences(context)
+        if not sentences:
+            return ''
+        scores = self._scores(sentences, question)
+        kept = []
+        kept_terms = []
+        used = 0
+        for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+            if scores[i] < 0:
+                break
+            cost = estimate_tokens(sentences[i]) + 1
+            if used + cost > budget:
+                continue
+            terms = set(tokenize(sentences[i]))
+            if any(_overlap(terms, other) >= REDUNDANCY_THRESHOLD for other in kept_terms):
+                continue
+            kept.append(i)
+            kept_terms.append(terms)
+            used += cost
+        if not kept:
+            return truncate_to_tokens(context, budget)
+
+        # Back in document order, marking where sentences were left out
+        kept.sort()
+        parts = [sentences[kept[0]]]
+        for prev, i in zip(kept, kept[1:]):
+            parts.append((' ' if i == prev + 1 else GAP_MARKER) + sentences[i])
+        return ''.join(parts)
+
+
+class ScaleDownCompressor:
+    """
+    Remote compression through ScaleDown's /compress/raw/ endpoint. Any failure
+    (or no API key) falls back to the extractive compressor.
+    """
+    name = 'scaledown'
+    # Response fields that may hold the compressed text
+    RESULT_KEYS = ('compressed_prompt', 'compressed_context', 'compressed', 'context', 'result')
+
+    def __init__(self, url=SCALEDOWN_URL, api_key=SCALEDOWN_API_KEY, timeout=SCALEDOWN_TIMEOUT):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.fallback = ExtractiveCompressor()
+
+    def _result(self, body):
+        if isinstance(body, dict):
+            for key in self.RESULT_KEYS:
+                if isinstance(body.get(key), str):
+                    return body[key]
+            return self._result(body.get('data'))
+        return None
+
+    def compress(self, context, question, budget):
+        if not self.api_key:
+            return self.fallback.compress(context, question, budget)
+        try:
+            response = self.session.post(self.url, timeout=self.timeout, headers={'x-api-key': self.api_key}, json={
+                'context': context,
+                'prompt': question or '',
+                'scaledown': {'rate': 'auto'}
+            })
+            response.raise_for_status()
+            text = self._result(response.json())
+            if not text:
+                raise ValueError('no compressed text in the response')
+        except (requests.RequestException, ValueError) as e:
+            print(f"ScaleDown compression failed, compressing locally: {e}")
+            stats.record_error(self.name)
+            return self.fallback.compress(context, question, budget)
+        return truncate_to_tokens(text, budget)
+
+
+COMPRESSORS = {
+    'none': NoCompressor,
+    'extractive': ExtractiveCompressor,
+    'scaledown': ScaleDownCompressor,
+}
+
+
+class CompressionStats:
+    """Tokens in/out and time spent, per compressor"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_name = {}
+
+    def _entry(self, name):
+        return self.by_name.setdefault(name, {'calls': 0, 'skipped': 0, 'errors': 0, 'tokens_in': 0,
+                                              'tokens_out': 0, 'seconds': 0.0})
+
+    def record(self, name, tokens_in, tokens_out, seconds):
+        with self.lock:
+            entry = self._entry(name)
+            entry['calls'] += 1
+            entry['tokens_in'] += tokens_in
+            entry['tokens_out'] += tokens_out
+            entry['seconds'] += seconds
+
+    def record_skip(self, name):
+        with self.lock:
+            self._entry(name)['skipped'] += 1
+
+    def record_error(self, name):
+        with self.lock:
+            self._entry(name)['errors'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            result = {}
+            for name, e in self.by_name.items():
+                saved = e['tokens_in'] - e['tokens_out']
+                result[name] = {
+                    'calls': e['calls'],
+                    'skipped': e['skipped'],
+                    'errors': e['errors'],
+                    'tokens_in': e['tokens_in'],
+                    'tokens_out': e['tokens_out'],
+                    'tokens_saved': saved,
+                    'saved_ratio': round(saved / e['tokens_in'], 3) if e['tokens_in'] else 0.0,
+                    'avg_latency_ms': round(e['seconds'] * 1000 / e['calls'], 2) if e['calls'] else 0.0
+                }
+            return result
+
+
+stats = CompressionStats()
+_compressor = None
+_compressor_lock = threading.Lock()
+
+
+def get_compressor():
+    """The compressor selected by CONTEXT_COMPRESSOR (created once)"""
+    global _compressor
+    with _compressor_lock:
+        if _compressor is None:
+            if CONTEXT_COMPRESSOR not in COMPRESSORS:
+                raise ValueError(f"Unknown CONTEXT_COMPRESSOR {CONTEXT_COMPRESSOR!r}")
+            _compressor = COMPRESSORS[CONTEXT_COMPRESSOR]()
+        return _compressor
+
+
+def compress_context(context, question, budget):
+    """
+    Context for a prompt, compressed to fit in `budget` tokens. Context that
+    already fits is returned unchanged.
+    """
+    context = context or ''
+    compressor = get_compressor()
+    tokens_in = estimate_tokens(context)
+    if tokens_in <= budget:
+        stats.record_skip(compressor.name)
+        return context
+    started = time.perf_counter()
+    compressed = compressor.compress(context, question, max(1, budget))
+    stats.record(compressor.name, tokens_in, estimate_tokens(compressed), time.perf_counter() - started)
+    return compressed
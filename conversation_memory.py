@@ -0,0 +1,277 @@
+"""
+Conversation memory - multi-turn context for follow-up questions
+Questions asked with a session_id are answered with that session's history
+(see conversations.add): its most recent turns verbatim, and everything older
+folded into a running summary in session_summaries. Both are kept within
+MEMORY_TOKEN_BUDGET tokens, so prompts stop growing after the first few turns.
+Summaries are updated in the background once a few turns have aged out of the
+verbatim window, by the LLM when one is configured and extractively otherwise.
+Clients pick their own session ids; asks without one have no memory.
+"""
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import LLMError, get_client
+from llm_handler import is_llm_answer
+from llm_usage import recorder as usage
+from local_mcq import STOPWORDS
+from search_index import tokenize
+import conversations
+import db
+import retrieval
+import token_budget
+
+MEMORY_TOKEN_BUDGET = int(os.getenv('MEMORY_TOKEN_BUDGET', 600))   # summary + recent turns, per prompt
+MEMORY_RECENT_TURNS = int(os.getenv('MEMORY_RECENT_TURNS', 4))     # turns kept verbatim
+MEMORY_SUMMARY_BATCH = int(os.getenv('MEMORY_SUMMARY_BATCH', 3))   # turns folded into the summary at a time
+
+# Share of the budget the summary may take; verbatim turns get the rest
+SUMMARY_SHARE = 0.4
+# Longest answer kept verbatim in the history, in tokens
+TURN_ANSWER_TOKENS = 150
+# Most turns folded in one summary update (catching up after failures)
+FOLD_MAX_TURNS = 20
+# Questions this short, about nothing the module mentions, are treated as follow-ups
+FOLLOW_UP_MAX_TERMS = 6
+# Words that don't say what a question is about
+REFERENCE_WORDS = {'it', 'its', 'that', 'this', 'these', 'those', 'they', 'them', 'above', 'previous',
+                   'earlier', 'again', 'more', 'else', 'another', 'same'}
+QUESTION_WORDS = {'why', 'how', 'who', 'what', 'when', 'where', 'which', 'does', 'did', 'can', 'you', 'the',
+                  'and', 'for', 'not', 'explain', 'mean', 'means', 'meant', 'tell', 'give', 'say', 'said', 'one'}
+SESSION_ID_RE = re.compile(r'^[\w-]{8,64}$')
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s')
+
+SUMMARY_PROMPT = ("You keep a running summary of a student's study session about a course module. "
+                  "Merge the new exchanges into the summary: the topics covered, the key facts in the answers, "
+                  "and what the student found confusing. Reply with the updated summary only, in a few short lines.")
+
+
+def init_memory_tables(conn):
+    """Session column on the history tables and the session_summaries table"""
+    c = conn.cursor()
+    db.add_column(c, 'conversations', 'session_id', 'TEXT')
+    db.add_column(c, 'conversations_archive', 'session_id', 'TEXT')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_session
+        ON conversations(session_id, id) WHERE session_id IS NOT NULL
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS session_summaries (
+            session_id TEXT NOT NULL,
+            pdf_id INTEGER NOT NULL,
+            summary TEXT NOT NULL,
+            through_id INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (session_id, pdf_id)
+        )
+    ''')
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and SESSION_ID_RE.match(session_id) is not None
+
+
+def content_terms(question):
+    """Terms of a question that say what it is about"""
+    return {term for term in tokenize(question)
+            if len(term) >= 3 and term not in REFERENCE_WORDS and term not in QUESTION_WORDS
+            and term not in STOPWORDS}
+
+
+class Memory:
+    """
+    A session's history as it goes into a prompt: summary plus recent (question, answer) turns.
+    `through_id` is the last turn folded into the summary (0 without one); `module_terms` are
+    the content terms of the question being answered that occur in the module.
+    """
+
+    def __init__(self, summary='', turns=(), through_id=0, module_terms=(), session_id=None):
+        self.summary = summary
+        self.turns = list(turns)
+        self.through_id = through_id if summary else 0
+        self.module_terms = frozenset(module_terms)
+        self.session_id = session_id
+
+    def __bool__(self):
+        return bool(self.summary or self.turns)
+
+    def messages(self):
+        """Chat messages to place between the system prompt and the new question"""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the conversation so far:\n{self.summary}"})
+        for question, answer in self.turns:
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+        return messages
+
+    def is_follow_up(self, question):
+        """
+        Whether the question probably depends on earlier turns (so its answer shouldn't be cached):
+        a short one about nothing the module mentions, like "explain that more" or "why?"
+        """
+        return (bool(self) and len(tokenize(question)) <= FOLLOW_UP_MAX_TERMS
+                and self.module_terms.isdisjoint(content_terms(question)))
+
+    def cache_scope(self, question):
+        """
+        Answer cache scope for the question. Without history the prompt is just the question,
+        so the answer goes in the shared scope 0. Any history makes it the session's answer:
+        scope "<session_id>:<through_id>", reused only in that session until the summary changes.
+        Follow-ups get None (not cached).
+        """
+        if not self:
+            return 0
+        if self.is_follow_up(question):
+            return None
+        return f'{self.session_id}:{self.through_id}'
+
+    def search_query(self, question):
+        """Text to retrieve context with: follow-ups are searched along with the previous question"""
+        if self.turns and self.is_follow_up(question):
+            return f"{self.turns[-1][0]} {question}"
+        return question
+
+
+def _summary_row(conn, session_id, pdf_id):
+    c = conn.cursor()
+    c.execute('SELECT summary, through_id FROM session_summaries WHERE session_id = ? AND pdf_id = ?',
+              (session_id, pdf_id))
+    return c.fetchone() or ('', 0)
+
+
+def load(conn, session_id, pdf_id, budget=MEMORY_TOKEN_BUDGET, question=''):
+    """
+    The session's Memory for a module, trimmed to `budget` tokens (oldest turns go first).
+    With a `question`, also looks up which of its content terms the module contains.
+    """
+    if not session_id:
+        return Memory()
+    summary, through_id = _summary_row(conn, session_id, pdf_id)
+    if summary:
+        summary = token_budget.truncate(summary, int(budget * SUMMARY_SHARE))
+    used = token_budget.count_tokens(summary) if summary else 0
+
+    turns = []
+    recent = conversations.session_turns(conn, session_id, pdf_id, after_id=through_id,
+                                         limit=MEMORY_RECENT_TURNS + MEMORY_SUMMARY_BATCH)
+    # Newest first; turns not folded into the summary yet stay verbatim while they fit
+    for _, asked, answer in reversed(recent):
+        answer = token_budget.truncate(answer, TURN_ANSWER_TOKENS)
+        cost = token_budget.count_message_tokens(
+            [{"role": "user", "content": asked}, {"role": "assistant", "content": answer}],
+            token_budget.LLM_MODEL)
+        if used + cost > budget:
+            break
+        turns.append((asked, answer))
+        used += cost
+    turns.reverse()
+    module_terms = ()
+    if question and (summary or turns):
+        module_terms = retrieval.module_terms(conn, pdf_id, content_terms(question))
+    return Memory(summary, turns, through_id, module_terms, session_id)
+
+
+# --- Summaries ---
+
+def _first_sentence(text):
+    return SENTENCE_END_RE.split(text.strip(), 1)[0]
+
+
+def local_summary(previous, turns, max_tokens):
+    """Extractive summary: one line per question with the gist of its answer, newest kept when over budget"""
+    lines = previous.splitlines() if previous else []
+    for question, answer in turns:
+        line = f"- Asked: {question.strip()}"
+        if is_llm_answer(answer):
+            line += f" -> {token_budget.truncate(_first_sentence(answer), 40)}"
+        lines.append(line)
+    while len(lines) > 1 and token_budget.count_tokens('\n'.join(lines)) > max_tokens:
+        lines.pop(0)
+    return token_budget.truncate('\n'.join(lines), max_tokens)
+
+
+def summarize(previous, turns, max_tokens):
+    """New summary covering `previous` plus the (question, answer) turns"""
+    client = get_client()
+    if client is None:
+        return local_summary(previous, turns, max_tokens)
+
+    exchanges = '\n\n'.join(f"Student: {question}\nAssistant: {token_budget.truncate(answer, TURN_ANSWER_TOKENS)}"
+                            for question, answer in turns)
+    payload = {
+        "model": token_budget.LLM_MODEL,
+        "messages": [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Summary so far:\n{previous or '(none)'}\n\nNew exchanges:\n{exchanges}"}
+        ],
+        "max_tokens": max_tokens,
+        "temperature": 0.2
+    }
+    try:
+        with usage.track('summary', payload) as call:
+            data = client.chat(payload)
+            call.response(data)
+        return token_budget.truncate(data['choices'][0]['message']['content'].strip(), max_tokens)
+    except (LLMError, KeyError, IndexError) as e:
+        print(f"LLM summary failed, summarizing locally: {e}")
+        return local_summary(previous, turns, max_tokens)
+
+
+def fold(conn, session_id, pdf_id, budget=MEMORY_TOKEN_BUDGET):
+    """
+    Fold the session's turns older than the verbatim window into its summary,
+    once at least MEMORY_SUMMARY_BATCH have built up; returns how many were folded
+    """
+    summary, through_id = _summary_row(conn, session_id, pdf_id)
+    turns = conversations.session_turns(conn, session_id, pdf_id, after_id=through_id,
+                                        limit=MEMORY_RECENT_TURNS + FOLD_MAX_TURNS, oldest_first=True)
+    old = turns[:max(0, len(turns) - MEMORY_RECENT_TURNS)][:FOLD_MAX_TURNS]
+    if len(old) < MEMORY_SUMMARY_BATCH:
+        return 0
+
+    summary = summarize(summary, [(question, answer) for _, question, answer in old], int(budget * SUMMARY_SHARE))
+    conn.execute('''
+        INSERT OR REPLACE INTO session_summaries (session_id, pdf_id, summary, through_id, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (session_id, pdf_id, summary, old[-1][0], time.time()))
+    conn.commit()
+    return len(old)
+
+
+def delete_module(conn, pdf_id):
+    conn.execute('DELETE FROM session_summaries WHERE pdf_id = ?', (pdf_id,))
+
+
+class SummaryUpdater:
+    """Runs fold() after answers are saved, one at a time, without blocking the request"""
+
+    def __init__(self, db_name=None):
+        self.db_name = db_name
+        # One worker, so two updates of the same session never race
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='memory')
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, session_id, pdf_id):
+        key = (session_id, pdf_id)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self.executor.submit(self._fold_job, key)
+
+    def _fold_job(self, key):
+        try:
+            conn = db.connect(self.db_name)
+            try:
+                fold(conn, *key)
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Summary update for session {key[0]} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
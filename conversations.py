@@ -0,0 +1,163 @@
+"""
+Conversations module - per-module question/answer history
+History is read in pages keyed by row id: newest first from a cursor, or only
+the rows after a given id for clients that already have the rest. Long answers
+are stored compressed (see pages.encode). Rows older than
+CONVERSATION_ARCHIVE_DAYS are moved to conversations_archive; history pages
+merge both tables by id, since an archived row can have a higher id than a
+newer one that is still live.
+"""
+import os
+import db
+import pages
+
+ANSWER_COMPRESSION = os.getenv('ANSWER_COMPRESSION', 'zlib')                  # none, zlib or zstd
+CONVERSATION_ARCHIVE_DAYS = int(os.getenv('CONVERSATION_ARCHIVE_DAYS', 90))   # 0 disables archiving
+
+# Shorter answers are stored as plain text
+ANSWER_COMPRESS_MIN_CHARS = 1024
+# Rows moved per archive transaction
+ARCHIVE_BATCH_SIZE = 2000
+
+ROW_COLUMNS = 'id, question, answer, answer_codec, answer_z, timestamp'
+
+
+def init_history_tables(conn):
+    """Compressed answer columns, the (pdf_id, id) paging index and the archive table"""
+    c = conn.cursor()
+    db.add_column(c, 'conversations', 'answer_codec', 'TEXT')
+    db.add_column(c, 'conversations', 'answer_z', 'BLOB')
+    # Pages are read by id; the (pdf_id, timestamp) index stays for per-module time queries
+    c.execute('CREATE INDEX IF NOT EXISTS idx_conversations_pdf_id ON conversations(pdf_id, id)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS conversations_archive (
+            id INTEGER PRIMARY KEY,
+            pdf_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            answer_codec TEXT,
+            answer_z BLOB,
+            timestamp TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_conversations_archive_pdf_id ON conversations_archive(pdf_id, id)')
+
+
+def init_archive_index(conn):
+    """Timestamp index for archive(), which reads the rows older than its cutoff across modules"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations(timestamp)')
+
+
+def init_time_index(conn):
+    """The per-module (pdf_id, timestamp) index, for databases that dropped it"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_conversations_pdf_time ON conversations(pdf_id, timestamp)')
+
+
+def encode_answer(answer, codec=ANSWER_COMPRESSION):
+    """(answer, answer_codec, answer_z) column values; long answers go in answer_z"""
+    if codec == 'none' or len(answer) < ANSWER_COMPRESS_MIN_CHARS:
+        return answer, None, None
+    codec, data = pages.encode(answer, codec)
+    return '', codec, data
+
+
+def _to_dict(row):
+    conv_id, question, answer, codec, data, timestamp = row
+    return {
+        'id': conv_id,
+        'question': question,
+        'answer': pages.decode(codec, data) if codec else answer,
+        'timestamp': timestamp
+    }
+
+
+def add(conn, pdf_id, question, answer, session_id=None):
+    """Append a question and its answer to a module's history (the caller commits)"""
+    conn.execute('''
+        INSERT INTO conversations (pdf_id, question, answer, answer_codec, answer_z, session_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (pdf_id, question, *encode_answer(answer), session_id))
+
+
+def session_turns(conn, session_id, pdf_id, after_id=0, limit=None, oldest_first=False):
+    """
+    (id, question, answer) turns of a session after `after_id`, in order.
+    With `limit`, the newest that many (or the oldest, with oldest_first).
+    """
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT {ROW_COLUMNS} FROM conversations
+        WHERE session_id = ? AND pdf_id = ? AND id > ?
+        ORDER BY id {'ASC' if oldest_first else 'DESC'} LIMIT ?
+    ''', (session_id, pdf_id, after_id, -1 if limit is None else limit))
+    turns = [(conv['id'], conv['question'], conv['answer']) for conv in map(_to_dict, c.fetchall())]
+    return turns if oldest_first else turns[::-1]
+
+
+def _select(conn, table, pdf_id, condition, params, order, limit):
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT {ROW_COLUMNS} FROM {table}
+        WHERE pdf_id = ?{condition}
+        ORDER BY id {order} LIMIT ?
+    ''', (pdf_id, *params, limit))
+    return c.fetchall()
+
+
+def history(conn, pdf_id, limit, before=None, since=None):
+    """
+    Up to `limit` conversations of a module and whether there are more.
+    Newest first, starting below id `before` if given. With `since`, only rows
+    added after that id, oldest first.
+    """
+    if since is not None:
+        rows = _select(conn, 'conversations', pdf_id, ' AND id > ?', (since,), 'ASC', limit + 1)
+    else:
+        condition, params = (' AND id < ?', (before,)) if before is not None else ('', ())
+        rows = (_select(conn, 'conversations', pdf_id, condition, params, 'DESC', limit + 1)
+                + _select(conn, 'conversations_archive', pdf_id, condition, params, 'DESC', limit + 1))
+        rows.sort(key=lambda row: row[0], reverse=True)
+    return [_to_dict(row) for row in rows[:limit]], len(rows) > limit
+
+
+def archive(conn, older_than_days=CONVERSATION_ARCHIVE_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move conversations older than `older_than_days` to conversations_archive,
+    compressing long answers on the way; returns how many rows were moved.
+    Rows are picked by timestamp alone, so a newer row stays even when its id is
+    lower than an archived one.
+    """
+    c = conn.cursor()
+    c.execute("SELECT datetime('now', ?)", (f'-{older_than_days} days',))
+    cutoff = c.fetchone()[0]
+
+    moved = 0
+    while True:
+        # Only the old rows are read, from idx_conversations_timestamp
+        c.execute('''
+            SELECT id, pdf_id, question, answer, answer_codec, answer_z, timestamp, session_id
+            FROM conversations WHERE timestamp < ? ORDER BY timestamp LIMIT ?
+        ''', (cutoff, batch_size))
+        rows = c.fetchall()
+        if not rows:
+            return moved
+        archived = []
+        for conv_id, pdf_id, question, answer, codec, data, timestamp, session_id in rows:
+            if codec is None:
+                answer, codec, data = encode_answer(answer)
+            archived.append((conv_id, pdf_id, question, answer, codec, data, timestamp, session_id))
+        c.executemany('''
+            INSERT OR REPLACE INTO conversations_archive
+                (id, pdf_id, question, answer, answer_codec, answer_z, timestamp, session_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', archived)
+        c.executemany('DELETE FROM conversations WHERE id = ?', [(row[0],) for row in rows])
+        # One transaction per batch keeps the write lock short for the app
+        conn.commit()
+        moved += len(rows)
+
+
+def delete_module(conn, pdf_id):
+    conn.execute('DELETE FROM conversations WHERE pdf_id = ?', (pdf_id,))
+    conn.execute('DELETE FROM conversations_archive WHERE pdf_id = ?', (pdf_id,))
@@ -0,0 +1,404 @@
+"""
+Database module - shared SQLite access for the app and background workers
+Connections are opened in WAL mode with tuned pragmas and reused through a
+small pool; the schema is created and upgraded by numbered migrations tracked
+in PRAGMA user_version.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+import metrics
+
+DB_NAME = os.getenv('ASSISTANT_DB', 'assistant.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', 30))   # seconds to wait on a locked database
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')       # DELETE restores the old rollback journal
+
+PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',      # safe with WAL; fsync at checkpoints only
+    'PRAGMA cache_size = -16000',       # 16MB page cache per connection
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 134217728',     # 128MB
+)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor whose statements are timed in metrics (by operation and table).
+    For SELECTs this covers running the query up to the first row, not fetching the rest.
+    """
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose statements and commits are timed (see TimedCursor)"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            metrics.observe_query('COMMIT', time.perf_counter() - started)
+
+
+class PooledConnection(TimedConnection):
+    """Connection whose close() hands it back to its pool instead of closing it"""
+    pool = None
+    idle = False
+
+    def close(self):
+        if self.pool is not None and self.pool.release(self):
+            return
+        super().close()
+
+
+class ConnectionPool:
+    """
+    Keeps up to `size` idle connections to one database. Each connection is used
+    by one thread at a time: a thread takes it with connect() and returns it with close().
+    """
+
+    def __init__(self, db_name, size=DB_POOL_SIZE):
+        self.db_name = db_name
+        self.size = size
+        self.idle = queue.LifoQueue()
+
+    def connect(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = open_connection(self.db_name, factory=PooledConnection)
+            conn.pool = self
+        conn.idle = False
+        return conn
+
+    def release(self, conn):
+        """Take a connection back; False if the pool is full and it should really close"""
+        if conn.idle:
+            # Closed twice; it is already back in the pool
+            return True
+        try:
+            # Never hand out a connection with someone else's open transaction
+            conn.rollback()
+        except sqlite3.Error:
+            return False
+        if self.idle.qsize() >= self.size:
+            return False
+        conn.idle = True
+        self.idle.put(conn)
+        return True
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.pool = None
+            conn.close()
+
+
+def open_connection(db_name=None, factory=TimedConnection):
+    """New connection with WAL mode and the standard pragmas applied"""
+    conn = sqlite3.connect(db_name or DB_NAME, timeout=DB_BUSY_TIMEOUT, factory=factory,
+                           check_same_thread=False)
+    # WAL lets readers run alongside a writer instead of failing with "database is locked"
+    conn.execute(f'PRAGMA journal_mode = {DB_JOURNAL_MODE}')
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name=None):
+    db_name = db_name or DB_NAME
+    with _pools_lock:
+        if db_name not in _pools:
+            _pools[db_name] = ConnectionPool(db_name)
+        return _pools[db_name]
+
+
+def connect(db_name=None):
+    """Pooled connection to the database; call close() to return it"""
+    return get_pool(db_name).connect()
+
+
+def add_column(cursor, table, column, declaration):
+    """Add a column to an existing table if it isn't there yet"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+
+def reserve_id(conn, table):
+    """
+    Claim the next id of an AUTOINCREMENT table before its row is written, so rows
+    that refer to it can be stored first. Run it in a write transaction
+    (BEGIN IMMEDIATE) so two callers can't claim the same id.
+    """
+    c = conn.cursor()
+    c.execute(f"SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0), "
+              f"COALESCE((SELECT MAX(id) FROM {table}), 0))", (table,))
+    reserved = c.fetchone()[0] + 1
+    c.execute('UPDATE sqlite_sequence SET seq = ? WHERE name = ?', (reserved, table))
+    if not c.rowcount:
+        c.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, reserved))
+    return reserved
+
+
+# --- Migrations ---
+# Each migration runs once, in order, inside a transaction; user_version records
+# how many have been applied. Append new ones to the end, never edit applied ones.
+
+def _initial_schema(conn):
+    """Every table up to the introduction of migrations (safe on existing databases)"""
+    import blob_store
+    from answer_cache import init_cache_table
+    from ingest_jobs import init_jobs_table
+
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS pdfs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            filepath TEXT NOT NULL,
+            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            content_text TEXT,
+            module_name TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pdf_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(pdf_id) REFERENCES pdfs(id)
+        )
+    ''')
+    # SHA-256 of the uploaded file, used to deduplicate uploads (see blob_store.py)
+    add_column(c, 'pdfs', 'content_hash', 'TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_pdfs_content_hash ON pdfs(content_hash)')
+    blob_store.backfill_content_hashes(conn)
+    # Listing metadata, so /api/modules never has to read content_text
+    add_column(c, 'pdfs', 'page_count', 'INTEGER')
+    add_column(c, 'pdfs', 'text_length', 'INTEGER')
+    c.execute('''
+        UPDATE pdfs SET text_length = length(content_text),
+            page_count = CASE WHEN filepath = '' THEN NULL
+                ELSE (length(content_text) - length(replace(content_text, '--- Page ', ''))) / length('--- Page ') END
+        WHERE text_length IS NULL
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_pdfs_upload_date ON pdfs(upload_date DESC, id DESC)')
+    # Inverted index for the local keyword fallback (see search_index.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS index_paragraphs (
+            pdf_id INTEGER NOT NULL,
+            para_no INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (pdf_id, para_no)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS index_terms (
+            pdf_id INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            postings TEXT NOT NULL,
+            PRIMARY KEY (pdf_id, term)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS index_stats (
+            pdf_id INTEGER PRIMARY KEY,
+            paragraph_count INTEGER NOT NULL,
+            avg_length REAL NOT NULL
+        )
+    ''')
+    # Overlapping chunks used to build LLM prompts (see retrieval.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chunks (
+            pdf_id INTEGER NOT NULL,
+            chunk_no INTEGER NOT NULL,
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (pdf_id, chunk_no)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_terms (
+            pdf_id INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            postings TEXT NOT NULL,
+            PRIMARY KEY (pdf_id, term)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_stats (
+            pdf_id INTEGER PRIMARY KEY,
+            chunk_count INTEGER NOT NULL,
+            avg_length REAL NOT NULL
+        )
+    ''')
+    init_jobs_table(conn)
+    init_cache_table(conn)
+
+
+def _conversation_indexes(conn):
+    """History is always read per module in timestamp order"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_conversations_pdf_time ON conversations(pdf_id, timestamp)')
+
+
+def _page_table(conn):
+    """Per-page text (see pages.py); moves existing PDF text out of pdfs.content_text"""
+    import pages
+    pages.init_pages_table(conn)
+    pages.backfill_pages(conn)
+
+
+def _fulltext_table(conn):
+    """Library-wide FTS5 search (see fulltext.py), filled from every existing module"""
+    import fulltext
+    import pages
+    fulltext.init_fts_table(conn)
+    if not fulltext.has_table(conn):
+        return
+    for (pdf_id,) in conn.execute('SELECT id FROM pdfs').fetchall():
+        fulltext.index_text(conn, pdf_id, pages.load_text(conn, pdf_id))
+
+
+def _contentless_fulltext(conn):
+    """Rebuild pages_fts without its own copy of every page (see fulltext.py)"""
+    import fulltext
+    if fulltext.has_table(conn) and not fulltext.is_contentless(conn):
+        conn.execute('DROP TABLE pages_fts')
+        _fulltext_table(conn)
+
+
+def _quiz_bank_table(conn):
+    """Precomputed MCQs per module (see quiz_bank.py)"""
+    from quiz_bank import init_quiz_table
+    init_quiz_table(conn)
+
+
+def _local_mcq_tables(conn):
+    """Sentence index for offline quizzes (see local_mcq.py); modules are indexed on first use"""
+    from local_mcq import init_local_mcq_tables
+    init_local_mcq_tables(conn)
+
+
+def _llm_usage_table(conn):
+    """Per-call LLM token/latency accounting (see llm_usage.py)"""
+    from llm_usage import init_usage_table
+    init_usage_table(conn)
+
+
+def _conversation_history(conn):
+    """Paged history by id, compressed long answers and the archive table (see conversations.py)"""
+    from conversations import init_history_tables
+    init_history_tables(conn)
+
+
+def _session_memory(conn):
+    """Session ids on conversations and running session summaries (see conversation_memory.py)"""
+    from conversation_memory import init_memory_tables
+    init_memory_tables(conn)
+
+
+def _active_ingest_jobs(conn):
+    """One queued or running ingest job per content hash (see ingest_jobs.py)"""
+    from ingest_jobs import init_active_job_index
+    init_active_job_index(conn)
+
+
+def _conversation_archive_index(conn):
+    """Timestamp index for archiving old conversations across modules"""
+    from conversations import init_archive_index
+    init_archive_index(conn)
+
+
+def _quiz_bank_generation(conn):
+    """Counter that tells quiz bank fills when a module's bank was reset under them"""
+    from quiz_bank import init_bank_generation
+    init_bank_generation(conn)
+
+
+def _conversation_time_index(conn):
+    """Restore the (pdf_id, timestamp) index that the conversation_history migration used to drop"""
+    from conversations import init_time_index
+    init_time_index(conn)
+
+
+def _answer_cache_keys(conn):
+    """Rekey cached answers stored before near-duplicate lookups read the stored keys"""
+    from answer_cache import rekey
+    rekey(conn)
+
+
+MIGRATIONS = [
+    _initial_schema,
+    _conversation_indexes,
+    _page_table,
+    _fulltext_table,
+    _quiz_bank_table,
+    _local_mcq_tables,
+    _llm_usage_table,
+    _conversation_history,
+    _session_memory,
+    _active_ingest_jobs,
+    _conversation_archive_index,
+    _quiz_bank_generation,
+    _conversation_time_index,
+    _answer_cache_keys,
+    _contentless_fulltext,
+]
+
+
+def migrate(db_name=None):
+    """Apply pending migrations; returns the resulting schema version"""
+    conn = open_connection(db_name)
+    try:
+        # IMMEDIATE takes the write lock up front, so concurrent starts apply each migration once
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+            print(f"Applied database migration {number}: {migration.__name__.strip('_')}")
+        conn.commit()
+        return len(MIGRATIONS) if version < len(MIGRATIONS) else version
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
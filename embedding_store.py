@@ -0,0 +1,235 @@
+"""
+Embedding store module - local vector search over module chunks
+Vectors live in one memory-mapped float32 matrix per module on disk;
+search is brute-force cosine with NumPy, or IVF (cluster-pruned) for large modules
+"""
+import os
+import json
+import zlib
+import numpy as np
+from llm_client import get_client
+from llm_usage import recorder as usage
+from search_index import tokenize
+
+EMBEDDINGS_DIR = os.getenv('EMBEDDINGS_DIR', os.path.join('indexes', 'embeddings'))
+EMBEDDER = os.getenv('EMBEDDER', 'hashing')
+HASHING_DIM = int(os.getenv('HASHING_DIM', 512))
+
+# IVF is built automatically once a module has this many chunks
+IVF_MIN_VECTORS = int(os.getenv('IVF_MIN_VECTORS', 20000))
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', 32))
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 50000
+SEARCH_BATCH = 65536
+
+
+def _normalize(vectors):
+    """L2-normalize rows so a dot product is a cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class HashingEmbedder:
+    """
+    Deterministic offline embedder using the hashing trick.
+    Unigrams and bigrams are hashed into a fixed number of signed buckets.
+    """
+    name = 'hashing'
+
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+
+    def _features(self, text):
+        tokens = tokenize(text)
+        return tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts):
+        """Return an (n, dim) float32 matrix of unit vectors"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode('utf-8'))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                matrix[row, h % self.dim] += sign
+        return _normalize(matrix)
+
+
+class OpenAIEmbedder:
+    """Embedder backed by an OpenAI-compatible /embeddings endpoint"""
+    name = 'openai'
+
+    def __init__(self, model=None, batch_size=256):
+        self.model = model or os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+        self.batch_size = batch_size
+
+    def embed(self, texts):
+        """Return an (n, dim) float32 matrix of unit vectors"""
+        client = get_client()
+        if client is None:
+            raise ValueError("The openai embedder needs OPENAI_API_KEY to be set")
+        rows = []
+        for i in range(0, len(texts), self.batch_size):
+            payload = {"model": self.model, "input": texts[i:i + self.batch_size]}
+            with usage.track('embedding', payload) as call:
+                response = client.post('/embeddings', payload, timeout=60)
+                call.response(response)
+            data = sorted(response['data'], key=lambda d: d['index'])
+            rows.extend(d['embedding'] for d in data)
+        return _normalize(np.asarray(rows, dtype=np.float32))
+
+
+EMBEDDERS = {
+    'hashing': HashingEmbedder,
+    'openai': OpenAIEmbedder,
+}
+
+
+def get_embedder(name=None):
+    """Create the embedder selected by name or the EMBEDDER environment variable"""
+    name = name or EMBEDDER
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder '{name}'. Choose from: {', '.join(EMBEDDERS)}")
+    return EMBEDDERS[name]()
+
+
+def kmeans(vectors, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means on unit vectors; returns (k, dim) unit centroids"""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > KMEANS_SAMPLE:
+        sample = vectors[np.sort(rng.choice(len(vectors), KMEANS_SAMPLE, replace=False))]
+    sample = np.asarray(sample, dtype=np.float32)
+
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(k):
+            members = sample[assignment == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters so every list gets used
+                centroids[cluster] = sample[rng.integers(len(sample))]
+        centroids = _normalize(centroids)
+    return centroids
+
+
+def _assign(vectors, centroids):
+    """Nearest-centroid assignment, batched to bound memory"""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SEARCH_BATCH):
+        batch = np.asarray(vectors[start:start + SEARCH_BATCH])
+        assignment[start:start + SEARCH_BATCH] = np.argmax(batch @ centroids.T, axis=1)
+    return assignment
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+class EmbeddingStore:
+    """
+    Per-module vector files under `root`:
+      <pdf_id>.f32   float32 matrix (count x dim), memory-mapped for search
+      <pdf_id>.npz   row -> chunk id mapping, plus IVF centroids/list offsets when built
+      <pdf_id>.json  metadata (dim, count, embedder, ivf)
+    """
+
+    def __init__(self, root=EMBEDDINGS_DIR):
+        self.root = root
+
+    def _path(self, pdf_id, ext):
+        return os.path.join(self.root, f'{pdf_id}.{ext}')
+
+    def save(self, pdf_id, vectors, ids, embedder_name, ivf=None):
+        """
+        Write vectors for a module, replacing any existing ones.
+        `ivf` forces IVF on or off; by default it is built for large modules.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        count, dim = vectors.shape if vectors.ndim == 2 else (0, 0)
+        if ivf is None:
+            ivf = count >= IVF_MIN_VECTORS
+
+        sidecar = {'ids': ids}
+        if ivf and count:
+            # Store rows grouped by cluster so each inverted list is one contiguous slice
+            n_lists = max(1, int(np.sqrt(count)))
+            centroids = kmeans(vectors, n_lists)
+            assignment = _assign(vectors, centroids)
+            order = np.argsort(assignment, kind='stable')
+            vectors = vectors[order]
+            sidecar['ids'] = ids[order]
+            sidecar['centroids'] = centroids
+            sidecar['offsets'] = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+
+        vectors.tofile(self._path(pdf_id, 'f32'))
+        np.savez(self._path(pdf_id, 'npz'), **sidecar)
+        with open(self._path(pdf_id, 'json'), 'w') as f:
+            json.dump({'dim': dim, 'count': count, 'embedder': embedder_name, 'ivf': bool(ivf and count)}, f)
+
+    def load(self, pdf_id):
+        """Return (meta, memmap matrix, sidecar arrays) or None if the module has no vectors"""
+        meta_path = self._path(pdf_id, 'json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        with np.load(self._path(pdf_id, 'npz')) as data:
+            sidecar = {key: data[key] for key in data.files}
+        if not meta['count']:
+            return meta, np.zeros((0, meta['dim']), dtype=np.float32), sidecar
+        matrix = np.memmap(self._path(pdf_id, 'f32'), dtype=np.float32, mode='r',
+                           shape=(meta['count'], meta['dim']))
+        return meta, matrix, sidecar
+
+    def has(self, pdf_id):
+        return os.path.exists(self._path(pdf_id, 'json'))
+
+    def delete(self, pdf_id):
+        """Remove a module's vector files"""
+        for ext in ('f32', 'npz', 'json'):
+            path = self._path(pdf_id, ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def search(self, pdf_id, query_vector, top_k=5, nprobe=IVF_NPROBE, exact=False):
+        """
+        Cosine top-k for one module. Returns a list of (score, chunk_id), best first.
+        Uses IVF when the module has it unless `exact` is set.
+        """
+        loaded = self.load(pdf_id)
+        if loaded is None:
+            return []
+        meta, matrix, sidecar = loaded
+        if not meta['count']:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+
+        if meta['ivf'] and not exact:
+            # Only scan the inverted lists whose centroids are closest to the query
+            offsets = sidecar['offsets']
+            probes = _top_k(sidecar['centroids'] @ query, nprobe)
+            rows = np.concatenate([np.arange(offsets[p], offsets[p + 1]) for p in probes])
+            if not len(rows):
+                return []
+            scores = np.concatenate([
+                np.asarray(matrix[offsets[p]:offsets[p + 1]]) @ query for p in probes
+            ])
+        else:
+            rows = np.arange(meta['count'])
+            scores = np.concatenate([
+                np.asarray(matrix[start:start + SEARCH_BATCH]) @ query
+                for start in range(0, meta['count'], SEARCH_BATCH)
+            ])
+
+        best = _top_k(scores, top_k)
+        return [(float(scores[i]), int(sidecar['ids'][rows[i]])) for i in best]
@@ -1,11 +1,18 @@
 import React, { useState, useEffect } from 'react';
 import './App.css';
 
+// Id for a new chat session; the server keeps the history of questions sent with it
+const newSessionId = () =>
+  Array.from(crypto.getRandomValues(new Uint8Array(16)), b => b.toString(16).padStart(2, '0')).join('');
+
 function App() {
   const [modules, setModules] = useState([]);
   const [selectedModule, setSelectedModule] = useState(null);
   const [question, setQuestion] = useState('');
   const [conversations, setConversations] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
+  // Chat session for follow-up questions; a new one starts per selected module
+  const [sessionId, setSessionId] = useState(null);
   const [loading, setLoading] = useState(false);
   const [uploadProgress, setUploadProgress] = useState(0);
 
@@ -18,6 +25,7 @@ function App() {
 
   // Fetch conversations when module selected
   useEffect(() => {
+    setSessionId(selectedModule ? newSessionId() : null);
     if (selectedModule) {
       fetchConversations(selectedModule.id);
     }
@@ -25,24 +33,81 @@ function App() {
 
   const fetchModules = async () => {
     try {
-      const res = await fetch(`${API_BASE}/modules`);
-      const data = await res.json();
-      setModules(data.modules || []);
+      // The listing is paginated; follow next_cursor until every page is loaded
+      const all = [];
+      let cursor = null;
+      do {
+        const query = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+        const res = await fetch(`${API_BASE}/modules?limit=200${query}`);
+        const data = await res.json();
+        all.push(...(data.modules || []));
+        cursor = data.next_cursor;
+      } while (cursor);
+      setModules(all);
     } catch (error) {
       console.error('Error fetching modules:', error);
     }
   };
 
+  // History is newest first; the first page is loaded here and older pages on demand
   const fetchConversations = async (pdfId) => {
     try {
       const res = await fetch(`${API_BASE}/conversations/${pdfId}`);
       const data = await res.json();
       setConversations(data.conversations || []);
+      setOlderCursor(data.next_cursor);
     } catch (error) {
       console.error('Error fetching conversations:', error);
     }
   };
 
+  const fetchOlderConversations = async () => {
+    try {
+      const res = await fetch(`${API_BASE}/conversations/${selectedModule.id}?cursor=${olderCursor}`);
+      const data = await res.json();
+      setConversations((current) => [...current, ...(data.conversations || [])]);
+      setOlderCursor(data.next_cursor);
+    } catch (error) {
+      console.error('Error fetching conversations:', error);
+    }
+  };
+
+  // After asking, fetch only what was added since the newest conversation shown
+  const fetchNewConversations = async (pdfId) => {
+    try {
+      let since = conversations.length ? conversations[0].id : 0;
+      let added = [];
+      let hasMore = true;
+      while (hasMore) {
+        const res = await fetch(`${API_BASE}/conversations/${pdfId}?since=${since}`);
+        const data = await res.json();
+        const rows = data.conversations || [];
+        if (!rows.length) break;
+        // Rows come back oldest first
+        added = [...rows.reverse(), ...added];
+        since = added[0].id;
+        hasMore = data.has_more;
+      }
+      setConversations((current) => [...added, ...current]);
+    } catch (error) {
+      console.error('Error fetching conversations:', error);
+    }
+  };
+
+  // Uploads are processed in the background; poll the job and show page progress
+  const waitForIngestJob = async (jobId) => {
+    while (true) {
+      const res = await fetch(`${API_BASE}/jobs/${jobId}`);
+      const job = await res.json();
+      if (!res.ok || job.status === 'failed') {
+        throw new Error(job.error || 'Processing failed');
+      }
+      setUploadProgress(Math.round((job.progress || 0) * 100));
+      if (job.status === 'done') return job;
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleFileUpload = async (e) => {
     const file = e.target.files[0];
     if (!file) return;
@@ -59,6 +124,9 @@ function App() {
       });
       const data = await res.json();
       if (data.success) {
+        if (data.job_id) {
+          await waitForIngestJob(data.job_id);
+        }
         alert('PDF uploaded successfully!');
         fetchModules();
         setUploadProgress(0);
@@ -84,13 +152,14 @@ function App() {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
           pdf_id: selectedModule.id,
-          question: question
+          question: question,
+          ...(sessionId && { session_id: sessionId })
         })
       });
       const data = await res.json();
       if (data.success) {
         setQuestion('');
-        fetchConversations(selectedModule.id);
+        fetchNewConversations(selectedModule.id);
       }
     } catch (error) {
       console.error('Error asking question:', error);
@@ -188,8 +257,8 @@ function App() {
                   {conversations.length === 0 ? (
                     <p className="empty">No questions yet. Ask something to get started!</p>
                   ) : (
-                    conversations.map((conv, idx) => (
-                      <div key={idx} className="conversation-item">
+                    conversations.map((conv) => (
+                      <div key={conv.id} className="conversation-item">
                         <div className="question">
                           <strong>Q:</strong> {conv.question}
                         </div>
@@ -199,6 +268,9 @@ function App() {
                       </div>
                     ))
                   )}
+                  {olderCursor && (
+                    <button onClick={fetchOlderConversations}>Load older questions</button>
+                  )}
                 </div>
               </div>
 
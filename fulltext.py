@@ -0,0 +1,214 @@
+"""
+Full-text module - library-wide search with SQLite FTS5
+Every page of every module is a row of the pages_fts virtual table, so a search
+across the whole library is one indexed MATCH query ranked by FTS5's bm25().
+Typed concepts (no pages) are indexed as a single row with no page number.
+
+pages_fts is contentless: it holds only the term index, and page text is read
+back from pdf_pages (or pdfs.content_text) for snippets. Removing a row from a
+contentless table means handing FTS5 the text it indexed, so a module's rows
+must be deleted before its stored text changes.
+"""
+import sqlite3
+import pages
+from pages import split_pages
+from search_index import MemoryIndex, tokenize
+
+# Row ids are pdf_id * ROWID_STRIDE + page_no (0 for a typed concept), so a
+# module's rows can be found by rowid range and each row knows its page
+ROWID_STRIDE = 100000
+SNIPPET_TOKENS = 24
+
+
+def _probe():
+    try:
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE VIRTUAL TABLE probe USING fts5(text)')
+        conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+FTS5_AVAILABLE = _probe()
+
+
+def init_fts_table(conn):
+    """Create the pages_fts table (skipped when SQLite was built without FTS5)"""
+    if not FTS5_AVAILABLE:
+        print("SQLite has no FTS5 support; library search is disabled")
+        return
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+            text,
+            content = '',
+            tokenize = 'porter unicode61'
+        )
+    ''')
+
+
+def has_table(conn):
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'pages_fts'")
+    return c.fetchone() is not None
+
+
+def is_contentless(conn):
+    """Whether pages_fts is the contentless table (older databases kept a copy of every page)"""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'pages_fts'").fetchone()
+    return bool(row) and "content = ''" in row[0]
+
+
+def _rowid_range(pdf_id):
+    return pdf_id * ROWID_STRIDE, pdf_id * ROWID_STRIDE + ROWID_STRIDE - 1
+
+
+def page_texts(conn, pdf_id, page_nos):
+    """
+    {page_no: text} for the given pages of a module, read from where the module
+    keeps its text; page 0 is the whole text of a module without pages
+    """
+    wanted = set(page_nos)
+    found = {}
+    numbered = wanted - {0}
+    if numbered:
+        found = {page['page_no']: page['text'] for page in pages.load_pages(conn, pdf_id, min(numbered), max(numbered))
+                 if page['page_no'] in numbered}
+    if wanted - set(found):
+        row = conn.execute('SELECT content_text FROM pdfs WHERE id = ?', (pdf_id,)).fetchone()
+        text = (row[0] or '') if row else ''
+        split = split_pages(text) or []
+        for page_no in wanted - set(found):
+            if page_no == 0:
+                found[0] = text
+            elif page_no <= len(split):
+                found[page_no] = split[page_no - 1]
+    return found
+
+
+def delete_module(conn, pdf_id):
+    """Remove a module's rows; its pages (or content_text) must still hold the text that was indexed"""
+    if not has_table(conn):
+        return
+    rowids = [row[0] for row in conn.execute('SELECT rowid FROM pages_fts WHERE rowid BETWEEN ? AND ?',
+                                             _rowid_range(pdf_id))]
+    if not rowids:
+        return
+    texts = page_texts(conn, pdf_id, [rowid % ROWID_STRIDE for rowid in rowids])
+    conn.executemany("INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', ?, ?)",
+                     [(rowid, texts.get(rowid % ROWID_STRIDE, '')) for rowid in rowids])
+
+
+def index_text(conn, pdf_id, text):
+    """(Re)index a module's whole-document text, one row per page when it has page markers"""
+    if not has_table(conn):
+        return
+    page_texts = split_pages(text)
+    if page_texts is not None:
+        index_pages(conn, pdf_id, page_texts)
+        return
+    delete_module(conn, pdf_id)
+    conn.execute('INSERT INTO pages_fts (rowid, text) VALUES (?, ?)', (pdf_id * ROWID_STRIDE, text or ''))
+
+
+def index_pages(conn, pdf_id, page_texts):
+    """(Re)index a module from its page texts (any iterable, consumed once)"""
+    if not has_table(conn):
+        return
+    delete_module(conn, pdf_id)
+    conn.executemany('INSERT INTO pages_fts (rowid, text) VALUES (?, ?)',
+                     ((pdf_id * ROWID_STRIDE + page_no, page_text)
+                      for page_no, page_text in enumerate(page_texts, start=1) if page_text.strip()))
+
+
+def _matches(word, terms):
+    """Whether a word of page text is one of the query terms, give or take a suffix"""
+    for token in tokenize(word):
+        for term in terms:
+            shared = min(len(token), len(term))
+            if token[:max(3, shared - 2)] == term[:max(3, shared - 2)]:
+                return True
+    return False
+
+
+def make_snippet(text, query, size=SNIPPET_TOKENS):
+    """About `size` words of text around the first query term, with matching words in [brackets]"""
+    terms = set(tokenize(query))
+    words = text.split()
+    hits = [i for i, word in enumerate(words) if _matches(word, terms)]
+    start = max(0, min(hits[0] - size // 4, len(words) - size)) if hits else 0
+    end = start + size
+    shown = [f'[{word}]' if i in hits else word for i, word in enumerate(words[start:end], start=start)]
+    return ('...' if start else '') + ' '.join(shown) + ('...' if end < len(words) else '')
+
+
+def match_expression(query, any_term=False):
+    """FTS5 MATCH string for free text: every word quoted, joined with AND (or OR)"""
+    terms = dict.fromkeys(tokenize(query))
+    return (' OR ' if any_term else ' ').join(f'"{term}"' for term in terms)
+
+
+def search(conn, query, limit=20, pdf_id=None):
+    """
+    Ranked hits for a free-text query across the library (or one module):
+    dicts with pdf_id, module_name, page, snippet and score (higher is better).
+    Falls back to matching any word when no page contains all of them.
+    """
+    if not has_table(conn) or not tokenize(query):
+        return []
+    sql = '''
+        SELECT f.rowid, p.module_name, bm25(pages_fts)
+        FROM pages_fts f JOIN pdfs p ON p.id = f.rowid / ?
+        WHERE pages_fts MATCH ?
+    '''
+    params = []
+    if pdf_id is not None:
+        sql += ' AND f.rowid BETWEEN ? AND ?'
+        params.extend(_rowid_range(pdf_id))
+    sql += ' ORDER BY bm25(pages_fts) LIMIT ?'
+
+    c = conn.cursor()
+    for any_term in (False, True):
+        c.execute(sql, (ROWID_STRIDE, match_expression(query, any_term), *params, limit))
+        rows = c.fetchall()
+        if rows:
+            break
+    hits = []
+    for rowid, module_name, score in rows:
+        hit_pdf_id, page_no = divmod(rowid, ROWID_STRIDE)
+        text = page_texts(conn, hit_pdf_id, [page_no]).get(page_no, '')
+        hits.append({'pdf_id': hit_pdf_id, 'module_name': module_name, 'page': page_no or None,
+                     'snippet': make_snippet(text, query), 'score': round(-score, 4)})
+    return hits
+
+
+class PageIndex:
+    """
+    Local keyword fallback backed by FTS5: finds the best pages of a module with
+    one MATCH query, then the best paragraphs within those pages.
+    """
+    candidate_pages = 3
+
+    def __init__(self, conn, pdf_id):
+        self.conn = conn
+        self.pdf_id = pdf_id
+
+    def search(self, query, top_k=1):
+        """Return up to top_k (score, paragraph text) pairs for the query"""
+        if not tokenize(query):
+            return []
+        c = self.conn.cursor()
+        rowids = []
+        for any_term in (False, True):
+            c.execute('''
+                SELECT rowid FROM pages_fts
+                WHERE pages_fts MATCH ? AND rowid BETWEEN ? AND ?
+                ORDER BY bm25(pages_fts) LIMIT ?
+            ''', (match_expression(query, any_term), *_rowid_range(self.pdf_id), self.candidate_pages))
+            rowids = [row[0] for row in c.fetchall()]
+            if rowids:
+                break
+        if not rowids:
+            return []
+        texts = page_texts(self.conn, self.pdf_id, [rowid % ROWID_STRIDE for rowid in rowids])
+        return MemoryIndex('\n\n'.join(texts[n] for n in sorted(texts))).search(query, top_k)
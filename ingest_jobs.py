@@ -0,0 +1,258 @@
+"""
+Ingestion job queue - runs PDF extraction and indexing in a bounded background
+worker pool so /api/upload can respond immediately. Jobs are persisted in SQLite
+and re-queued on startup if the server stopped while they were pending.
+"""
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from metrics import span
+from pdf_processor import iter_pages
+import answer_cache
+import blob_store
+import db
+import local_mcq
+import pages
+import quiz_bank
+import retrieval
+
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 2))
+
+# Don't write progress to the database more often than this (seconds)
+PROGRESS_INTERVAL = 0.5
+
+JOB_COLUMNS = ('id', 'filename', 'filepath', 'module_name', 'content_hash', 'status', 'pages_total',
+               'pages_done', 'pdf_id', 'error', 'created_at', 'updated_at')
+
+
+def init_jobs_table(conn):
+    """Create the ingest_jobs table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            filepath TEXT NOT NULL,
+            module_name TEXT,
+            content_hash TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            pages_total INTEGER,
+            pages_done INTEGER NOT NULL DEFAULT 0,
+            pdf_id INTEGER,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(ingest_jobs)')]
+    if 'content_hash' not in columns:
+        conn.execute('ALTER TABLE ingest_jobs ADD COLUMN content_hash TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status)')
+
+
+def init_active_job_index(conn):
+    """At most one queued or running job per content hash, enforced by a unique partial index"""
+    # Duplicates queued before the index existed would all run; keep the oldest of each
+    conn.execute('''
+        UPDATE ingest_jobs SET status = 'failed', error = 'Duplicate of another job for the same file'
+        WHERE status IN ('queued', 'running') AND content_hash IS NOT NULL AND rowid NOT IN (
+            SELECT MIN(rowid) FROM ingest_jobs
+            WHERE status IN ('queued', 'running') AND content_hash IS NOT NULL
+            GROUP BY content_hash
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_ingest_jobs_active_hash ON ingest_jobs(content_hash)
+        WHERE status IN ('queued', 'running')
+    ''')
+
+
+class IngestQueue:
+    """Bounded pool of ingestion workers backed by the ingest_jobs table"""
+
+    def __init__(self, db_name, workers=INGEST_WORKERS, on_ingested=None):
+        self.db_name = db_name
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+        # Called with the new pdf_id after a module is stored (e.g. to build its quiz bank)
+        self.on_ingested = on_ingested
+
+    def _connect(self):
+        return db.connect(self.db_name)
+
+    def _update(self, job_id, conn=None, **fields):
+        """Update job columns; commits unless the caller passes its own connection"""
+        fields['updated_at'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        own_conn = conn is None
+        if not own_conn:
+            conn.execute(f'UPDATE ingest_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+            return
+        conn = self._connect()
+        try:
+            conn.execute(f'UPDATE ingest_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def submit(self, filename, filepath, module_name, content_hash=None):
+        """
+        Record a new job and schedule it; returns (job_id, created). If a job for
+        the same content is already queued or running, that one is returned
+        instead, with created False.
+        """
+        job_id = uuid.uuid4().hex
+        while True:
+            conn = self._connect()
+            try:
+                conn.execute('''
+                    INSERT INTO ingest_jobs (id, filename, filepath, module_name, content_hash)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (job_id, filename, filepath, module_name, content_hash))
+                conn.commit()
+                break
+            except sqlite3.IntegrityError:
+                # idx_ingest_jobs_active_hash: an identical upload got there first
+                conn.rollback()
+            finally:
+                conn.close()
+            active = self.find_active(content_hash)
+            if active:
+                return active, False
+            # It finished in the meantime; try again
+        self.executor.submit(self._run, job_id)
+        return job_id, True
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it doesn't exist"""
+        job = self._load(job_id)
+        if job and job['status'] != 'done':
+            # Until the job is done its pdf_id is only reserved; no module has it yet
+            job['pdf_id'] = None
+        return job
+
+    def _load(self, job_id):
+        conn = self._connect()
+        try:
+            c = conn.cursor()
+            c.execute(f'SELECT {", ".join(JOB_COLUMNS)} FROM ingest_jobs WHERE id = ?', (job_id,))
+            row = c.fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        job['progress'] = round(job['pages_done'] / job['pages_total'], 3) if job['pages_total'] else 0.0
+        return job
+
+    def find_active(self, content_hash):
+        """Id of a queued or running job for the same content, if any"""
+        conn = self._connect()
+        try:
+            c = conn.cursor()
+            c.execute('''
+                SELECT id FROM ingest_jobs
+                WHERE content_hash = ? AND status IN ('queued', 'running')
+                ORDER BY created_at LIMIT 1
+            ''', (content_hash,))
+            row = c.fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def resume(self):
+        """Re-queue jobs left queued or running by a previous process"""
+        conn = self._connect()
+        try:
+            c = conn.cursor()
+            c.execute("SELECT id FROM ingest_jobs WHERE status IN ('queued', 'running') ORDER BY created_at")
+            job_ids = [row[0] for row in c.fetchall()]
+        finally:
+            conn.close()
+        for job_id in job_ids:
+            self._update(job_id, status='queued', pages_done=0)
+            self.executor.submit(self._run, job_id)
+        return len(job_ids)
+
+    def _run(self, job_id):
+        job = self._load(job_id)
+        if not job or job['status'] not in ('queued', 'running'):
+            return
+        self._update(job_id, status='running')
+
+        last_write = [0.0]
+
+        def on_page(pages_done, pages_total):
+            now = time.monotonic()
+            if pages_done == pages_total or now - last_write[0] >= PROGRESS_INTERVAL:
+                last_write[0] = now
+                self._update(job_id, pages_done=pages_done, pages_total=pages_total)
+
+        conn = self._connect()
+        pdf_id = None
+        ingested = False
+        try:
+            # An identical upload may have finished while this one was queued
+            existing = job['content_hash'] and blob_store.find_module_by_hash(conn, job['content_hash'])
+            if existing:
+                if job['pdf_id']:
+                    pages.delete_pages(conn, job['pdf_id'])
+                self._update(job_id, conn=conn, status='done', pdf_id=existing[0])
+                conn.commit()
+                return
+
+            # The module id is claimed up front so pages can be committed as they are
+            # extracted; the pdfs row is written last, so the module stays invisible
+            # until it is complete. A resumed job reuses its id and drops its old pages.
+            conn.execute('BEGIN IMMEDIATE')
+            pdf_id = job['pdf_id'] or db.reserve_id(conn, 'pdfs')
+            pages.delete_pages(conn, pdf_id)
+            if job['pdf_id']:
+                # Nothing cached or banked for the id may outlive the content it is re-ingesting
+                answer_cache.invalidate_module(conn, pdf_id)
+                quiz_bank.delete_module(conn, pdf_id)
+            self._update(job_id, conn=conn, pdf_id=pdf_id)
+            conn.commit()
+
+            page_count = text_length = 0
+            with span('pdf_extract'):
+                rows = pages.encode_pages(iter_pages(job['filepath'], progress=on_page))
+                for batch in pages.batches(rows):
+                    pages.insert_encoded_pages(conn, pdf_id, batch)
+                    conn.commit()
+                    page_count, text_length = batch[-1][0], batch[-1][2]
+            if not page_count:
+                raise ValueError("no pages could be read")
+
+            # The indexes read the stored pages back a batch at a time
+            retrieval.index_pages(conn, pdf_id, pages.StoredPages(conn, pdf_id))
+            local_mcq.build_page_sentence_index(conn, pdf_id, pages.StoredPages(conn, pdf_id))
+            # Text lives in pdf_pages; content_text is only used for typed concepts
+            conn.execute('''
+                INSERT INTO pdfs (id, filename, filepath, module_name, content_hash, page_count, text_length)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (pdf_id, job['filename'], job['filepath'], job['module_name'], job['content_hash'],
+                  page_count, text_length))
+            # Mark the job done in the same transaction so a restart can't ingest it twice
+            self._update(job_id, conn=conn, status='done', pdf_id=pdf_id)
+            conn.commit()
+            ingested = True
+        except Exception as e:
+            print(f"Ingest job {job_id} failed: {e}")
+            # Roll back the half-written indexes, then drop the pages already committed
+            conn.rollback()
+            if pdf_id is not None:
+                pages.delete_pages(conn, pdf_id)
+            self._update(job_id, conn=conn, status='failed', error=str(e))
+            conn.commit()
+            # Nothing points at the upload any more, unless another module or job shares it
+            blob_store.remove_unreferenced(conn, job['filepath'])
+        finally:
+            conn.close()
+
+        # Outside the try: a failing callback must not turn a finished job into a failed one
+        if ingested and self.on_ingested:
+            try:
+                self.on_ingested(pdf_id)
+            except Exception as e:
+                print(f"Post-ingest callback for module {pdf_id} failed: {e}")
@@ -0,0 +1,421 @@
+"""
+LLM client module - shared HTTP client for the OpenAI-compatible backend
+Keeps pooled keep-alive connections, retries 429/5xx and failed connects with
+exponential backoff and jitter, caps concurrent calls, and opens a circuit
+breaker when the provider keeps failing so callers can switch to the local
+fallback. A request that timed out waiting for the reply is not retried: the
+provider may still be working on (and billing) it. LLM_TIMEOUT is one deadline
+for the whole call, retries and backoff included.
+AsyncLLMClient does the same on an asyncio event loop (needs httpx) for asgi.py.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import span
+
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', 16))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 3))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 0.5))   # seconds
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', 8))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 30))               # seconds per call, retries included
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', 5))
+LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', 30))
+# Async mode multiplexes many more requests over one event loop
+LLM_ASYNC_POOL_SIZE = int(os.getenv('LLM_ASYNC_POOL_SIZE', 200))
+LLM_ASYNC_MAX_CONCURRENCY = int(os.getenv('LLM_ASYNC_MAX_CONCURRENCY', 1000))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The provider returned an error or could not be reached"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class LLMUnavailable(LLMError):
+    """The circuit breaker is open or no request slot freed up in time"""
+
+
+class CircuitBreaker:
+    """
+    Closed: requests flow. After `threshold` consecutive failures it opens and
+    rejects requests for `reset_timeout` seconds, then lets one trial request
+    through (half-open); success closes it again, failure re-opens it. A trial
+    that ends without either (e.g. an unexpected exception) must be handed back
+    with cancel_trial() so the next request can try.
+    """
+
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, reset_timeout=LLM_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Whether a request may be sent now: 'closed', 'trial' (the half-open trial) or False"""
+        with self.lock:
+            state = self._state()
+            if state == 'closed':
+                return 'closed'
+            if state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return 'trial'
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def cancel_trial(self):
+        """Give up the half-open trial without a verdict; the next request becomes the trial"""
+        with self.lock:
+            self.trial_in_flight = False
+
+
+class Deadline:
+    """Time left of one call's overall timeout"""
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+
+def backoff_delay(attempt, base, cap, retry_after=None):
+    """Seconds to wait before retry `attempt` (full jitter, honours a numeric Retry-After)"""
+    if retry_after and retry_after.replace('.', '', 1).isdigit():
+        return min(float(retry_after), cap)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class LLMClient:
+    """Pooled, retrying client for one OpenAI-compatible base URL"""
+
+    def __init__(self, base_url, api_key, pool_size=LLM_POOL_SIZE, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_retries=LLM_MAX_RETRIES, backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX,
+                 timeout=LLM_TIMEOUT, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after)
+
+    def _send(self, path, payload, stream, timeout):
+        """POST with retries; returns a 200 response or raises LLMError"""
+        permit = self.breaker.allow()
+        if not permit:
+            raise LLMUnavailable("LLM provider circuit is open")
+        settled = False
+        try:
+            response = self._attempt(path, payload, stream, timeout)
+            settled = True
+            return response
+        except LLMError:
+            settled = True
+            raise
+        finally:
+            if permit == 'trial' and not settled:
+                self.breaker.cancel_trial()
+
+    def _attempt(self, path, payload, stream, timeout):
+        """The retry loop of _send, within one deadline; records the outcome in the breaker"""
+        deadline = Deadline(timeout or self.timeout)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = self._backoff(attempt - 1, getattr(last_error, 'response', None))
+                if delay >= deadline.remaining():
+                    break
+                time.sleep(delay)
+            try:
+                response = self.session.post(f"{self.base_url}{path}", json=payload,
+                                             timeout=deadline.remaining(), stream=stream)
+            except (requests.ConnectionError, requests.ConnectTimeout) as e:
+                # Nothing reached the provider (or it hung up), so sending again is safe
+                last_error = LLMError(f"Could not reach LLM provider: {e}")
+                continue
+            except requests.Timeout as e:
+                self.breaker.record_failure()
+                raise LLMError(f"LLM provider timed out: {e}")
+
+            if response.status_code == 200:
+                self.breaker.record_success()
+                return response
+
+            error = LLMError(f"LLM provider returned {response.status_code}: {response.text[:200]}",
+                             status=response.status_code)
+            error.response = response
+            response.close()
+            if response.status_code not in RETRY_STATUSES:
+                # Client errors (bad request, auth) won't get better by retrying
+                self.breaker.record_success()
+                raise error
+            last_error = error
+
+        self.breaker.record_failure()
+        raise last_error
+
+    def _acquire(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise LLMUnavailable("Too many concurrent LLM requests")
+
+    def post(self, path, payload, timeout=None):
+        """POST JSON to `path` and return the decoded JSON response"""
+        self._acquire()
+        try:
+            with span('llm_http'):
+                return self._send(path, payload, False, timeout).json()
+        finally:
+            self.slots.release()
+
+    def chat(self, payload, timeout=None):
+        """Non-streaming chat completion; returns the response JSON"""
+        return self.post('/chat/completions', payload, timeout)
+
+    def chat_stream(self, payload, timeout=None):
+        """
+        Streaming chat completion; yields raw SSE lines.
+        Retries only happen before the first byte is received.
+        """
+        self._acquire()
+        try:
+            with span('llm_http'):
+                response = self._send('/chat/completions', dict(payload, stream=True), True, timeout)
+                with response:
+                    try:
+                        for line in response.iter_lines(decode_unicode=True):
+                            yield line
+                    except requests.RequestException as e:
+                        # Includes ChunkedEncodingError when the connection drops mid-body
+                        self.breaker.record_failure()
+                        raise LLMError(f"LLM stream interrupted: {e}")
+        finally:
+            self.slots.release()
+
+
+class AsyncLLMClient:
+    """
+    asyncio counterpart of LLMClient built on httpx.AsyncClient. Waiting on the
+    provider costs no thread, so thousands of calls can be in flight at once.
+    Create and use it on one event loop (see get_async_client).
+    """
+
+    def __init__(self, base_url, api_key, pool_size=LLM_ASYNC_POOL_SIZE,
+                 max_concurrency=LLM_ASYNC_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX, timeout=LLM_TIMEOUT, breaker=None):
+        import httpx
+        self.httpx = httpx
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.slots = asyncio.BoundedSemaphore(max_concurrency)
+        self.client = httpx.AsyncClient(
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"},
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=timeout
+        )
+
+    async def _acquire(self):
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise LLMUnavailable("Too many concurrent LLM requests")
+
+    async def _send(self, path, payload, stream, timeout):
+        """POST with retries; returns a 200 response (unread when streaming) or raises LLMError"""
+        permit = self.breaker.allow()
+        if not permit:
+            raise LLMUnavailable("LLM provider circuit is open")
+        settled = False
+        try:
+            response = await self._attempt(path, payload, stream, timeout)
+            settled = True
+            return response
+        except LLMError:
+            settled = True
+            raise
+        finally:
+            # Also covers the request being cancelled while it waits
+            if permit == 'trial' and not settled:
+                self.breaker.cancel_trial()
+
+    async def _attempt(self, path, payload, stream, timeout):
+        """The retry loop of _send, within one deadline; records the outcome in the breaker"""
+        deadline = Deadline(timeout or self.timeout)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                response = getattr(last_error, 'response', None)
+                retry_after = response.headers.get('Retry-After') if response is not None else None
+                delay = backoff_delay(attempt - 1, self.backoff_base, self.backoff_max, retry_after)
+                if delay >= deadline.remaining():
+                    break
+                await asyncio.sleep(delay)
+            request = self.client.build_request('POST', f"{self.base_url}{path}", json=payload,
+                                                timeout=deadline.remaining())
+            try:
+                response = await self.client.send(request, stream=stream)
+            except (self.httpx.ConnectError, self.httpx.ConnectTimeout, self.httpx.PoolTimeout) as e:
+                # Nothing reached the provider, so sending again is safe
+                last_error = LLMError(f"Could not reach LLM provider: {e!r}")
+                continue
+            except self.httpx.TransportError as e:
+                self.breaker.record_failure()
+                raise LLMError(f"LLM provider request failed: {e!r}")
+
+            if response.status_code == 200:
+                self.breaker.record_success()
+                return response
+
+            body = (await response.aread()).decode('utf-8', 'replace')
+            await response.aclose()
+            error = LLMError(f"LLM provider returned {response.status_code}: {body[:200]}",
+                             status=response.status_code)
+            error.response = response
+            if response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                raise error
+            last_error = error
+
+        self.breaker.record_failure()
+        raise last_error
+
+    async def post(self, path, payload, timeout=None):
+        """POST JSON to `path` and return the decoded JSON response"""
+        await self._acquire()
+        try:
+            with span('llm_http'):
+                response = await self._send(path, payload, False, timeout)
+                return response.json()
+        finally:
+            self.slots.release()
+
+    async def chat(self, payload, timeout=None):
+        """Non-streaming chat completion; returns the response JSON"""
+        return await self.post('/chat/completions', payload, timeout)
+
+    async def chat_stream(self, payload, timeout=None):
+        """
+        Streaming chat completion; yields raw SSE lines.
+        Retries only happen before the first byte is received.
+        """
+        await self._acquire()
+        try:
+            with span('llm_http'):
+                response = await self._send('/chat/completions', dict(payload, stream=True), True, timeout)
+                try:
+                    async for line in response.aiter_lines():
+                        yield line
+                except self.httpx.HTTPError as e:
+                    self.breaker.record_failure()
+                    raise LLMError(f"LLM stream interrupted: {e!r}")
+                finally:
+                    await response.aclose()
+        finally:
+            self.slots.release()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_clients = {}
+_breakers = {}
+_async_clients = weakref.WeakKeyDictionary()   # event loop -> {provider key: AsyncLLMClient}
+_clients_lock = threading.Lock()
+
+
+def _provider():
+    """(base_url, api_key) of the configured provider, or None if no API key is set"""
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        return None
+    base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+    return base_url.rstrip('/'), api_key
+
+
+def _breaker(key):
+    """One circuit breaker per provider, shared by the sync and async clients"""
+    if key not in _breakers:
+        _breakers[key] = CircuitBreaker()
+    return _breakers[key]
+
+
+def get_client():
+    """
+    Shared client for the configured provider, or None if no API key is set.
+    One client (and connection pool) is kept per base URL/key pair.
+    """
+    key = _provider()
+    if key is None:
+        return None
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = LLMClient(*key, breaker=_breaker(key))
+        return _clients[key]
+
+
+def get_async_client():
+    """
+    Async client for the configured provider on the running event loop, or None
+    if no API key is set. Must be called from a coroutine.
+    """
+    key = _provider()
+    if key is None:
+        return None
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = AsyncLLMClient(*key, breaker=_breaker(key))
+        return clients[key]
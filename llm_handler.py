@@ -1,179 +1,263 @@
 """
-LLM handler - handles Q&A using OpenAI API via direct HTTP requests
-Includes Local Fallback Mode (No API)
+LLM handler - handles Q&A using OpenAI API via the pooled client in llm_client
+Includes Local Fallback Mode (No API, or provider unavailable)
 """
-import os
+import asyncio
 import json
-import requests
-import random
+from contextlib import aclosing
+from compression import compress_context
+from llm_client import LLMError, get_async_client, get_client
+from llm_usage import LLM_STREAM_USAGE, recorder as usage
+from local_mcq import generate_from_text
+from metrics import timed
+from retrieval import CONTEXT_TOKEN_BUDGET
+from search_index import MemoryIndex, tokenize
+from token_budget import ANSWER_MAX_TOKENS, LLM_MODEL, context_budget
 
-def answer_question(question, context, max_tokens=500):
+# Answers produced without the LLM (local fallback or errors) start with one of these
+LOCAL_ANSWER_PREFIXES = ("[Local Search Result]", "I couldn't find", "Please ask a question",
+                         "Error generating answer")
+INTERRUPTED_NOTE = "\n\n[Answer interrupted: the AI service stopped responding.]"
+# Why the local fallback answered instead of the LLM
+NO_API_KEY = "no API key is configured"
+PROVIDER_DOWN = "the AI service is unavailable"
+STREAM_DONE = object()
+
+def _answer_payload(question, context, max_tokens, stream=False, memory=None):
+    """
+    Chat completions request body for answering a question about module content.
+    `memory` (see conversation_memory) puts the session's earlier turns before the question.
+    """
+    messages = [
+        {
+            "role": "system",
+            "content": "You are an expert educational assistant. Answer based on context."
+        },
+        *(memory.messages() if memory else []),
+        {
+            "role": "user",
+            "content": f"Module Content:\n\n\nQuestion: {question}"
+        }
+    ]
+    # Context gets whatever the model's window leaves, up to CONTEXT_TOKEN_BUDGET tokens.
+    # Callers pass retrieved chunks; keep the sentences that matter for the question
+    budget = context_budget(CONTEXT_TOKEN_BUDGET, max_tokens, messages)
+    context_compressed = compress_context(context, memory.search_query(question) if memory else question, budget)
+    messages[-1]["content"] = f"Module Content:\n{context_compressed}\n\nQuestion: {question}"
+    payload = {
+        "model": LLM_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": 0.7
+    }
+    if stream and LLM_STREAM_USAGE:
+        # The last chunk then carries the token counts
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+def local_answer(question, context, index=None, reason=NO_API_KEY, query=None):
+    """
+    Best-matching passage from a BM25 lookup, used when the LLM can't be called.
+    `query` is searched instead of the question if given (e.g. a follow-up plus the question before it).
+    """
+    print(f"Using Local Keyword Search Mode ({reason})")
+
+    if not context or not context.strip():
+        return "I couldn't find any content in this module to search."
+
+    if not tokenize(question):
+        return "Please ask a question containing words found in the document."
+
+    # BM25 lookup against the module's stored index when available
+    if index is None:
+        index = MemoryIndex(context)
+    results = index.search(query or question, top_k=1)
+    max_score, best_match = results[0] if results else (0, None)
+
+    if max_score > 0 and best_match:
+        return f"[Local Search Result] Found in document:\n\n{best_match}\n\n(Note: Using keyword search mode because {reason}.)"
+    else:
+        return f"I couldn't find a specific answer to \"{question}\" in the text using keyword search."
+
+def is_llm_answer(answer):
+    """True if an answer came from the LLM rather than the local fallback or an error"""
+    return bool(answer) and not answer.startswith(LOCAL_ANSWER_PREFIXES) and not answer.endswith(INTERRUPTED_NOTE)
+
+def _search_query(question, memory):
+    return memory.search_query(question) if memory else None
+
+@timed('answer_question')
+def answer_question(question, context, max_tokens=ANSWER_MAX_TOKENS, index=None, memory=None):
     """
     Answer a question based on PDF context.
-    Uses OpenAI API if key is present, otherwise falls back to local keyword search.
+    Uses OpenAI API if key is present, otherwise (or while the provider is failing)
+    falls back to local keyword search.
+    `index` is an optional search index (see search_index) for the fallback lookup.
+    `memory` is the session's earlier conversation (see conversation_memory), for follow-ups.
     """
     try:
-        api_key = os.getenv('OPENAI_API_KEY')
-        base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+        client = get_client()
         
         # --- LOCAL FALLBACK MODE (No API Key) ---
-        if not api_key:
-            print("Using Local Keyword Search Mode (No API Key provided)")
-            
-            # Simple keyword-based extraction
-            paragraphs = [p.strip() for p in context.split('\n\n') if p.strip()]
-            if not paragraphs:
-                return "I couldn't find any content in this module to search."
-
-            # Remove punctuation and lowercase
-            q_words = set(word.lower().strip('?,.! ') for word in question.split())
-            if not q_words:
-                return "Please ask a question containing words found in the document."
-
-            best_match = None
-            max_score = 0
-
-            for para in paragraphs:
-                para_lower = para.lower()
-                # Calculate score: number of question words present in paragraph
-                score = sum(1 for word in q_words if word in para_lower)
-                
-                # Boost score for exact phrase matches
-                if question.lower().strip('?') in para_lower:
-                    score += 5
-                
-                if score > max_score:
-                    max_score = score
-                    best_match = para
-
-            if max_score > 0 and best_match:
-                return f"[Local Search Result] Found in document:\n\n{best_match}\n\n(Note: Using keyword search mode because no API key is configured.)"
-            else:
-                return f"I couldn't find a specific answer to \"{question}\" in the text using keyword search."
+        if client is None:
+            return local_answer(question, context, index, query=_search_query(question, memory))
         # --- END LOCAL FALLBACK ---
 
-        # Truncate context to avoid token limits
-        context_truncated = context[:3000] if len(context) > 3000 else context
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
-        payload = {
-            "model": "gpt-3.5-turbo", 
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are an expert educational assistant. Answer based on context."
-                },
-                {
-                    "role": "user",
-                    "content": f"Module Content:\n{context_truncated}\n\nQuestion: {question}"
-                }
-            ],
-            "max_tokens": max_tokens,
-            "temperature": 0.7
-        }
-        
-        if base_url.endswith('/'):
-            base_url = base_url[:-1]
-            
-        response = requests.post(
-            f"{base_url}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        
-        if response.status_code != 200:
-            return f"Error from OpenAI API: {response.status_code} - {response.text}"
-            
-        data = response.json()
+        payload = _answer_payload(question, context, max_tokens, memory=memory)
+        try:
+            with usage.track('answer', payload) as call:
+                data = client.chat(payload)
+                call.response(data)
+        except LLMError as e:
+            print(f"LLM request failed: {e}")
+            return local_answer(question, context, index, reason=PROVIDER_DOWN, query=_search_query(question, memory))
+
         return data['choices'][0]['message']['content']
     
     except Exception as e:
         return f"Error generating answer: {str(e)}"
 
+def _stream_delta(line, call=None):
+    """
+    Text delta in one line of a streamed completion (STREAM_DONE at the end).
+    The delta and any `usage` chunk are noted on `call` (see llm_usage.LLMCall).
+    """
+    # Server-sent events: one "data: {json}" line per chunk, ending with "data: [DONE]"
+    if not line or not line.startswith('data:'):
+        return None
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return STREAM_DONE
+    chunk = json.loads(data)
+    choices = chunk.get('choices') or [{}]
+    delta = (choices[0].get('delta') or {}).get('content')
+    if call is not None:
+        if chunk.get('usage'):
+            call.usage = chunk['usage']
+        if delta:
+            call.add_text(delta)
+    return delta
+
+def stream_answer(question, context, max_tokens=ANSWER_MAX_TOKENS, index=None, memory=None):
+    """
+    Stream an answer as text deltas using the chat completions `stream: true` mode.
+    Without an API key, or if the provider fails before answering, the local
+    fallback answer is yielded as a single delta.
+    """
+    client = get_client()
+    
+    if client is None:
+        yield local_answer(question, context, index, query=_search_query(question, memory))
+        return
+    
+    started = False
+    try:
+        payload = _answer_payload(question, context, max_tokens, stream=True, memory=memory)
+        with usage.track('answer', payload) as call:
+            for line in client.chat_stream(payload):
+                delta = _stream_delta(line, call)
+                if delta is STREAM_DONE:
+                    break
+                if delta:
+                    started = True
+                    yield delta
+    
+    except LLMError as e:
+        print(f"LLM stream failed: {e}")
+        if started:
+            yield INTERRUPTED_NOTE
+        else:
+            yield local_answer(question, context, index, reason=PROVIDER_DOWN, query=_search_query(question, memory))
+    except Exception as e:
+        yield f"Error generating answer: {str(e)}"
+
+# --- Async versions for asgi.py ---
+# `local(reason)` builds the fallback answer. It runs in a worker thread because
+# it may query the database; by default it searches `context` in memory.
+
+async def _answer_payload_async(question, context, max_tokens, stream=False, memory=None):
+    # Compression is CPU-bound (extractive) or a blocking HTTP call (remote); keep it off the event loop
+    return await asyncio.to_thread(_answer_payload, question, context, max_tokens, stream, memory)
+
+@timed('answer_question')
+async def answer_question_async(question, context, max_tokens=ANSWER_MAX_TOKENS, local=None, memory=None):
+    """Async answer_question: waits on the LLM without holding a thread"""
+    local = local or (lambda reason: local_answer(question, context, None, reason, _search_query(question, memory)))
+    try:
+        client = get_async_client()
+        if client is None:
+            return await asyncio.to_thread(local, NO_API_KEY)
+
+        payload = await _answer_payload_async(question, context, max_tokens, memory=memory)
+        try:
+            with usage.track('answer', payload) as call:
+                data = await client.chat(payload)
+                call.response(data)
+        except LLMError as e:
+            print(f"LLM request failed: {e}")
+            return await asyncio.to_thread(local, PROVIDER_DOWN)
+
+        return data['choices'][0]['message']['content']
+
+    except Exception as e:
+        return f"Error generating answer: {str(e)}"
+
+async def stream_answer_async(question, context, max_tokens=ANSWER_MAX_TOKENS, local=None, memory=None):
+    """Async stream_answer: yields text deltas as they arrive"""
+    local = local or (lambda reason: local_answer(question, context, None, reason, _search_query(question, memory)))
+    client = get_async_client()
+
+    if client is None:
+        yield await asyncio.to_thread(local, NO_API_KEY)
+        return
+
+    started = False
+    try:
+        # aclosing() frees the client's request slot as soon as the loop ends
+        payload = await _answer_payload_async(question, context, max_tokens, stream=True, memory=memory)
+        with usage.track('answer', payload) as call:
+            async with aclosing(client.chat_stream(payload)) as lines:
+                async for line in lines:
+                    delta = _stream_delta(line, call)
+                    if delta is STREAM_DONE:
+                        break
+                    if delta:
+                        started = True
+                        yield delta
+
+    except LLMError as e:
+        print(f"LLM stream failed: {e}")
+        if started:
+            yield INTERRUPTED_NOTE
+        else:
+            yield await asyncio.to_thread(local, PROVIDER_DOWN)
+    except Exception as e:
+        yield f"Error generating answer: {str(e)}"
+
+def local_mcqs(content, count=5):
+    """Fill-in-the-blank MCQs built offline from the content (see local_mcq.py)"""
+    mcqs = generate_from_text(content, count)
+    if mcqs:
+        return mcqs
+    
+    return [{
+        "question": "What does this module primarily cover?",
+        "options": ["The uploaded PDF content", "General Knowledge", "Math", "Science"],
+        "correct": "A",
+        "difficulty": "easy",
+        "explanation": "This module covers the content of the uploaded PDF."
+    }]
+
+@timed('generate_mcqs')
 def generate_mcqs(content, count=5):
     """
     Generate MCQ questions from content.
-    Uses OpenAI API if present, otherwise generates pseudo-MCQs locally.
+    Uses OpenAI API if present, otherwise (or while the provider is failing)
+    generates pseudo-MCQs locally. For whole modules see mcq_engine.generate_module_mcqs.
     """
     try:
-        api_key = os.getenv('OPENAI_API_KEY')
-        base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
-        
-        if not api_key:
-            # Generate pseudo-MCQs locally
-            sentences = [s.strip() for s in content.replace('!', '.').replace('?', '.').split('.') if len(s.strip()) > 50]
-            
-            local_mcqs = []
-            if len(sentences) >= count:
-                selected_sentences = random.sample(sentences, min(count, len(sentences)))
-                
-                for i, sent in enumerate(selected_sentences):
-                    # Create a "Verify this statement" style MCQ
-                    local_mcqs.append({
-                        "question": f"Is this statement found in the text: \"{sent[:100]}...\"?",
-                        "options": ["Yes", "No", "Maybe", "Unknown"],
-                        "correct": "A",
-                        "difficulty": "easy",
-                        "explanation": "This sentence is present in the document."
-                    })
-            
-            if local_mcqs:
-                return local_mcqs
-            
-            return [{
-                "question": "What does this module primarily cover?",
-                "options": ["The uploaded PDF content", "General Knowledge", "Math", "Science"],
-                "correct": "A",
-                "difficulty": "easy",
-                "explanation": "This module covers the content of the uploaded PDF."
-            }]
-        
-        # API Implementation
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
-        content_truncated = content[:2500] if len(content) > 2500 else content
-        prompt = f"Generate {count} MCQs from this content in JSON format."
-
-        payload = {
-            "model": "gpt-3.5-turbo",
-            "messages": [
-                {"role": "system", "content": "You are a quiz generator. Return only JSON."},
-                {"role": "user", "content": f"Content:\n{content_truncated}\n\nTask: Generate {count} MCQs with 'question','options','correct','difficulty','explanation'. Return only JSON list."}
-            ],
-            "max_tokens": 1500
-        }
-        
-        if base_url.endswith('/'):
-            base_url = base_url[:-1]
-
-        response = requests.post(
-            f"{base_url}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=45
-        )
-        
-        if response.status_code != 200:
-            print(f"Error: {response.status_code}")
-            return []
-            
-        result_text = response.json()['choices'][0]['message']['content'].strip()
-        
-        if "```json" in result_text:
-            result_text = result_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in result_text:
-            result_text = result_text.split("```")[1].split("```")[0].strip()
-            
-        return json.loads(result_text)
-    
+        from mcq_engine import generate_from_contexts
+        return generate_from_contexts([content], count)
     except Exception as e:
         print(f"MCQ Error: {e}")
         return []
@@ -0,0 +1,223 @@
+"""
+LLM usage module - per-call token, latency and cost accounting
+Every chat and embedding call is recorded with its model, prompt/completion
+tokens (from the response `usage` field, or counted locally with token_budget
+when the provider doesn't send one), latency and status. Answers served from
+the answer cache are recorded too, so the hit rate shows up next to the spend.
+Rows are queued and written in batches by a background thread, so recording
+never waits on SQLite; /api/metrics/llm aggregates them.
+"""
+import os
+import queue
+import threading
+import time
+import db
+from token_budget import LLM_MODEL, count_message_tokens, count_tokens, cost_usd
+
+LLM_USAGE_LOG = os.getenv('LLM_USAGE_LOG', '1') != '0'          # 0 disables recording
+LLM_STREAM_USAGE = os.getenv('LLM_STREAM_USAGE', '1') != '0'    # ask for `usage` in streamed responses
+USAGE_BATCH_SIZE = 500
+
+USAGE_COLUMNS = ('created_at', 'kind', 'model', 'prompt_tokens', 'completion_tokens', 'latency_ms',
+                 'cached', 'estimated', 'status')
+
+
+def init_usage_table(conn):
+    """Create the llm_usage table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            kind TEXT NOT NULL,
+            model TEXT NOT NULL,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms REAL NOT NULL DEFAULT 0,
+            cached INTEGER NOT NULL DEFAULT 0,
+            estimated INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_usage_time ON llm_usage(created_at)')
+
+
+class LLMCall:
+    """
+    Usage of one provider call, recorded when its `with` block exits. Callers
+    pass the response JSON to response() (or set `usage` from a streamed chunk)
+    and add streamed text with add_text() for the local estimate.
+    An exception marks the call as an error; an abandoned stream as aborted.
+    """
+
+    def __init__(self, recorder, kind, payload):
+        self.recorder = recorder
+        self.kind = kind
+        self.payload = payload
+        self.model = payload.get('model') or LLM_MODEL
+        self.usage = None
+        self.parts = []
+        self.started = None
+
+    def response(self, data):
+        self.usage = data.get('usage') if isinstance(data, dict) else None
+
+    def add_text(self, text):
+        self.parts.append(text)
+
+    def _estimate(self):
+        """(prompt, completion) tokens counted locally"""
+        if 'messages' in self.payload:
+            prompt = count_message_tokens(self.payload['messages'], self.model)
+        else:
+            inputs = self.payload.get('input') or []
+            prompt = sum(count_tokens(text, self.model) for text in ([inputs] if isinstance(inputs, str) else inputs))
+        return prompt, count_tokens(''.join(self.parts), self.model)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        latency_ms = (time.perf_counter() - self.started) * 1000
+        if exc_type is None:
+            status = 'ok'
+        elif issubclass(exc_type, Exception):
+            status = 'error'
+        else:
+            # GeneratorExit: the client went away mid-stream
+            status = 'aborted'
+        usage = self.usage or {}
+        if usage.get('prompt_tokens') is not None:
+            prompt, completion, estimated = usage['prompt_tokens'], usage.get('completion_tokens') or 0, False
+        elif status == 'error':
+            # Failed requests aren't billed
+            prompt, completion, estimated = 0, 0, False
+        else:
+            prompt, completion = self._estimate()
+            estimated = True
+        self.recorder.record(self.kind, self.model, prompt, completion, latency_ms, estimated=estimated,
+                             status=status)
+        return False
+
+
+class UsageRecorder:
+    """Queues usage rows and writes them in batches from one background thread"""
+
+    def __init__(self, db_name=None):
+        self.db_name = db_name
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='llm-usage', daemon=True)
+                self._thread.start()
+
+    def record(self, kind, model, prompt_tokens=0, completion_tokens=0, latency_ms=0.0, cached=False,
+               estimated=False, status='ok'):
+        if not LLM_USAGE_LOG:
+            return
+        self.queue.put((time.time(), kind, model or LLM_MODEL, int(prompt_tokens), int(completion_tokens),
+                        round(latency_ms, 2), int(cached), int(estimated), status))
+        if self._thread is None:
+            self._start()
+
+    def record_cache_hit(self, kind='answer', model=None):
+        """An answer served from the answer cache instead of the LLM"""
+        self.record(kind, model, cached=True)
+
+    def track(self, kind, payload):
+        """Context manager recording the call made inside it"""
+        return LLMCall(self, kind, payload)
+
+    def _run(self):
+        while True:
+            rows = [self.queue.get()]
+            # Everything queued meanwhile goes into the same transaction
+            while len(rows) < USAGE_BATCH_SIZE:
+                try:
+                    rows.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn = db.connect(self.db_name)
+                try:
+                    conn.executemany(f'''
+                        INSERT INTO llm_usage ({", ".join(USAGE_COLUMNS)})
+                        VALUES ({", ".join("?" * len(USAGE_COLUMNS))})
+                    ''', rows)
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"Could not record LLM usage: {e}")
+            finally:
+                for _ in rows:
+                    self.queue.task_done()
+
+    def flush(self):
+        """Wait until every queued row is written"""
+        self.queue.join()
+
+
+recorder = UsageRecorder()
+
+
+def _percentile(conn, where, params, count, fraction):
+    c = conn.cursor()
+    c.execute(f'SELECT latency_ms FROM llm_usage WHERE {where} ORDER BY latency_ms LIMIT 1 OFFSET ?',
+              (*params, min(count - 1, int(count * fraction))))
+    row = c.fetchone()
+    return round(row[0], 1) if row else 0.0
+
+
+def summary(conn, since=None):
+    """
+    Calls, tokens, estimated cost and latency per (kind, model) since a unix
+    time (all time if None), plus totals. Cached rows count as cache hits, not calls.
+    """
+    since = since or 0
+    c = conn.cursor()
+    c.execute('''
+        SELECT kind, model,
+               SUM(cached = 0), SUM(cached), SUM(cached = 0 AND status != 'ok' AND status != 'aborted'),
+               SUM(estimated), SUM(prompt_tokens), SUM(completion_tokens),
+               AVG(CASE WHEN cached = 0 AND status = 'ok' THEN latency_ms END), SUM(cached = 0 AND status = 'ok')
+        FROM llm_usage WHERE created_at >= ?
+        GROUP BY kind, model ORDER BY kind, model
+    ''', (since,))
+    groups = []
+    totals = {'calls': 0, 'cache_hits': 0, 'errors': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+              'cost_usd': 0.0}
+    for kind, model, calls, hits, errors, estimated, prompt, completion, avg_latency, ok_calls in c.fetchall():
+        # Latency percentiles are over successful calls only; ok_calls counts exactly those rows
+        where = "created_at >= ? AND kind = ? AND model = ? AND cached = 0 AND status = 'ok'"
+        params = (since, kind, model)
+        cost = cost_usd(model, prompt, completion)
+        groups.append({
+            'kind': kind,
+            'model': model,
+            'calls': calls,
+            'errors': errors,
+            'cache_hits': hits,
+            'cache_hit_rate': round(hits / (hits + calls), 3) if hits + calls else 0.0,
+            'estimated_usage_calls': estimated,
+            'prompt_tokens': prompt,
+            'completion_tokens': completion,
+            'cost_usd': round(cost, 6) if cost is not None else None,
+            'avg_latency_ms': round(avg_latency or 0.0, 1),
+            'p50_latency_ms': _percentile(conn, where, params, ok_calls, 0.5) if ok_calls > 0 else 0.0,
+            'p95_latency_ms': _percentile(conn, where, params, ok_calls, 0.95) if ok_calls > 0 else 0.0
+        })
+        totals['calls'] += calls
+        totals['cache_hits'] += hits
+        totals['errors'] += errors
+        totals['prompt_tokens'] += prompt
+        totals['completion_tokens'] += completion
+        totals['cost_usd'] += cost or 0.0
+    totals['cost_usd'] = round(totals['cost_usd'], 6)
+    totals['cache_hit_rate'] = (round(totals['cache_hits'] / (totals['cache_hits'] + totals['calls']), 3)
+                                if totals['cache_hits'] + totals['calls'] else 0.0)
+    return {'totals': totals, 'by_kind_model': groups}
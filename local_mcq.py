@@ -0,0 +1,350 @@
+"""
+Local MCQ module - offline cloze questions with distractors from the module itself
+At index time each module gets a sentence index: candidate sentences, the key term
+of each one (highest TF-IDF within the module) and, for every key term, the terms
+most similar to it by co-occurrence (vectorized with NumPy). A quiz is then one
+random read of that table: the key term is blanked and the similar terms become
+the wrong options, so deployments without an API key still get usable quizzes.
+"""
+import json
+import math
+import random
+import re
+from collections import Counter, defaultdict
+from pages import load_text, split_pages
+from search_index import TOKEN_RE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+MIN_SENTENCE_CHARS = 40
+MAX_SENTENCE_CHARS = 300
+MAX_SENTENCES = 3000        # best-scoring sentences kept per module
+VOCAB_LIMIT = 3000          # terms that get a similarity row
+SIMILAR_TERMS = 8           # neighbours stored per term
+PROJECTION_DIM = 256        # random projection of the term x sentence matrix
+PROJECTION_BLOCK = 2048     # sentences whose projection rows are generated at a time
+PROJECTION_BATCH = 8192     # (term, sentence) pairs accumulated per NumPy call
+MIN_TERM_CHARS = 4
+# Terms in more than this share of sentences are too common to ask about
+MAX_DOC_FREQ = 0.5
+BLANK = '_____'
+
+STOPWORDS = set('''
+about above after again against also although among because been before being below between both
+could does doing down during each either every from further have having here hers herself himself
+into itself just many might more most much must neither other ours ourselves over same shall should
+some such than that their theirs them themselves then there these they this those through under
+until upon very were what when where whether which while whom whose will with within without would
+your yours yourself yourselves page using used uses based often thus therefore however include
+includes including called known made make makes well like first second third different important
+example examples various several following given another others only even still
+'''.split())
+
+
+def init_local_mcq_tables(conn):
+    """Create the mcq_sentences and mcq_terms tables"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mcq_sentences (
+            pdf_id INTEGER NOT NULL,
+            sent_no INTEGER NOT NULL,
+            page_no INTEGER,
+            text TEXT NOT NULL,
+            term TEXT NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (pdf_id, sent_no)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mcq_terms (
+            pdf_id INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            surface TEXT NOT NULL,
+            similar TEXT NOT NULL,
+            PRIMARY KEY (pdf_id, term)
+        ) WITHOUT ROWID
+    ''')
+
+
+def split_sentences(text):
+    """Sentences of a text with whitespace collapsed, keeping only quiz-sized ones"""
+    sentences = (' '.join(s.split()) for s in SENTENCE_RE.split(text or ''))
+    return [s for s in sentences if MIN_SENTENCE_CHARS <= len(s) <= MAX_SENTENCE_CHARS]
+
+
+def _is_candidate(term):
+    return len(term) >= MIN_TERM_CHARS and term.isalpha() and term not in STOPWORDS
+
+
+def _surface(term, forms):
+    """How to print a term: lowercase unless it only ever appears capitalized (names, acronyms)"""
+    if term in forms:
+        return term
+    return forms.most_common(1)[0][0] if forms else term
+
+
+def analyze(text):
+    """
+    Sentence index for a whole-document text: (sentences, terms) where sentences
+    are (page_no, text, key term, score) and terms maps term -> (surface form,
+    [(similar term, similarity), ...]).
+    """
+    page_texts = split_pages(text)
+    return analyze_pages([(None, text or '')] if page_texts is None else enumerate(page_texts, start=1))
+
+
+def analyze_pages(pages):
+    """analyze() for (page_no, page text) pairs (any iterable, consumed once)"""
+    sentences = []
+    token_lists = []
+    surfaces = defaultdict(Counter)
+    for page_no, page_text in pages:
+        for sentence in split_sentences(page_text):
+            sentences.append((page_no, sentence))
+            words = [w for w in re.findall(r'[A-Za-z]+', sentence) if _is_candidate(w.lower())]
+            for word in words:
+                surfaces[word.lower()][word] += 1
+            token_lists.append([t for t in TOKEN_RE.findall(sentence.lower()) if _is_candidate(t)])
+    if not sentences:
+        return [], {}
+
+    n = len(sentences)
+    df = Counter(t for tokens in token_lists for t in set(tokens))
+    idf = {t: math.log(n / d) for t, d in df.items()}
+    # A key term must recur in the module but not be everywhere
+    max_df = max(2, int(n * MAX_DOC_FREQ))
+    keyable = {t for t, d in df.items() if 2 <= d <= max_df}
+    if not keyable:
+        # Tiny vocabulary: every term is common, so ask about the recurring ones anyway
+        keyable = {t for t, d in df.items() if d >= 2}
+
+    scored = []
+    for (page_no, sentence), tokens in zip(sentences, token_lists):
+        tf = Counter(t for t in tokens if t in keyable)
+        if not tf:
+            continue
+        term, score = max(((t, c * idf[t]) for t, c in tf.items()), key=lambda x: x[1])
+        scored.append((page_no, sentence, term, round(score, 4)))
+    scored.sort(key=lambda row: row[3], reverse=True)
+    scored = scored[:MAX_SENTENCES]
+
+    vocab = sorted({row[2] for row in scored} | set(sorted(keyable, key=df.get, reverse=True)[:VOCAB_LIMIT]),
+                   key=df.get, reverse=True)[:VOCAB_LIMIT]
+    similar = similar_terms(vocab, token_lists, idf)
+    terms = {t: (_surface(t, surfaces[t]), similar.get(t, [])) for t in vocab}
+    return scored, terms
+
+
+def similar_terms(vocab, token_lists, idf, top_k=SIMILAR_TERMS):
+    """
+    Most similar other terms for each vocab term, by cosine similarity of their
+    idf-weighted sentence co-occurrence vectors. The term x sentence matrix is
+    randomly projected to PROJECTION_DIM columns so large modules stay cheap.
+    """
+    if np is None or len(vocab) < 2:
+        return {}
+    index = {t: i for i, t in enumerate(vocab)}
+    rows, cols, weights = [], [], []
+    for s, tokens in enumerate(token_lists):
+        for t in set(tokens):
+            i = index.get(t)
+            if i is not None:
+                rows.append(i)
+                cols.append(s)
+                weights.append(idf[t])
+    if not rows:
+        return {}
+
+    vectors = np.zeros((len(vocab), PROJECTION_DIM), dtype=np.float32)
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    weights = np.asarray(weights, dtype=np.float32)
+    # Projection rows are generated per block of sentences (pairs are in sentence
+    # order), so memory stays flat however long the module is
+    for block_start in range(0, len(token_lists), PROJECTION_BLOCK):
+        lo, hi = np.searchsorted(cols, [block_start, block_start + PROJECTION_BLOCK])
+        if lo == hi:
+            continue
+        rng = np.random.default_rng([0, block_start // PROJECTION_BLOCK])
+        projection = rng.standard_normal((PROJECTION_BLOCK, PROJECTION_DIM), dtype=np.float32)
+        for start in range(lo, hi, PROJECTION_BATCH):
+            end = min(start + PROJECTION_BATCH, hi)
+            np.add.at(vectors, rows[start:end],
+                      weights[start:end, None] * projection[cols[start:end] - block_start])
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, -1.0)
+    k = min(top_k, len(vocab) - 1)
+    nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+    result = {}
+    for i, term in enumerate(vocab):
+        order = nearest[i][np.argsort(-similarity[i, nearest[i]])]
+        result[term] = [(vocab[j], round(float(similarity[i, j]), 3)) for j in order]
+    return result
+
+
+# --- Storage ---
+
+def build_sentence_index(conn, pdf_id, text):
+    """(Re)build a module's sentence index from its whole-document text"""
+    store_sentence_index(conn, pdf_id, *analyze(text))
+
+
+def build_page_sentence_index(conn, pdf_id, page_texts):
+    """(Re)build a module's sentence index from its page texts (any iterable, consumed once)"""
+    store_sentence_index(conn, pdf_id, *analyze_pages(enumerate(page_texts, start=1)))
+
+
+def store_sentence_index(conn, pdf_id, sentences, terms):
+    """Replace a module's sentence index with the result of analyze()"""
+    delete_sentence_index(conn, pdf_id)
+    conn.executemany(
+        'INSERT INTO mcq_sentences (pdf_id, sent_no, page_no, text, term, score) VALUES (?, ?, ?, ?, ?, ?)',
+        [(pdf_id, i, page_no, sentence, term, score) for i, (page_no, sentence, term, score) in enumerate(sentences)]
+    )
+    conn.executemany(
+        'INSERT INTO mcq_terms (pdf_id, term, surface, similar) VALUES (?, ?, ?, ?)',
+        [(pdf_id, term, surface, json.dumps(similar)) for term, (surface, similar) in terms.items()]
+    )
+
+
+def delete_sentence_index(conn, pdf_id):
+    conn.execute('DELETE FROM mcq_sentences WHERE pdf_id = ?', (pdf_id,))
+    conn.execute('DELETE FROM mcq_terms WHERE pdf_id = ?', (pdf_id,))
+
+
+def has_sentence_index(conn, pdf_id):
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM mcq_terms WHERE pdf_id = ? LIMIT 1', (pdf_id,))
+    return c.fetchone() is not None
+
+
+def ensure_sentence_index(conn, pdf_id):
+    """Build the sentence index of a module indexed before it existed; False if the module has no text"""
+    if has_sentence_index(conn, pdf_id):
+        return True
+    text = load_text(conn, pdf_id)
+    if not text:
+        return False
+    build_sentence_index(conn, pdf_id, text)
+    conn.commit()
+    return True
+
+
+# --- Question building ---
+
+def _difficulty(similarity):
+    """Closer distractors make a harder question"""
+    if similarity >= 0.5:
+        return 'hard'
+    if similarity >= 0.25:
+        return 'medium'
+    return 'easy'
+
+
+def _distractors(term, sentence, similar, pool, surfaces, rng):
+    """Three wrong options: similar terms first, then random key terms of the module"""
+    sentence_terms = set(TOKEN_RE.findall(sentence.lower()))
+
+    def usable(other):
+        # Not in the sentence (it would give the answer away), and not a variant of the answer
+        return other != term and other not in sentence_terms and other[:5] != term[:5]
+
+    chosen = [(t, sim) for t, sim in similar if usable(t)][:3]
+    extra = [t for t in pool if usable(t) and t not in {c[0] for c in chosen}]
+    rng.shuffle(extra)
+    chosen += [(t, 0.0) for t in extra[:3 - len(chosen)]]
+    return [(surfaces.get(t, t), sim) for t, sim in chosen]
+
+
+def _cloze(page_no, sentence, term, similar, pool, surfaces, rng):
+    """One MCQ in the app's schema, or None if the term can't be blanked or lacks distractors"""
+    pattern = re.compile(rf'\b{re.escape(term)}\b', re.IGNORECASE)
+    match = pattern.search(sentence)
+    distractors = _distractors(term, sentence, similar, pool, surfaces, rng)
+    if not match or len(distractors) < 3:
+        return None
+    answer = surfaces.get(term, match.group(0))
+    options = [answer] + [d for d, _ in distractors]
+    rng.shuffle(options)
+    where = f" (page {page_no})" if page_no else ""
+    mcq = {
+        'question': f"Fill in the blank: {pattern.sub(BLANK, sentence)}",
+        'options': options,
+        'correct': 'ABCD'[options.index(answer)],
+        'difficulty': _difficulty(max(sim for _, sim in distractors)),
+        'explanation': f"The module{where} says: \"{sentence}\""
+    }
+    if page_no:
+        mcq['page'] = page_no
+    return mcq
+
+
+def _questions(candidates, similar, pool, surfaces, count, rng):
+    """Build up to `count` MCQs from (page_no, sentence, term) candidates, one per key term"""
+    mcqs = []
+    used_terms = set()
+    for page_no, sentence, term in candidates:
+        if term in used_terms:
+            continue
+        mcq = _cloze(page_no, sentence, term, similar.get(term, []), pool, surfaces, rng)
+        if mcq:
+            used_terms.add(term)
+            mcqs.append(mcq)
+            if len(mcqs) == count:
+                break
+    return mcqs
+
+
+def generate(conn, pdf_id, count, rng=random):
+    """`count` cloze MCQs for a module from its stored sentence index (one random read)"""
+    c = conn.cursor()
+    c.execute('''
+        SELECT page_no, text, term FROM mcq_sentences WHERE pdf_id = ?
+        ORDER BY RANDOM() LIMIT ?
+    ''', (pdf_id, count * 3))
+    candidates = c.fetchall()
+    if not candidates:
+        return []
+    similar = {}
+    surfaces = {}
+    for term, surface, similar_json in _term_rows(c, pdf_id, {row[2] for row in candidates}):
+        surfaces[term] = surface
+        similar[term] = json.loads(similar_json)
+    neighbours = {t for rows in similar.values() for t, _ in rows} - set(surfaces)
+    for term, surface, _ in _term_rows(c, pdf_id, neighbours):
+        surfaces[term] = surface
+    # Fallback distractors: other key terms of the module
+    c.execute('SELECT term, surface FROM mcq_terms WHERE pdf_id = ? ORDER BY RANDOM() LIMIT 50', (pdf_id,))
+    pool = []
+    for term, surface in c.fetchall():
+        surfaces.setdefault(term, surface)
+        pool.append(term)
+    return _questions(candidates, similar, pool, surfaces, count, rng)
+
+
+def _term_rows(c, pdf_id, terms):
+    if not terms:
+        return []
+    placeholders = ','.join('?' * len(terms))
+    c.execute(f'SELECT term, surface, similar FROM mcq_terms WHERE pdf_id = ? AND term IN ({placeholders})',
+              (pdf_id, *terms))
+    return c.fetchall()
+
+
+def generate_from_text(text, count, rng=random):
+    """`count` cloze MCQs from text that has no stored index (analyzed in memory)"""
+    sentences, terms = analyze(text)
+    if not sentences:
+        return []
+    candidates = [(page_no, sentence, term) for page_no, sentence, term, _ in sentences]
+    rng.shuffle(candidates)
+    similar = {t: s for t, (_, s) in terms.items()}
+    surfaces = {t: surface for t, (surface, _) in terms.items()}
+    return _questions(candidates, similar, list(terms), surfaces, count, rng)
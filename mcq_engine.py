@@ -0,0 +1,269 @@
+"""
+MCQ engine - quiz generation that covers a whole module
+The requested count is split into batches, each written from its own section of
+the module's chunks, and the batches are generated concurrently (bounded by
+MCQ_PARALLELISM). Model output is parsed leniently, validated against the MCQ
+schema and deduplicated, so a 50-question exam takes about as long as 5 questions.
+"""
+import json
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from answer_cache import jaccard, normalize_question, shingles
+from compression import compress_context
+from llm_client import LLMError, get_client
+from llm_handler import local_mcqs
+from llm_usage import recorder as usage
+from metrics import timed
+from pages import page_at
+from retrieval import MCQ_TOKEN_BUDGET, spread_context
+from token_budget import LLM_MODEL, MCQ_MAX_TOKENS, context_budget
+import local_mcq
+
+MCQ_BATCH_SIZE = int(os.getenv('MCQ_BATCH_SIZE', 8))          # questions asked for per prompt
+MCQ_PARALLELISM = int(os.getenv('MCQ_PARALLELISM', 8))        # prompts in flight at once
+MCQ_MAX_COUNT = int(os.getenv('MCQ_MAX_COUNT', 100))
+MCQ_DUPLICATE_SIMILARITY = float(os.getenv('MCQ_DUPLICATE_SIMILARITY', 0.8))
+# Completion tokens per question requested (question, 4 options, explanation)
+TOKENS_PER_MCQ = 160
+
+LETTERS = 'ABCD'
+DIFFICULTIES = ('easy', 'medium', 'hard')
+OPTION_PREFIX = re.compile(r'^\s*(?:[A-Da-d]|[1-4])\s*[).:-]\s+')
+
+
+# --- Parsing and validation ---
+
+def _json_values(text):
+    """Every JSON value that can be decoded starting at a '[' or '{' in text, outermost first"""
+    decoder = json.JSONDecoder()
+    i = 0
+    while i < len(text):
+        if text[i] in '[{':
+            try:
+                value, end = decoder.raw_decode(text, i)
+                yield value
+                i = end
+                continue
+            except json.JSONDecodeError:
+                pass
+        i += 1
+
+
+def parse_mcqs(text):
+    """
+    Raw MCQ dicts from a model reply. Accepts a bare list, a list inside code
+    fences or prose, an object with a "questions" list, and replies cut off by
+    max_tokens (every complete question object before the cut is kept).
+    """
+    items = []
+    for value in _json_values(text or ''):
+        if isinstance(value, dict) and isinstance(value.get('questions'), list):
+            value = value['questions']
+        if isinstance(value, list):
+            items.extend(v for v in value if isinstance(v, dict))
+        elif isinstance(value, dict) and 'question' in value:
+            items.append(value)
+    return items
+
+
+def _correct_letter(correct, options):
+    """Normalize the answer key ("B", "b)", 1, or the option text) to a letter"""
+    if isinstance(correct, int) and not isinstance(correct, bool):
+        return LETTERS[correct] if 0 <= correct < len(options) else None
+    if not isinstance(correct, str):
+        return None
+    value = correct.strip()
+    for i, option in enumerate(options):
+        if value.lower() == option.lower():
+            return LETTERS[i]
+    if value and value[0].upper() in LETTERS and (len(value) == 1 or not value[1].isalnum()):
+        return value[0].upper()
+    return None
+
+
+def validate_mcq(item):
+    """
+    The MCQ in the app's schema (question, 4 options, correct letter, difficulty,
+    explanation), or None if it can't be repaired into one.
+    """
+    question = item.get('question')
+    options = item.get('options')
+    if isinstance(options, dict):
+        options = [options.get(letter) or options.get(letter.lower()) for letter in LETTERS]
+    if not isinstance(question, str) or not question.strip() or not isinstance(options, list):
+        return None
+    options = [OPTION_PREFIX.sub('', o).strip() if isinstance(o, str) else None for o in options]
+    if len(options) != 4 or not all(options) or len({o.lower() for o in options}) != 4:
+        return None
+    correct = _correct_letter(item.get('correct', item.get('answer')), options)
+    if correct is None:
+        return None
+    difficulty = str(item.get('difficulty', '')).strip().lower()
+    explanation = item.get('explanation')
+    return {
+        'question': question.strip(),
+        'options': options,
+        'correct': correct,
+        'difficulty': difficulty if difficulty in DIFFICULTIES else 'medium',
+        'explanation': explanation.strip() if isinstance(explanation, str) else ''
+    }
+
+
+def dedupe_mcqs(mcqs, seen=None):
+    """Drop questions that repeat (or nearly repeat) an earlier one; `seen` carries shingle sets across calls"""
+    seen = [] if seen is None else seen
+    unique = []
+    for mcq in mcqs:
+        key = shingles(normalize_question(mcq['question']))
+        if any(jaccard(key, other) >= MCQ_DUPLICATE_SIMILARITY for other in seen):
+            continue
+        seen.append(key)
+        unique.append(mcq)
+    return unique
+
+
+# --- Generation ---
+
+def _payload(content, count, avoid=(), difficulty=None):
+    task = (f"Task: Generate {count} MCQs about the content above. Return only a JSON list of objects with "
+            f"'question', 'options' (4 strings), 'correct' (A-D), 'difficulty' (easy/medium/hard) and 'explanation'.")
+    if difficulty:
+        task += f"\nEvery question must be {difficulty}."
+    if avoid:
+        task += "\nDo not repeat these questions:\n" + '\n'.join(f"- {q[:100]}" for q in avoid)
+    max_tokens = min(MCQ_MAX_TOKENS, 200 + TOKENS_PER_MCQ * count)
+    messages = [
+        {"role": "system", "content": "You are a quiz generator. Return only JSON."},
+        {"role": "user", "content": f"Content:\n\n\n{task}"}
+    ]
+    budget = context_budget(MCQ_TOKEN_BUDGET, max_tokens, messages)
+    messages[1]["content"] = f"Content:\n{compress_context(content, None, budget)}\n\n{task}"
+    return {
+        "model": LLM_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens
+    }
+
+
+def generate_batch(client, content, count, avoid=(), difficulty=None):
+    """Up to `count` valid MCQs from one prompt; [] if the provider fails"""
+    payload = _payload(content, count, avoid, difficulty)
+    try:
+        with usage.track('mcq', payload) as call:
+            data = client.chat(payload, timeout=45)
+            call.response(data)
+    except LLMError as e:
+        print(f"MCQ batch failed: {e}")
+        return []
+    mcqs = [validate_mcq(item) for item in parse_mcqs(data['choices'][0]['message']['content'])]
+    mcqs = [mcq for mcq in mcqs if mcq is not None][:count]
+    if difficulty:
+        # Asked for at this difficulty, so that is what they are served as
+        for mcq in mcqs:
+            mcq['difficulty'] = difficulty
+    return mcqs
+
+
+def of_difficulty(mcqs, difficulty, count):
+    """
+    Up to `count` of the MCQs at the requested difficulty (any, if None). For
+    offline questions, whose difficulty can't be asked for: all of them if none match.
+    """
+    if difficulty:
+        mcqs = [mcq for mcq in mcqs if mcq['difficulty'] == difficulty] or mcqs
+    return mcqs[:count]
+
+
+def _local_mcqs(content, count, difficulty):
+    # Offline questions come in every difficulty; build extra to choose from
+    return of_difficulty(local_mcqs(content, count * len(DIFFICULTIES) if difficulty else count), difficulty, count)
+
+
+def split_count(count, batch_size=MCQ_BATCH_SIZE):
+    """Per-batch question counts, as even as possible: 50 -> [8, 7, 7, 7, 7, 7, 7]"""
+    batches = max(1, math.ceil(count / batch_size))
+    base, extra = divmod(count, batches)
+    return [base + (1 if i < extra else 0) for i in range(batches)]
+
+
+def generate_from_contexts(contexts, count, pages=None, fallback=True, parallelism=MCQ_PARALLELISM,
+                           difficulty=None):
+    """
+    `count` MCQs spread over the given contexts (one batch each, in order),
+    generated concurrently, all at `difficulty` if one is given. Batches that
+    come back short are topped up once. With `pages` (one per context), each
+    MCQ gets the page its context starts on. Local pseudo-MCQs are returned
+    when no LLM is configured, or when nothing came back and `fallback` is set.
+    """
+    pages = pages or [None] * len(contexts)
+    sources = [(text, page) for text, page in zip(contexts, pages) if text]
+    if not sources or count <= 0:
+        return []
+    client = get_client()
+    if client is None:
+        return _local_mcqs('\n'.join(text for text, _ in sources), count, difficulty)
+
+    sizes = split_count(count)
+    jobs = [(*sources[i % len(sources)], size) for i, size in enumerate(sizes)]
+    seen = []
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(jobs)))) as executor:
+        batches = list(executor.map(lambda job: generate_batch(client, job[0], job[2], difficulty=difficulty), jobs))
+        results = [dedupe_mcqs(batch, seen) for batch in batches]
+
+        # One more round for batches that lost questions to validation or dedupe
+        short = [(i, size - len(results[i])) for i, (_, _, size) in enumerate(jobs) if len(results[i]) < size]
+        if short and any(results):
+            avoid = [mcq['question'] for batch in results for mcq in batch]
+            topups = list(executor.map(lambda s: generate_batch(client, jobs[s[0]][0], s[1], avoid, difficulty), short))
+            for (i, missing), batch in zip(short, topups):
+                results[i].extend(dedupe_mcqs(batch, seen)[:missing])
+
+    mcqs = []
+    for (_, page, _), batch in zip(jobs, results):
+        for mcq in batch:
+            if page is not None:
+                mcq['page'] = page
+            mcqs.append(mcq)
+    mcqs = mcqs[:count]
+    if not mcqs and fallback:
+        return _local_mcqs('\n'.join(text for text, _ in sources), count, difficulty)
+    return mcqs
+
+
+def section_contexts(conn, pdf_id, sections, budget=MCQ_TOKEN_BUDGET):
+    """
+    (context, page) for each of `sections` consecutive, equal slices of the
+    module's chunks; page is where the slice starts (None for typed concepts)
+    """
+    c = conn.cursor()
+    c.execute('SELECT chunk_count FROM chunk_stats WHERE pdf_id = ?', (pdf_id,))
+    row = c.fetchone()
+    if not row or not row[0]:
+        return []
+    chunk_count = row[0]
+    sections = max(1, min(sections, chunk_count))
+    bounds = [round(i * chunk_count / sections) for i in range(sections + 1)]
+    result = []
+    for i in range(sections):
+        c.execute('SELECT start_offset FROM chunks WHERE pdf_id = ? AND chunk_no = ?', (pdf_id, bounds[i]))
+        start = c.fetchone()
+        page = page_at(conn, pdf_id, start[0]) if start else None
+        result.append((spread_context(conn, pdf_id, budget, first=bounds[i], last=bounds[i + 1]), page))
+    return result
+
+
+@timed('generate_mcqs')
+def generate_module_mcqs(conn, pdf_id, count, fallback=True, difficulty=None):
+    """`count` MCQs covering the whole module, at `difficulty` if given (the module must already be indexed)"""
+    count = max(1, min(int(count), MCQ_MAX_COUNT))
+    if get_client() is None:
+        # Offline: cloze questions from the module's precomputed sentence index
+        local_mcq.ensure_sentence_index(conn, pdf_id)
+        mcqs = local_mcq.generate(conn, pdf_id, count * len(DIFFICULTIES) if difficulty else count)
+        if mcqs:
+            return of_difficulty(mcqs, difficulty, count)
+    sections = section_contexts(conn, pdf_id, len(split_count(count)))
+    return generate_from_contexts([text for text, _ in sections], count,
+                                  pages=[page for _, page in sections], fallback=fallback, difficulty=difficulty)
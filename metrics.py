@@ -0,0 +1,256 @@
+"""
+Metrics module - latency histograms, timing spans and request profiling
+Requests are timed per route, named stages (retrieval, the LLM call, PDF
+extraction, ...) with span()/timed(), and every SQLite statement per operation
+and table (see db.TimedConnection). render() writes all of it in the Prometheus
+text format for GET /metrics. The stages of the current request are also
+collected for its Server-Timing header.
+With PROFILE_REQUESTS=1, a request sent with an `X-Profile: 1` header is run
+under cProfile and the stats are written to PROFILE_DIR, with a readable
+summary of the slowest calls next to them.
+"""
+import cProfile
+import functools
+import inspect
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', '0') == '1'    # honour the X-Profile header
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_HEADER = 'X-Profile'
+
+# Seconds; Prometheus-style cumulative upper bounds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Operation and table of a SQL statement, e.g. ('insert', 'conversations')
+SQL_TABLE_RE = re.compile(r'^\s*(?:(update)\s+(?:or\s+\w+\s+)?([\w.]+)|'
+                          r'(select|insert|delete|replace|create|drop|alter|pragma|with|commit)\b'
+                          r'(?:.*?\b(?:from|into|table|index)\s+(?:if\s+(?:not\s+)?exists\s+)?([\w.]+))?)',
+                          re.IGNORECASE | re.DOTALL)
+SQL_LABEL_CACHE_SIZE = 2048
+# Characters not allowed in Server-Timing names and profile file names
+NAME_UNSAFE_RE = re.compile(r'[^\w-]')
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label combination"""
+
+    def __init__(self, name, help, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted((labels, list(s[0]), s[1], s[2]) for labels, s in self.series.items())
+        for labels, counts, total, count in series:
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels))
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            braced = f'{{{label_text}}}' if label_text else ''
+            lines.append(f'{self.name}_sum{braced} {total:.6f}')
+            lines.append(f'{self.name}_count{braced} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_seconds = Histogram('app_request_duration_seconds', 'HTTP request latency by route',
+                            ('method', 'route', 'status'))
+stage_seconds = Histogram('app_stage_duration_seconds', 'Time spent in named stages of request handling',
+                          ('stage',))
+db_seconds = Histogram('app_db_query_seconds', 'SQLite statement latency by operation and table',
+                       ('op', 'table'))
+first_token_seconds = Histogram('app_stream_first_token_seconds',
+                                'Time from a streamed question to its first answer token', ('cached',))
+HISTOGRAMS = (request_seconds, stage_seconds, db_seconds, first_token_seconds)
+
+# Stage -> seconds for the request being handled in this thread/task
+_request_stages = ContextVar('request_stages', default=None)
+_sql_labels = {}
+
+
+def start_request():
+    """Begin collecting stage timings for the current request"""
+    _request_stages.set({})
+
+
+def finish_request():
+    """Stage timings of the current request (stage -> seconds), and stop collecting"""
+    stages = _request_stages.get()
+    _request_stages.set(None)
+    return stages or {}
+
+
+def _add_stage(stage, seconds):
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+def observe_stage(stage, seconds):
+    if METRICS_ENABLED:
+        stage_seconds.observe(seconds, stage)
+        _add_stage(stage, seconds)
+
+
+def observe_request(method, route, status, seconds):
+    if METRICS_ENABLED:
+        request_seconds.observe(seconds, method, route, str(status))
+
+
+def observe_first_token(seconds, cached):
+    """Time to first token of a streamed answer"""
+    if METRICS_ENABLED:
+        first_token_seconds.observe(seconds, 'true' if cached else 'false')
+
+
+def _sql_label(sql):
+    label = _sql_labels.get(sql)
+    if label is None:
+        match = SQL_TABLE_RE.match(sql)
+        if match:
+            op, table = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+            label = (op.lower(), (table or '').lower())
+        else:
+            label = ('other', '')
+        # Statements with a variable number of placeholders would grow this without bound
+        if len(_sql_labels) < SQL_LABEL_CACHE_SIZE:
+            _sql_labels[sql] = label
+    return label
+
+
+def observe_query(sql, seconds):
+    """Time one SQLite statement (or COMMIT)"""
+    if METRICS_ENABLED:
+        db_seconds.observe(seconds, *_sql_label(sql))
+        _add_stage('db', seconds)
+
+
+@contextmanager
+def span(stage):
+    """Time the block as `stage`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def timed(stage):
+    """Decorator timing every call of a function (or coroutine function) as `stage`"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(stages):
+    """Server-Timing header value for a request's stages"""
+    return ', '.join(f'{NAME_UNSAFE_RE.sub("_", stage)};dur={seconds * 1000:.1f}'
+                     for stage, seconds in sorted(stages.items()))
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Profiling ---
+
+def wants_profile(headers):
+    return PROFILE_REQUESTS and headers.get(PROFILE_HEADER, '').lower() in ('1', 'true', 'yes')
+
+
+def start_profile():
+    """A running profiler for the current thread, or None if one can't be started"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Another profiler is already active on this thread
+        print(f"Could not profile request: {e}")
+        return None
+    return profiler
+
+
+def stop_profile(profiler, name, top=15):
+    """
+    Stop a profiler and write its stats to PROFILE_DIR, plus the `top` slowest calls
+    by cumulative time as text in a .txt file beside them; returns the stats file path
+    """
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{NAME_UNSAFE_RE.sub('_', name)}.prof")
+    pstats.Stats(profiler).dump_stats(path)
+    with open(os.path.splitext(path)[0] + '.txt', 'w') as summary:
+        summary.write(f"Profile of {name}; slowest by cumulative time:\n")
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(top)
+    return path
+
+
+class ASGIMetricsMiddleware:
+    """ASGI counterpart of the Flask request hooks in app.py, for asgi.py's async routes"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        start_request()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            finish_request()
+            observe_request(scope['method'], scope['path'], status[0], time.perf_counter() - started)
@@ -0,0 +1,225 @@
+"""
+Pages module - per-page text storage for PDF modules
+Each page is stored once in pdf_pages (optionally zlib/zstd compressed) with its
+character offsets in the whole-document text, so callers can load a page range
+instead of the full document. Modules without pages (typed concepts, or rows
+that could not be split) keep using pdfs.content_text.
+"""
+import os
+import re
+import zlib
+from itertools import islice
+from pdf_processor import join_pages, page_marker
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PAGE_COMPRESSION = os.getenv('PAGE_COMPRESSION', 'zlib')   # none, zlib or zstd
+# Shorter pages aren't worth compressing
+COMPRESS_MIN_CHARS = 256
+# Pages written per insert while ingesting, and read back per query when indexing
+PAGE_BATCH_SIZE = int(os.getenv('PAGE_BATCH_SIZE', 32))
+
+MARKER_PATTERN = re.compile(r'\n--- Page (\d+) ---\n')
+
+
+def init_pages_table(conn):
+    """Create the pdf_pages table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_pages (
+            pdf_id INTEGER NOT NULL,
+            page_no INTEGER NOT NULL,
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (pdf_id, page_no)
+        )
+    ''')
+
+
+def encode(text, codec=PAGE_COMPRESSION):
+    """Return (codec, bytes) for a page; falls back to zlib if zstd isn't installed"""
+    raw = text.encode('utf-8')
+    if codec == 'none' or len(text) < COMPRESS_MIN_CHARS:
+        return 'none', raw
+    if codec == 'zstd':
+        if zstandard is not None:
+            return 'zstd', zstandard.ZstdCompressor(level=3).compress(raw)
+        codec = 'zlib'
+    return 'zlib', zlib.compress(raw, 6)
+
+
+def decode(codec, data):
+    if codec == 'zlib':
+        data = zlib.decompress(data)
+    elif codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("This page was stored with zstd; install the zstandard package to read it")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return bytes(data).decode('utf-8')
+
+
+def split_pages(text):
+    """
+    Page texts of a whole-document string built by join_pages, or None if the
+    text isn't in that format (e.g. a typed concept).
+    """
+    parts = MARKER_PATTERN.split(text or '')
+    # ['', '1', page 1, '2', page 2, ...] for well-formed text
+    if len(parts) < 3 or parts[0]:
+        return None
+    numbers = [int(n) for n in parts[1::2]]
+    if numbers != list(range(1, len(numbers) + 1)):
+        return None
+    return parts[2::2]
+
+
+def encode_pages(texts, codec=PAGE_COMPRESSION):
+    """
+    Yield (page_no, start_offset, end_offset, codec, data) for page texts as they
+    arrive, so a document's pages can be compressed without holding all their text
+    """
+    offset = 0
+    for page_no, text in enumerate(texts, start=1):
+        offset += len(page_marker(page_no))
+        page_codec, data = encode(text, codec)
+        yield page_no, offset, offset + len(text), page_codec, data
+        offset += len(text)
+
+
+def store_encoded_pages(conn, pdf_id, rows):
+    """
+    Replace a module's pages with rows from encode_pages (any iterable, consumed
+    lazily); returns (page count, whole-document length)
+    """
+    delete_pages(conn, pdf_id)
+    totals = [0, 0]
+
+    def counted():
+        for row in rows:
+            totals[0] = row[0]
+            totals[1] = row[2]
+            yield row
+
+    insert_encoded_pages(conn, pdf_id, counted())
+    return totals[0], totals[1]
+
+
+def insert_encoded_pages(conn, pdf_id, rows):
+    """Add rows from encode_pages to a module's pages"""
+    conn.executemany('''
+        INSERT INTO pdf_pages (pdf_id, page_no, start_offset, end_offset, codec, data)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', ((pdf_id,) + tuple(row) for row in rows))
+
+
+def batches(rows, size=PAGE_BATCH_SIZE):
+    """Lists of up to `size` items of an iterable, each taken as soon as it is complete"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def store_pages(conn, pdf_id, texts, codec=PAGE_COMPRESSION):
+    """Replace a module's pages; returns the whole-document length"""
+    return store_encoded_pages(conn, pdf_id, encode_pages(texts, codec))[1]
+
+
+def delete_pages(conn, pdf_id):
+    conn.execute('DELETE FROM pdf_pages WHERE pdf_id = ?', (pdf_id,))
+
+
+def has_pages(conn, pdf_id):
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM pdf_pages WHERE pdf_id = ? LIMIT 1', (pdf_id,))
+    return c.fetchone() is not None
+
+
+def page_at(conn, pdf_id, offset):
+    """Number of the page containing a whole-document offset, or None for modules without pages"""
+    c = conn.cursor()
+    c.execute('''
+        SELECT page_no FROM pdf_pages WHERE pdf_id = ? AND start_offset <= ?
+        ORDER BY page_no DESC LIMIT 1
+    ''', (pdf_id, offset))
+    row = c.fetchone()
+    if row:
+        return row[0]
+    return 1 if has_pages(conn, pdf_id) else None
+
+
+def load_pages(conn, pdf_id, start=1, end=None):
+    """
+    Pages start..end (inclusive, 1-based) as dicts with page_no, text and offsets.
+    Only the requested rows are read and decompressed.
+    """
+    c = conn.cursor()
+    query = 'SELECT page_no, start_offset, end_offset, codec, data FROM pdf_pages WHERE pdf_id = ? AND page_no >= ?'
+    params = [pdf_id, start]
+    if end is not None:
+        query += ' AND page_no <= ?'
+        params.append(end)
+    c.execute(query + ' ORDER BY page_no', params)
+    return [
+        {'page_no': page_no, 'start_offset': start_offset, 'end_offset': end_offset,
+         'text': decode(codec, data)}
+        for page_no, start_offset, end_offset, codec, data in c.fetchall()
+    ]
+
+
+class StoredPages:
+    """
+    The page texts of a stored module, read back from pdf_pages a batch at a time
+    every time they are iterated, so the whole document is never held at once
+    """
+
+    def __init__(self, conn, pdf_id, batch_size=PAGE_BATCH_SIZE):
+        self.conn = conn
+        self.pdf_id = pdf_id
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        start = 1
+        while True:
+            batch = load_pages(self.conn, self.pdf_id, start, start + self.batch_size - 1)
+            for page in batch:
+                yield page['text']
+            if len(batch) < self.batch_size:
+                return
+            start += self.batch_size
+
+
+def load_text(conn, pdf_id):
+    """
+    Whole-document text of a module: its pages joined with page markers, or
+    pdfs.content_text for modules without pages. None if the module doesn't exist.
+    """
+    page_texts = [page['text'] for page in load_pages(conn, pdf_id)]
+    if page_texts:
+        return join_pages(page_texts)
+    c = conn.cursor()
+    c.execute('SELECT content_text FROM pdfs WHERE id = ?', (pdf_id,))
+    row = c.fetchone()
+    return (row[0] or '') if row else None
+
+
+def backfill_pages(conn, codec=PAGE_COMPRESSION):
+    """
+    Move PDF modules stored as one content_text blob into pdf_pages.
+    content_text is cleared only when the pages rebuild the exact same text.
+    """
+    c = conn.cursor()
+    c.execute("SELECT id FROM pdfs WHERE content_text IS NOT NULL AND filepath != ''")
+    for (pdf_id,) in c.fetchall():
+        text = conn.execute('SELECT content_text FROM pdfs WHERE id = ?', (pdf_id,)).fetchone()[0]
+        texts = split_pages(text)
+        if texts is None or join_pages(texts) != text:
+            continue
+        store_pages(conn, pdf_id, texts, codec)
+        conn.execute('UPDATE pdfs SET content_text = NULL, page_count = ? WHERE id = ?', (len(texts), pdf_id))
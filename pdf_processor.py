@@ -2,22 +2,201 @@
 PDF processing module - extracts text and metadata from PDFs
 """
 import PyPDF2
+import multiprocessing
 import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from metrics import timed
 
-def extract_text_from_pdf(filepath):
-    """Extract all text from a PDF file"""
+# Parallel extraction settings
+EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', os.cpu_count() or 1))
+PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 64))
+PAGE_TIMEOUT = float(os.getenv('PDF_PAGE_TIMEOUT', 10))
+RANGES_PER_WORKER = 4
+# Extra seconds a range may take on top of page_timeout per page (worker start-up, parsing)
+RANGE_TIMEOUT_SLACK = 15
+
+# One long-lived pool for every document. Workers are spawned rather than forked,
+# since the server forking from its many threads can copy held locks into the child.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PageTimeout(Exception):
+    """Raised when extracting a single page takes longer than the page timeout"""
+
+
+def page_marker(page_no):
+    """Separator placed before each page's text"""
+    return f"\n--- Page {page_no} ---\n"
+
+
+def _can_interrupt():
+    """Whether _page_deadline can stop a page here: SIGALRM exists and this is the main thread"""
+    return hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+
+
+@contextmanager
+def _page_deadline(seconds):
+    """
+    Interrupt a page that takes longer than `seconds`.
+    Uses SIGALRM, so it only applies where _can_interrupt() (always the case
+    inside process pool workers on Linux/macOS).
+    """
+    if not seconds or not _can_interrupt():
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise PageTimeout()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
     try:
-        text = ""
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _extract_page(reader, page_num, page_timeout):
+    """Extract one page's text, returning "" if it fails or times out"""
+    try:
+        with _page_deadline(page_timeout):
+            return reader.pages[page_num].extract_text() or ""
+    except PageTimeout:
+        print(f"Page {page_num + 1} timed out after {page_timeout}s, skipping")
+    except Exception as e:
+        print(f"Error extracting page {page_num + 1}: {e}")
+    return ""
+
+
+def _extract_range(filepath, start, end, page_timeout):
+    """Process pool task: extract pages [start, end) and return their texts"""
+    with open(filepath, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [_extract_page(reader, page_num, page_timeout) for page_num in range(start, end)]
+
+
+def _page_ranges(total, workers):
+    """Split pages into contiguous ranges, a few per worker so slow ranges balance out"""
+    size = max(1, -(-total // (workers * RANGES_PER_WORKER)))
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def _shared_pool():
+    """The extraction process pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _discard_pool(pool):
+    """
+    Stop handing work to a pool with a stuck or dead worker; later work goes to
+    a fresh one. A stuck worker exits once its page finishes.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _iter_parallel(filepath, total, workers, page_timeout, progress=None, range_size=None):
+    """
+    Extract pages across the shared process pool, yielding texts in page order.
+    Each range gets page_timeout seconds per page (plus RANGE_TIMEOUT_SLACK) once
+    the ranges before it are done; a range that overruns comes back empty and the
+    ranges after it move to a fresh pool.
+    """
+    ranges = _page_ranges(total, workers) if range_size is None else \
+        [(start, min(start + range_size, total)) for start in range(0, total, range_size)]
+
+    def submit(pending):
+        pool = _shared_pool()
+        return pool, [pool.submit(_extract_range, filepath, start, end, page_timeout) for start, end in pending]
+
+    pool, futures = submit(ranges)
+    pages_done = 0
+    try:
+        for index, (start, end) in enumerate(ranges):
+            timeout = page_timeout * (end - start) + RANGE_TIMEOUT_SLACK if page_timeout else None
+            try:
+                texts = futures[index].result(timeout=timeout)
+            except (FutureTimeout, BrokenProcessPool) as e:
+                print(f"Pages {start + 1}-{end} {'timed out' if isinstance(e, FutureTimeout) else 'crashed'}, "
+                      "skipping")
+                texts = [""] * (end - start)
+                _discard_pool(pool)
+                pool, futures[index + 1:] = submit(ranges[index + 1:])
+            except Exception as e:
+                print(f"Error extracting pages {start + 1}-{end}: {e}")
+                texts = [""] * (end - start)
+            yield from texts
+            pages_done += end - start
+            if progress:
+                progress(pages_done, total)
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def iter_pages(filepath, progress=None, parallel=None, workers=None, page_timeout=PAGE_TIMEOUT):
+    """
+    Yield the text of every page of a PDF file, in order, as soon as it is extracted.
+    `progress`, if given, is called as progress(pages_done, pages_total) as pages finish.
+    `parallel` splits page ranges across a process pool; by default it is used for
+    documents with at least PDF_PARALLEL_MIN_PAGES pages when more than one worker is available.
+    Pages that fail or exceed `page_timeout` seconds come back empty; a file that
+    can't be read yields nothing. Off the main thread (e.g. in ingest workers) a
+    page can't be interrupted in-process, so even small documents are extracted
+    in the shared worker process pool there, one page per task.
+    """
+    try:
+        workers = workers or EXTRACT_WORKERS
         with open(filepath, 'rb') as file:
             reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(reader.pages)):
-                page = reader.pages[page_num]
-                text += f"\n--- Page {page_num + 1} ---\n"
-                text += page.extract_text()
-        return text
+            total = len(reader.pages)
+            if parallel is None:
+                parallel = workers > 1 and total >= PARALLEL_MIN_PAGES
+            parallel = parallel and total > 1
+            isolate = bool(page_timeout and total) and not parallel and not _can_interrupt()
+            if isolate and not hasattr(signal, 'SIGALRM'):
+                print("Hung pages can't be interrupted on this platform; their worker process is abandoned")
+
+            if parallel:
+                yield from _iter_parallel(filepath, total, workers, page_timeout, progress)
+                return
+            if isolate:
+                yield from _iter_parallel(filepath, total, 1, page_timeout, progress, range_size=1)
+                return
+
+            for page_num in range(total):
+                yield _extract_page(reader, page_num, page_timeout)
+                if progress:
+                    progress(page_num + 1, total)
     except Exception as e:
         print(f"Error extracting PDF: {e}")
-        return ""
+
+
+@timed('pdf_extract')
+def extract_pages(filepath, progress=None, parallel=None, workers=None, page_timeout=PAGE_TIMEOUT):
+    """Extract the text of every page of a PDF file as a list (see iter_pages for the options)"""
+    return list(iter_pages(filepath, progress, parallel, workers, page_timeout))
+
+def join_pages(texts):
+    """Whole-document text: every page preceded by its page marker"""
+    return "".join(page_marker(page_num + 1) + text for page_num, text in enumerate(texts))
+
+def extract_text_from_pdf(filepath, progress=None, parallel=None, workers=None, page_timeout=PAGE_TIMEOUT):
+    """Extract all text from a PDF file (see extract_pages for the options)"""
+    return join_pages(extract_pages(filepath, progress, parallel, workers, page_timeout))
 
 def get_pdf_info(filepath):
     """Get metadata from PDF"""
@@ -0,0 +1,227 @@
+"""
+Quiz bank module - precomputed MCQs per module
+Questions are generated in the background after a module is ingested and stored
+in the mcqs table with their difficulty and source page. /api/generate-mcq then
+serves a random subset of the least-served questions with one query, and the
+bank is refilled in the background when few unseen questions are left. Refills
+are per difficulty, so a quiz asked for at one difficulty is soon served from
+the bank too. Resetting a module's bank bumps pdfs.bank_generation, and a fill
+that started before the reset drops its questions instead of storing them.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from answer_cache import normalize_question, shingles
+from llm_client import get_client
+import db
+import local_mcq
+
+QUIZ_BANK_SIZE = int(os.getenv('QUIZ_BANK_SIZE', 40))          # unserved questions kept ready; 0 disables
+QUIZ_BANK_LOW_WATER = int(os.getenv('QUIZ_BANK_LOW_WATER', 10))  # refill below this many unserved
+QUIZ_BANK_MAX_ROWS = int(os.getenv('QUIZ_BANK_MAX_ROWS', 300))   # per module; most-served dropped first
+QUIZ_BANK_WORKERS = int(os.getenv('QUIZ_BANK_WORKERS', 1))
+
+MCQ_COLUMNS = ('id', 'question', 'options', 'correct', 'difficulty', 'explanation', 'source_page')
+
+
+def init_quiz_table(conn):
+    """Create the mcqs table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mcqs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pdf_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            options TEXT NOT NULL,
+            correct TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            explanation TEXT NOT NULL DEFAULT '',
+            source_page INTEGER,
+            source TEXT NOT NULL,
+            served_count INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_mcqs_pdf_served ON mcqs(pdf_id, served_count)')
+
+
+def init_bank_generation(conn):
+    """Add the pdfs.bank_generation column"""
+    db.add_column(conn.cursor(), 'pdfs', 'bank_generation', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def delete_module(conn, pdf_id):
+    """Drop a module's questions; fills already generating from its old content won't store theirs"""
+    conn.execute('DELETE FROM mcqs WHERE pdf_id = ?', (pdf_id,))
+    conn.execute('UPDATE pdfs SET bank_generation = bank_generation + 1 WHERE id = ?', (pdf_id,))
+
+
+def generation(conn, pdf_id):
+    """The module's bank generation, or None if the module doesn't exist"""
+    row = conn.execute('SELECT bank_generation FROM pdfs WHERE id = ?', (pdf_id,)).fetchone()
+    return row[0] if row else None
+
+
+def store(conn, pdf_id, mcqs, source):
+    """Add validated MCQs (as returned by mcq_engine) to a module's bank"""
+    now = time.time()
+    conn.executemany('''
+        INSERT INTO mcqs (pdf_id, question, options, correct, difficulty, explanation, source_page, source, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(pdf_id, m['question'], json.dumps(m['options']), m['correct'], m.get('difficulty', 'medium'),
+           m.get('explanation', ''), m.get('page'), source, now) for m in mcqs])
+
+
+def unserved_count(conn, pdf_id, difficulty=None):
+    c = conn.cursor()
+    if difficulty:
+        c.execute('SELECT COUNT(*) FROM mcqs WHERE pdf_id = ? AND served_count = 0 AND difficulty = ?',
+                  (pdf_id, difficulty))
+    else:
+        c.execute('SELECT COUNT(*) FROM mcqs WHERE pdf_id = ? AND served_count = 0', (pdf_id,))
+    return c.fetchone()[0]
+
+
+def _row_to_mcq(row):
+    mcq = dict(zip(MCQ_COLUMNS, row))
+    mcq['options'] = json.loads(mcq['options'])
+    mcq['page'] = mcq.pop('source_page')
+    return mcq
+
+
+def _prune(conn, pdf_id):
+    """Keep at most QUIZ_BANK_MAX_ROWS questions per module, dropping the most served"""
+    conn.execute('''
+        DELETE FROM mcqs WHERE id IN (
+            SELECT id FROM mcqs WHERE pdf_id = ?
+            ORDER BY served_count DESC, id LIMIT max(0, (SELECT COUNT(*) FROM mcqs WHERE pdf_id = ?) - ?)
+        )
+    ''', (pdf_id, pdf_id, QUIZ_BANK_MAX_ROWS))
+
+
+class QuizBank:
+    """Serves MCQs from the mcqs table and keeps each module's bank topped up in the background"""
+
+    def __init__(self, db_name, workers=QUIZ_BANK_WORKERS):
+        self.db_name = db_name
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='quiz-bank')
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return db.connect(self.db_name)
+
+    def draw(self, conn, pdf_id, count, difficulty=None):
+        """
+        Up to `count` random questions (of one difficulty, if given), least-served
+        first; fewer, or none, if the bank doesn't have that many yet. Schedules a
+        refill of that difficulty when it comes up short or is running low.
+        """
+        where = 'pdf_id = ?'
+        params = [pdf_id]
+        if difficulty:
+            where += ' AND difficulty = ?'
+            params.append(difficulty)
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT {", ".join(MCQ_COLUMNS)} FROM mcqs WHERE {where}
+            ORDER BY served_count, RANDOM() LIMIT ?
+        ''', (*params, count))
+        rows = c.fetchall()
+        if len(rows) < count:
+            self.schedule_fill(pdf_id, difficulty)
+            if not rows:
+                return []
+
+        placeholders = ','.join('?' * len(rows))
+        conn.execute(f'UPDATE mcqs SET served_count = served_count + 1 WHERE id IN ({placeholders})',
+                     [row[0] for row in rows])
+        conn.commit()
+        if len(rows) == count and unserved_count(conn, pdf_id, difficulty) < QUIZ_BANK_LOW_WATER:
+            self.schedule_fill(pdf_id, difficulty)
+        return [_row_to_mcq(row) for row in rows]
+
+    def schedule_fill(self, pdf_id, difficulty=None):
+        """Queue a background refill of the module's bank (no-op if one is already queued)"""
+        if QUIZ_BANK_SIZE <= 0:
+            return
+        key = (pdf_id, difficulty)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self.executor.submit(self._fill_job, key)
+
+    def _fill_job(self, key):
+        try:
+            self.fill(key[0], difficulty=key[1])
+        except Exception as e:
+            print(f"Quiz bank fill for module {key[0]} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def fill(self, pdf_id, target=QUIZ_BANK_SIZE, difficulty=None):
+        """
+        Generate questions until the module has `target` unserved ones (of
+        `difficulty`, if given); returns how many were added
+        """
+        import mcq_engine
+        import retrieval
+        source = 'llm' if get_client() is not None else 'local'
+        conn = self._connect()
+        try:
+            if not retrieval.ensure_indexed(conn, pdf_id):
+                return 0
+            started_generation = generation(conn, pdf_id)
+            if source == 'llm':
+                # Pseudo-MCQs made while no LLM was configured are replaced by real ones
+                conn.execute("DELETE FROM mcqs WHERE pdf_id = ? AND source = 'local'", (pdf_id,))
+                conn.commit()
+            # Small modules can't yield a full bank of distinct questions
+            chunk_count = conn.execute('SELECT chunk_count FROM chunk_stats WHERE pdf_id = ?', (pdf_id,)).fetchone()
+            target = min(target, (chunk_count[0] if chunk_count else 1) * mcq_engine.MCQ_BATCH_SIZE)
+            needed = target - unserved_count(conn, pdf_id, difficulty)
+            if needed <= 0:
+                return 0
+            needed = min(needed, mcq_engine.MCQ_MAX_COUNT)
+            existing = [row[0] for row in conn.execute('SELECT question FROM mcqs WHERE pdf_id = ?', (pdf_id,))]
+            if source == 'local':
+                # Offline questions are a quick read of the module's sentence index
+                local_mcq.ensure_sentence_index(conn, pdf_id)
+                if difficulty:
+                    # Offline difficulty can't be asked for; keep the questions that came out at it
+                    mcqs = local_mcq.generate(conn, pdf_id, needed * len(mcq_engine.DIFFICULTIES))
+                    mcqs = [mcq for mcq in mcqs if mcq['difficulty'] == difficulty][:needed]
+                else:
+                    mcqs = local_mcq.generate(conn, pdf_id, needed)
+            else:
+                sections = mcq_engine.section_contexts(conn, pdf_id, len(mcq_engine.split_count(needed)))
+        finally:
+            conn.close()
+
+        if source == 'llm':
+            # No connection is held while the LLM works
+            mcqs = mcq_engine.generate_from_contexts([text for text, _ in sections], needed,
+                                                     pages=[page for _, page in sections], fallback=False,
+                                                     difficulty=difficulty)
+        seen = [shingles(normalize_question(question)) for question in existing]
+        mcqs = mcq_engine.dedupe_mcqs(mcqs, seen)
+        if not mcqs:
+            return 0
+
+        conn = self._connect()
+        try:
+            # The module may have been deleted or re-indexed while its questions were generated;
+            # the write lock keeps it from happening between the check and the insert
+            conn.execute('BEGIN IMMEDIATE')
+            if generation(conn, pdf_id) != started_generation:
+                conn.rollback()
+                return 0
+            store(conn, pdf_id, mcqs, source)
+            _prune(conn, pdf_id)
+            conn.commit()
+        finally:
+            conn.close()
+        return len(mcqs)
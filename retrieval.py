@@ -0,0 +1,371 @@
+"""
+Retrieval module - splits module text into overlapping chunks at ingest time
+and selects the most relevant chunks for a prompt within a token budget
+"""
+import os
+import fulltext
+import pages
+from metrics import timed
+from pdf_processor import page_marker
+import search_index
+import token_budget
+
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', 1200))          # characters per chunk
+CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', 200))     # characters shared by neighbouring chunks
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 750))
+MCQ_TOKEN_BUDGET = int(os.getenv('MCQ_TOKEN_BUDGET', 1000))
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 6))
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'bm25')     # 'bm25' or 'embedding'
+KEYWORD_BACKEND = os.getenv('KEYWORD_BACKEND', 'bm25')   # local fallback lookup: 'bm25' or 'fts5'
+
+# Rough size of a token, only for planning how many chunks might fit
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text, model=None):
+    """Token count of text for the model (see token_budget)"""
+    return token_budget.count_tokens(text, model)
+
+
+def truncate_to_tokens(text, budget, model=None):
+    """Cut text down to at most `budget` tokens"""
+    return token_budget.truncate(text, budget, model)
+
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Split text into overlapping chunks, preferring to break on whitespace.
+    Returns a list of (start_offset, end_offset, chunk_text).
+    """
+    return list(iter_chunks([text], chunk_size, overlap))
+
+
+def iter_chunks(pieces, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    chunk_text over text that arrives in pieces (e.g. page by page): yields the
+    same chunks, with offsets into the joined text, while holding only about a
+    chunk's worth of text beyond the current piece
+    """
+    pieces = iter(pieces)
+    text = ''       # the joined text from offset `base` on
+    base = 0
+    ended = False
+    start = 0
+    while True:
+        # A chunk is only cut once its whole window is read (or the text has ended)
+        while not ended and base + len(text) <= start + chunk_size:
+            piece = next(pieces, None)
+            if piece is None:
+                ended = True
+            else:
+                text += piece
+        length = base + len(text)
+        if start >= length:
+            break
+        end = min(start + chunk_size, length)
+        if end < length:
+            # Back up to the last whitespace so words aren't split
+            floor = start + chunk_size // 2
+            cut = max(text.rfind(' ', floor - base, end - base), text.rfind('\n', floor - base, end - base))
+            if cut != -1 and base + cut > 0:
+                end = base + cut + 1
+        raw = text[start - base:end - base]
+        piece = raw.strip()
+        if piece:
+            # Offsets point at the stripped piece so text[start:end] == piece
+            piece_start = start + len(raw) - len(raw.lstrip())
+            yield piece_start, piece_start + len(piece), piece
+        if end >= length:
+            break
+        # Start the next chunk `overlap` characters back, on a word boundary
+        next_start = end - overlap
+        space = text.find(' ', next_start - base, end - base)
+        start = max(base + space + 1 if space != -1 else next_start, start + 1)
+        # No later chunk looks further back than `overlap` before its start
+        if start - overlap > base:
+            text = text[start - overlap - base:]
+            base = start - overlap
+
+
+def index_module(conn, pdf_id, text, embed=None):
+    """
+    Build every per-module search structure (paragraph index, chunks and full-text
+    rows) from a module's whole-document text, each replacing its old rows.
+    Chunks are embedded too in embedding mode, unless `embed` is False.
+    Answers and quiz questions built from older content are the caller's to drop.
+    """
+    text = text or ""
+    page_texts = pages.split_pages(text)
+    if page_texts is not None:
+        index_pages(conn, pdf_id, page_texts, embed)
+        return
+    search_index.build_index(conn, pdf_id, text)
+    _store_chunks(conn, pdf_id, chunk_text(text))
+    fulltext.index_text(conn, pdf_id, text)
+    _embed(conn, pdf_id, embed)
+
+
+def index_pages(conn, pdf_id, page_texts, embed=None):
+    """
+    index_module for a paged module, without joining its pages into one string.
+    Each index reads the pages once, so `page_texts` must be re-iterable: a list,
+    or pages.StoredPages to read them back from the database a batch at a time.
+    """
+    def pieces():
+        for page_no, page_text in enumerate(page_texts, start=1):
+            yield page_marker(page_no)
+            yield page_text
+
+    search_index.store_paragraphs(conn, pdf_id, search_index.iter_paragraphs(pieces()))
+    _store_chunks(conn, pdf_id, iter_chunks(pieces()))
+    fulltext.index_pages(conn, pdf_id, page_texts)
+    _embed(conn, pdf_id, embed)
+
+
+def _store_chunks(conn, pdf_id, chunks):
+    """Replace a module's chunks and their postings (any iterable of chunks, consumed once)"""
+    lengths = []
+    postings = {}
+
+    def rows():
+        for chunk_no, (start, end, piece) in enumerate(chunks):
+            lengths.append(search_index.add_postings(postings, chunk_no, piece))
+            yield pdf_id, chunk_no, start, end, lengths[-1], piece
+
+    _delete_chunks(conn, pdf_id)
+    conn.cursor().executemany(
+        'INSERT INTO chunks (pdf_id, chunk_no, start_offset, end_offset, length, text) VALUES (?, ?, ?, ?, ?, ?)',
+        rows()
+    )
+    search_index.store_postings(conn, pdf_id, 'chunk_terms', 'chunk_stats', 'chunk_count', lengths, postings)
+
+
+def _embed(conn, pdf_id, embed):
+    if embed is None:
+        embed = RETRIEVAL_MODE == 'embedding'
+    if embed:
+        embed_chunks(conn, pdf_id)
+
+
+def _delete_chunks(conn, pdf_id):
+    c = conn.cursor()
+    c.execute('DELETE FROM chunks WHERE pdf_id = ?', (pdf_id,))
+    c.execute('DELETE FROM chunk_terms WHERE pdf_id = ?', (pdf_id,))
+    c.execute('DELETE FROM chunk_stats WHERE pdf_id = ?', (pdf_id,))
+
+
+def delete_module_index(conn, pdf_id):
+    """
+    Remove every search structure index_module builds for a module. Call it while
+    the module's text is still stored (see fulltext.delete_module).
+    """
+    search_index.delete_index(conn, pdf_id)
+    _delete_chunks(conn, pdf_id)
+    fulltext.delete_module(conn, pdf_id)
+    try:
+        from embedding_store import EmbeddingStore
+        EmbeddingStore().delete(pdf_id)
+    except ImportError:
+        # NumPy isn't installed, so no vectors can have been written
+        pass
+
+
+def embed_chunks(conn, pdf_id, store=None, embedder=None):
+    """Embed a module's stored chunks and write them to the embedding store"""
+    from embedding_store import EmbeddingStore, get_embedder
+    store = store or EmbeddingStore()
+    embedder = embedder or get_embedder()
+
+    c = conn.cursor()
+    c.execute('SELECT chunk_no, text FROM chunks WHERE pdf_id = ? ORDER BY chunk_no', (pdf_id,))
+    rows = c.fetchall()
+    vectors = embedder.embed([text for _, text in rows])
+    store.save(pdf_id, vectors, [chunk_no for chunk_no, _ in rows], embedder.name)
+
+
+def _has_embeddings(pdf_id):
+    """Check that a module has vectors from the currently configured embedder"""
+    from embedding_store import EmbeddingStore, get_embedder
+    loaded = EmbeddingStore().load(pdf_id)
+    return loaded is not None and loaded[0]['embedder'] == get_embedder().name
+
+
+def ensure_indexed(conn, pdf_id):
+    """
+    Index modules stored before chunking existed.
+    Returns False if the module does not exist.
+    """
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM chunk_stats WHERE pdf_id = ?', (pdf_id,))
+    if c.fetchone() and search_index.has_index(conn, pdf_id):
+        if RETRIEVAL_MODE == 'embedding' and not _has_embeddings(pdf_id):
+            embed_chunks(conn, pdf_id)
+        return True
+
+    if pages.has_pages(conn, pdf_id):
+        index_pages(conn, pdf_id, pages.StoredPages(conn, pdf_id))
+    else:
+        text = pages.load_text(conn, pdf_id)
+        if text is None:
+            return False
+        index_module(conn, pdf_id, text)
+    conn.commit()
+    return True
+
+
+class ChunkIndex(search_index.StoredIndex):
+    """BM25 lookups against the stored chunks of one module"""
+    units_table = 'chunks'
+    unit_column = 'chunk_no'
+    terms_table = 'chunk_terms'
+    stats_table = 'chunk_stats'
+    count_column = 'chunk_count'
+
+
+class EmbeddingIndex:
+    """Semantic lookups against a module's chunk vectors (see embedding_store)"""
+
+    def __init__(self, conn, pdf_id, store=None, embedder=None):
+        from embedding_store import EmbeddingStore, get_embedder
+        self.conn = conn
+        self.pdf_id = pdf_id
+        self.store = store or EmbeddingStore()
+        self.embedder = embedder or get_embedder()
+
+    def rank(self, query, top_k=1):
+        """Return up to top_k (score, chunk_no) pairs for the query"""
+        if not search_index.tokenize(query):
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        return [(score, chunk_no) for score, chunk_no in self.store.search(self.pdf_id, query_vector, top_k)
+                if score > 0]
+
+    def search(self, query, top_k=1):
+        """Return up to top_k (score, chunk text) pairs for the query"""
+        ranked = self.rank(query, top_k)
+        texts = {row[0]: row[3] for row in _load_chunks(self.conn, self.pdf_id, [no for _, no in ranked])}
+        return [(score, texts[chunk_no]) for score, chunk_no in ranked if chunk_no in texts]
+
+
+def get_search_index(conn, pdf_id):
+    """
+    Index used by the local fallback: paragraphs for BM25 (or FTS5 pages with
+    KEYWORD_BACKEND=fts5), chunk vectors for embedding mode
+    """
+    if RETRIEVAL_MODE == 'embedding':
+        return EmbeddingIndex(conn, pdf_id)
+    if KEYWORD_BACKEND == 'fts5' and fulltext.has_table(conn):
+        return fulltext.PageIndex(conn, pdf_id)
+    return search_index.ParagraphIndex(conn, pdf_id)
+
+
+def _chunk_index(conn, pdf_id):
+    """Index used to rank chunks for LLM prompts"""
+    if RETRIEVAL_MODE == 'embedding':
+        return EmbeddingIndex(conn, pdf_id)
+    return ChunkIndex(conn, pdf_id)
+
+
+def _load_chunks(conn, pdf_id, chunk_nos):
+    """Fetch (chunk_no, start, end, text) rows in document order"""
+    if not chunk_nos:
+        return []
+    placeholders = ','.join('?' * len(chunk_nos))
+    c = conn.cursor()
+    c.execute(
+        f'SELECT chunk_no, start_offset, end_offset, text FROM chunks '
+        f'WHERE pdf_id = ? AND chunk_no IN ({placeholders}) ORDER BY chunk_no',
+        (pdf_id, *chunk_nos)
+    )
+    return c.fetchall()
+
+
+def _join_chunks(rows):
+    """Join chunks in document order, dropping text shared by adjacent overlapping chunks"""
+    parts = []
+    prev_no, prev_end = None, None
+    for chunk_no, start, end, text in rows:
+        if prev_no is not None and chunk_no == prev_no + 1 and start < prev_end:
+            parts[-1] += text[prev_end - start:]
+        else:
+            parts.append(text)
+        prev_no, prev_end = chunk_no, end
+    return '\n...\n'.join(parts)
+
+
+def _pack(conn, pdf_id, chunk_nos, budget):
+    """
+    Take chunks in the given priority order until the token budget is spent.
+    Returns the chosen (chunk_no, start, end, text) rows in document order, or
+    ([], truncated text) when even the first chunk is over budget.
+    """
+    chunk_nos = list(dict.fromkeys(chunk_nos))
+    rows = {row[0]: row for row in _load_chunks(conn, pdf_id, chunk_nos)}
+    selected = []
+    used = 0
+    for chunk_no in chunk_nos:
+        row = rows.get(chunk_no)
+        if row is None:
+            continue
+        cost = estimate_tokens(row[3])
+        if used + cost > budget:
+            if not selected:
+                # Always return something, even if the first chunk alone is over budget
+                return [], truncate_to_tokens(row[3], budget)
+            continue
+        selected.append(row)
+        used += cost
+    return sorted(selected), None
+
+
+@timed('retrieval')
+def select_context(conn, pdf_id, question, budget=CONTEXT_TOKEN_BUDGET, top_k=RETRIEVAL_TOP_K):
+    """
+    Pick the chunks most relevant to the question that fit in `budget` tokens.
+    Falls back to the opening chunks when nothing in the module matches.
+    """
+    ranked = [chunk_no for _, chunk_no in _chunk_index(conn, pdf_id).rank(question, top_k)]
+    if not ranked:
+        ranked = list(range(top_k))
+
+    selected, truncated = _pack(conn, pdf_id, ranked, budget)
+    if truncated is not None:
+        return truncated
+    return _join_chunks(selected)
+
+
+def module_terms(conn, pdf_id, terms):
+    """The given terms that occur in a module's chunks"""
+    terms = list(terms)
+    if not terms:
+        return set()
+    placeholders = ','.join('?' * len(terms))
+    c = conn.cursor()
+    c.execute(f'SELECT term FROM chunk_terms WHERE pdf_id = ? AND term IN ({placeholders})', (pdf_id, *terms))
+    return {term for term, in c.fetchall()}
+
+
+def spread_context(conn, pdf_id, budget=MCQ_TOKEN_BUDGET, first=0, last=None):
+    """
+    Pick chunks evenly spaced across the whole module (or chunks first..last-1)
+    within `budget` tokens
+    """
+    c = conn.cursor()
+    c.execute('SELECT chunk_count, avg_length FROM chunk_stats WHERE pdf_id = ?', (pdf_id,))
+    stats = c.fetchone()
+    if not stats or not stats[0]:
+        return ""
+    last = stats[0] if last is None else min(last, stats[0])
+    chunk_count = last - first
+    if chunk_count <= 0:
+        return ""
+
+    # Estimate how many chunks fit, then sample that many across the range
+    fits = max(1, budget // max(1, CHUNK_SIZE // CHARS_PER_TOKEN))
+    step = max(1, chunk_count / fits)
+    candidates = sorted({first + int(i * step) for i in range(min(fits, chunk_count))})
+
+    selected, truncated = _pack(conn, pdf_id, candidates, budget)
+    if truncated is not None:
+        return truncated
+    return _join_chunks(selected)
@@ -0,0 +1,234 @@
+"""
+Search index module - tokenized inverted index with BM25 ranking
+Built once per module at ingest time so lookups don't rescan the full text
+"""
+import json
+import math
+import re
+from collections import Counter
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# BM25 tuning parameters (standard defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """Lowercase text and split it into alphanumeric terms"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def split_paragraphs(text):
+    """Split text into non-empty paragraphs on blank lines"""
+    return [p.strip() for p in text.split('\n\n') if p.strip()]
+
+
+def iter_paragraphs(pieces):
+    """
+    split_paragraphs over text that arrives in pieces (e.g. page by page),
+    without joining them: yields the same paragraphs
+    """
+    current = []     # pieces of the paragraph being read, none containing a blank line
+    for piece in pieces:
+        if not piece:
+            continue
+        # A blank line split across two pieces
+        if current and current[-1].endswith('\n') and piece.startswith('\n'):
+            paragraph = ''.join(current)[:-1].strip()
+            if paragraph:
+                yield paragraph
+            current = []
+            piece = piece[1:]
+        parts = piece.split('\n\n')
+        if len(parts) > 1:
+            parts[0] = ''.join(current) + parts[0]
+            current = []
+            for part in parts[:-1]:
+                if part.strip():
+                    yield part.strip()
+        if parts[-1]:
+            current.append(parts[-1])
+    paragraph = ''.join(current).strip()
+    if paragraph:
+        yield paragraph
+
+
+def build_postings(units):
+    """
+    Build an inverted index over a list of text units.
+    Returns (lengths, postings) where postings maps term -> [[unit_no, tf], ...]
+    """
+    lengths = []
+    postings = {}
+    for unit_no, unit in enumerate(units):
+        lengths.append(add_postings(postings, unit_no, unit))
+    return lengths, postings
+
+
+def add_postings(postings, unit_no, unit):
+    """Add one text unit to `postings` (see build_postings); returns its length in terms"""
+    counts = Counter(tokenize(unit))
+    for term, tf in counts.items():
+        postings.setdefault(term, []).append([unit_no, tf])
+    return sum(counts.values())
+
+
+def bm25_rank(query_terms, postings, lengths, unit_count, avg_length, top_k=1):
+    """
+    Score units against query terms with BM25.
+    `postings` only needs entries for the query terms; `lengths` maps unit_no -> length.
+    Returns a list of (score, unit_no) sorted best first.
+    """
+    scores = {}
+    for term in set(query_terms):
+        term_postings = postings.get(term)
+        if not term_postings:
+            continue
+        df = len(term_postings)
+        idf = math.log(1 + (unit_count - df + 0.5) / (df + 0.5))
+        for unit_no, tf in term_postings:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[unit_no] / (avg_length or 1))
+            scores[unit_no] = scores.get(unit_no, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    ranked = sorted(((score, unit_no) for unit_no, score in scores.items()), reverse=True)
+    return ranked[:top_k]
+
+
+def store_postings(conn, pdf_id, terms_table, stats_table, count_column, lengths, postings):
+    """Write postings and collection stats for one module into the given tables"""
+    avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+    c = conn.cursor()
+    c.executemany(
+        f'INSERT INTO {terms_table} (pdf_id, term, postings) VALUES (?, ?, ?)',
+        [(pdf_id, term, json.dumps(plist, separators=(',', ':'))) for term, plist in postings.items()]
+    )
+    c.execute(
+        f'INSERT INTO {stats_table} (pdf_id, {count_column}, avg_length) VALUES (?, ?, ?)',
+        (pdf_id, len(lengths), avg_length)
+    )
+
+
+def build_index(conn, pdf_id, text):
+    """Tokenize a module's paragraphs and store the inverted index for it"""
+    store_paragraphs(conn, pdf_id, split_paragraphs(text or ""))
+
+
+def store_paragraphs(conn, pdf_id, paragraphs):
+    """Store the inverted index of a module's paragraphs (any iterable, consumed once)"""
+    lengths = []
+    postings = {}
+
+    def rows():
+        for para_no, para in enumerate(paragraphs):
+            lengths.append(add_postings(postings, para_no, para))
+            yield pdf_id, para_no, lengths[-1], para
+
+    delete_index(conn, pdf_id)
+    conn.cursor().executemany(
+        'INSERT INTO index_paragraphs (pdf_id, para_no, length, text) VALUES (?, ?, ?, ?)', rows()
+    )
+    store_postings(conn, pdf_id, 'index_terms', 'index_stats', 'paragraph_count', lengths, postings)
+
+
+def delete_index(conn, pdf_id):
+    """Remove the stored index for a module"""
+    c = conn.cursor()
+    c.execute('DELETE FROM index_paragraphs WHERE pdf_id = ?', (pdf_id,))
+    c.execute('DELETE FROM index_terms WHERE pdf_id = ?', (pdf_id,))
+    c.execute('DELETE FROM index_stats WHERE pdf_id = ?', (pdf_id,))
+
+
+def has_index(conn, pdf_id):
+    """Check whether a module has been indexed"""
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM index_stats WHERE pdf_id = ?', (pdf_id,))
+    return c.fetchone() is not None
+
+
+class StoredIndex:
+    """
+    BM25 lookups against an index stored in SQLite for one module.
+    Subclasses name the tables holding the units, their postings and stats.
+    """
+    units_table = None
+    unit_column = None
+    terms_table = None
+    stats_table = None
+    count_column = None
+
+    def __init__(self, conn, pdf_id):
+        self.conn = conn
+        self.pdf_id = pdf_id
+
+    def rank(self, query, top_k=1):
+        """Return up to top_k (score, unit_no) pairs for the query"""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+
+        c = self.conn.cursor()
+        c.execute(
+            f'SELECT {self.count_column}, avg_length FROM {self.stats_table} WHERE pdf_id = ?',
+            (self.pdf_id,)
+        )
+        stats = c.fetchone()
+        if not stats or not stats[0]:
+            return []
+        unit_count, avg_length = stats
+
+        placeholders = ','.join('?' * len(terms))
+        c.execute(
+            f'SELECT term, postings FROM {self.terms_table} WHERE pdf_id = ? AND term IN ({placeholders})',
+            (self.pdf_id, *terms)
+        )
+        postings = {term: json.loads(plist) for term, plist in c.fetchall()}
+        if not postings:
+            return []
+
+        candidates = sorted({unit_no for plist in postings.values() for unit_no, _ in plist})
+        placeholders = ','.join('?' * len(candidates))
+        c.execute(
+            f'SELECT {self.unit_column}, length FROM {self.units_table} '
+            f'WHERE pdf_id = ? AND {self.unit_column} IN ({placeholders})',
+            (self.pdf_id, *candidates)
+        )
+        lengths = dict(c.fetchall())
+
+        return bm25_rank(terms, postings, lengths, unit_count, avg_length, top_k)
+
+    def search(self, query, top_k=1):
+        """Return up to top_k (score, text) pairs for the query"""
+        c = self.conn.cursor()
+        results = []
+        for score, unit_no in self.rank(query, top_k):
+            c.execute(
+                f'SELECT text FROM {self.units_table} WHERE pdf_id = ? AND {self.unit_column} = ?',
+                (self.pdf_id, unit_no)
+            )
+            results.append((score, c.fetchone()[0]))
+        return results
+
+
+class ParagraphIndex(StoredIndex):
+    """BM25 lookups against the stored paragraph index of one module"""
+    units_table = 'index_paragraphs'
+    unit_column = 'para_no'
+    terms_table = 'index_terms'
+    stats_table = 'index_stats'
+    count_column = 'paragraph_count'
+
+
+class MemoryIndex:
+    """In-memory BM25 index for text that was never stored (e.g. ad-hoc context)"""
+
+    def __init__(self, text):
+        self.paragraphs = split_paragraphs(text or "")
+        self.lengths, self.postings = build_postings(self.paragraphs)
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def search(self, query, top_k=1):
+        """Return up to top_k (score, paragraph) pairs for the query"""
+        ranked = bm25_rank(tokenize(query), self.postings, self.lengths,
+                           len(self.paragraphs), self.avg_length, top_k)
+        return [(score, self.paragraphs[unit_no]) for score, unit_no in ranked]
@@ -0,0 +1,114 @@
+"""
+Stub OpenAI-compatible LLM server for tests and benchmarks
+Serves /chat/completions (plain and `stream: true`) with canned answers,
+optionally with a delay per response and per streamed chunk.
+
+Usage:
+    python stub_llm_server.py --port 8001 --delay 0.5
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8001 python app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ANSWER = "This is a stub answer streamed in small chunks so clients can render it as it arrives."
+CANNED_MCQS = [
+    {
+        "question": "Which statement is covered in the module?",
+        "options": ["The stub content", "Astronomy", "Cooking", "Sports"],
+        "correct": "A",
+        "difficulty": "easy",
+        "explanation": "The stub server always returns this question."
+    }
+]
+
+
+def chunk_words(text, words_per_chunk=2):
+    """Split text into small chunks like a model streaming tokens"""
+    words = text.split(' ')
+    return [' '.join(words[i:i + words_per_chunk]) + (' ' if i + words_per_chunk < len(words) else '')
+            for i in range(0, len(words), words_per_chunk)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+
+        time.sleep(self.server.delay)
+        system = (request.get('messages') or [{}])[0].get('content', '')
+        answer = json.dumps(CANNED_MCQS) if 'quiz' in system.lower() else CANNED_ANSWER
+        prompt_tokens = sum(len(m.get('content', '')) // 4 for m in request.get('messages', []))
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(answer) // 4,
+                 'total_tokens': prompt_tokens + len(answer) // 4}
+
+        if not request.get('stream'):
+            self._send_json(200, {
+                'id': 'stub', 'object': 'chat.completion', 'model': request.get('model', 'stub'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': answer},
+                             'finish_reason': 'stop'}],
+                'usage': usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for piece in chunk_words(answer):
+            event = {'id': 'stub', 'object': 'chat.completion.chunk',
+                     'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(self.server.chunk_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def make_server(host='127.0.0.1', port=0, delay=0.0, chunk_delay=0.0):
+    """Create a stub server; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.chunk_delay = chunk_delay
+    return server
+
+
+def start_in_background(delay=0.0, chunk_delay=0.0):
+    """Start a stub server on a free port in a daemon thread; returns (server, base_url)"""
+    server = make_server(delay=delay, chunk_delay=chunk_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub OpenAI-compatible LLM server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before responding')
+    parser.add_argument('--chunk-delay', type=float, default=0.05, help='Seconds between streamed chunks')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.delay, args.chunk_delay)
+    print(f"Stub LLM server running at http://{args.host}:{server.server_port}")
+    server.serve_forever()
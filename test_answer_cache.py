@@ -0,0 +1,102 @@
+"""
+Test script for the answer cache (answer_cache.py): which rewordings share an
+answer, which questions must not, and the memory/disk tiers
+"""
+import time
+
+import db
+from answer_cache import AnswerCache, invalidate_module, normalize_question, rekey
+from testing import make_db
+
+
+def make_cache(**options):
+    return AnswerCache(make_db(), **options)
+
+
+def test_rewordings_share_an_answer():
+    """Filler words, plurals, case and punctuation don't change the question"""
+    cache = make_cache()
+    cache.put(1, 'What are the causes of inflation?', 'Too much money.')
+    assert normalize_question('Can you tell me what the cause of inflation is, please') == 'cause of inflation'
+    assert cache.get(1, 'cause of INFLATION') == 'Too much money.'
+
+    cache.put(1, 'What happens in photosynthesis?', 'Light becomes sugar.')
+    assert cache.get(1, 'What happens during photosynthesis') == 'Light becomes sugar.'
+    assert cache.get(2, 'What happens in photosynthesis?') is None
+    stats = cache.stats()
+    assert stats['similar_hits'] == 1 and stats['misses'] == 1
+    print("✅ Reworded questions hit the cache")
+
+
+def test_different_questions_do_not_collide():
+    """Swapped, extra or different content words are different questions"""
+    cache = make_cache()
+    cache.put(1, 'Is mitosis faster than meiosis?', 'Yes.')
+    cache.put(1, 'What were the causes of World War I?', 'Alliances.')
+    cache.put(1, 'Explain photosynthesis', 'A long explanation.')
+    cache.put(1, 'Summarize chapter 2', 'Chapter 2 is about cells.')
+    cache.put(1, 'What is the role of enzymes in digestion?', 'They break food down.')
+
+    for question in ('Is meiosis faster than mitosis?',
+                     'What were the causes of World War II?',
+                     'Define photosynthesis',
+                     'Summarize chapter 3',
+                     'What is the role of digestion in enzymes?',
+                     'What is the role of enzymes?',
+                     'the war i causes of world'):
+        assert cache.get(1, question) is None, question
+    assert cache.stats()['misses'] == 7
+
+    # Directions are part of the question
+    cache.put(1, 'Convert the speed from km/h to m/s', 'Divide by 3.6.')
+    cache.put(1, 'Is water drawn into the cell by osmosis?', 'Yes.')
+    assert cache.get(1, 'Convert the speed to km/h from m/s') is None
+    assert cache.get(1, 'Is water drawn from the cell by osmosis?') is None
+    assert cache.get(1, 'convert speed from km/h to m/s') == 'Divide by 3.6.'
+    print("✅ Reordered and different questions miss")
+
+
+def test_ttl_and_invalidation():
+    """Expired entries miss in both tiers; invalidate_module empties a module"""
+    cache = make_cache(ttl=0.2)
+    cache.put(1, 'What is osmosis?', 'Water moving.')
+    cache.put(2, 'What is osmosis?', 'Other module.')
+    assert cache.get(1, 'what is osmosis') == 'Water moving.'
+    time.sleep(0.3)
+    assert cache.get(1, 'what is osmosis') is None
+
+    cache = make_cache()
+    cache.put(1, 'What is osmosis?', 'Water moving.')
+    cache.put(2, 'What is osmosis?', 'Other module.')
+    conn = db.connect(cache.db_name)
+    invalidate_module(conn, 1)
+    conn.commit()
+    conn.close()
+    assert cache.get(1, 'What is osmosis?') is None
+    assert cache.get(2, 'What is osmosis?') == 'Other module.'
+    print("✅ Entries expire and are dropped with their module")
+
+
+def test_rekey_updates_old_keys():
+    """Rows keyed by an older normalization are found again after rekey"""
+    cache = make_cache()
+    conn = db.connect(cache.db_name)
+    conn.execute('''
+        INSERT INTO answer_cache (pdf_id, question_key, question, answer, created_at, last_used)
+        VALUES (1, 'what happens in photosynthesis', 'What happens in photosynthesis?', 'Sugar.', ?, ?)
+    ''', (time.time(), time.time()))
+    rekey(conn)
+    conn.commit()
+    conn.close()
+    assert cache.get(1, 'What happens during photosynthesis') == 'Sugar.'
+    print("✅ Old rows rekeyed")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Answer Cache Test")
+    print("=" * 60)
+    test_rewordings_share_an_answer()
+    test_different_questions_do_not_collide()
+    test_ttl_and_invalidation()
+    test_rekey_updates_old_keys()
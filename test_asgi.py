@@ -0,0 +1,106 @@
+"""
+Test script for the async serving mode (asgi.py) against the stub LLM server
+"""
+import asyncio
+import threading
+
+import httpx
+from starlette.testclient import TestClient
+
+from testing import make_client, parse_sse, save_module
+
+make_client()  # starts the stub LLM and points the app at it
+import asgi
+import llm_handler
+
+client = TestClient(asgi.app)
+
+
+def test_ask_answers_and_caches():
+    """/api/ask answers from the LLM, then from the answer cache"""
+    pdf_id = save_module(make_client(), 'Async Physics', 'Momentum is mass times velocity. Energy is conserved.')
+    question = 'How is momentum defined in async mode?'
+    first = client.post('/api/ask', json={'pdf_id': pdf_id, 'question': question})
+    assert first.status_code == 200, first.text
+    data = first.json()
+    assert data['answer'] and not data['cached'] and data['session_id'] is None
+
+    second = client.post('/api/ask', json={'pdf_id': pdf_id, 'question': question}).json()
+    assert second['cached'] and second['answer'] == data['answer']
+    assert client.post('/api/ask', json={'pdf_id': pdf_id}).status_code == 400
+    print("✅ Async /api/ask answered and then hit the cache")
+
+
+def test_stream_sends_tokens_then_done():
+    """/api/ask/stream sends token events that add up to the done event's answer"""
+    pdf_id = save_module(make_client(), 'Async Chemistry', 'Acids donate protons. Bases accept protons.')
+    response = client.post('/api/ask/stream', json={'pdf_id': pdf_id, 'question': 'What do acids do?'})
+    assert response.headers['content-type'].startswith('text/event-stream')
+    events = parse_sse(response.text)
+    tokens = [data['delta'] for event, data in events if event == 'token']
+    assert len(tokens) > 1
+    assert events[-1][0] == 'done' and events[-1][1]['answer'] == ''.join(tokens)
+    print(f"✅ Streamed {len(tokens)} tokens over ASGI")
+
+
+def test_malformed_bodies_are_rejected():
+    """Bodies that aren't a JSON object get a 400 from both ask routes"""
+    for path in ('/api/ask', '/api/ask/stream'):
+        for body in ('{"question": ', '["a list"]'):
+            response = client.post(path, content=body, headers={'Content-Type': 'application/json'})
+            assert response.status_code == 400, (path, body, response.status_code)
+    print("✅ Malformed JSON bodies rejected with 400")
+
+
+def test_prompt_building_leaves_event_loop():
+    """Compressing the context for a prompt runs in a worker thread, not on the event loop"""
+    threads = []
+    build = llm_handler._answer_payload
+
+    def recording(*args):
+        threads.append(threading.current_thread())
+        return build(*args)
+
+    llm_handler._answer_payload = recording
+    try:
+        payload = asyncio.run(llm_handler._answer_payload_async('What do genes do?', 'Genes are made of DNA.', 50))
+    finally:
+        llm_handler._answer_payload = build
+    assert payload['messages'] and threads and threads[0] is not threading.main_thread()
+    print("✅ Prompt compression runs off the event loop")
+
+
+def test_flask_routes_are_mounted():
+    """Everything else is the Flask app"""
+    assert client.get('/api/modules').status_code == 200
+    assert client.get('/api/modules/999999').status_code == 404
+    print("✅ Flask routes served through the ASGI app")
+
+
+def test_concurrent_questions():
+    """Many questions in flight at once on one event loop all get answers"""
+    pdf_id = save_module(make_client(), 'Async Biology', 'Cells divide by mitosis. Genes are made of DNA.')
+
+    async def ask_all():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as async_client:
+            return await asyncio.gather(*[
+                async_client.post('/api/ask', json={'pdf_id': pdf_id, 'question': f'Question number {n} about cells?'})
+                for n in range(10)
+            ])
+
+    responses = asyncio.run(ask_all())
+    assert all(r.status_code == 200 and r.json()['answer'] for r in responses)
+    print("✅ 10 concurrent questions answered")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - ASGI Mode Test")
+    print("=" * 60)
+    test_ask_answers_and_caches()
+    test_stream_sends_tokens_then_done()
+    test_malformed_bodies_are_rejected()
+    test_prompt_building_leaves_event_loop()
+    test_flask_routes_are_mounted()
+    test_concurrent_questions()
@@ -0,0 +1,59 @@
+"""
+Test script for the benchmark suite (benchmarks/run_benchmarks.py)
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import run_benchmarks  # noqa: E402
+
+TINY = {'pages': [3], 'ask_pages': 3, 'ask_requests': 8, 'concurrency': 2,
+        'search_queries': 5, 'repeat': 1, 'llm_delay': 0.0}
+
+
+def test_suite_runs_and_writes_json():
+    """Every section runs in its own process and reports JSON-serializable numbers"""
+    report = run_benchmarks.run_suite(TINY, run_benchmarks.SECTIONS)
+    report = json.loads(json.dumps(report))
+    sections = report['sections']
+    assert set(sections) == set(run_benchmarks.SECTIONS) and report['config'] == TINY
+
+    extraction = sections['extraction']['results'][0]
+    assert extraction['pages'] == 3 and extraction['extracted_pages'] == 3 and extraction['pages_per_s'] > 0
+    ingest = sections['ingest']
+    assert ingest['results'][0]['ingest_ms'] > 0 and ingest['fallback_search'][0]['count'] == 5
+    ask = sections['ask']
+    for label in ('fresh_questions', 'repeated_questions'):
+        assert ask[label]['errors'] == 0 and ask[label]['count'] == 8
+    for section in sections.values():
+        assert section['wall_s'] > 0 and section['peak_rss']['self_mb'] > 0
+    run_benchmarks.print_summary(report)
+    print("✅ Benchmark suite produced a complete JSON report")
+
+
+def test_compare_flags_regressions_only():
+    """Slower latencies and lower throughput regress; noise and config values don't"""
+    baseline = {'sections': {
+        'extraction': {'results': [{'pages': 10, 'pages_per_s': 100.0, 'best_s': 0.1}]},
+        'ask': {'llm_delay_s': 0.05, 'fresh_questions': {'p50_ms': 20.0, 'p99_ms': 0.5, 'count': 100}},
+    }}
+    current = {'sections': {
+        'extraction': {'results': [{'pages': 10, 'pages_per_s': 80.0, 'best_s': 0.1}]},
+        'ask': {'llm_delay_s': 0.5, 'fresh_questions': {'p50_ms': 30.0, 'p99_ms': 0.9, 'count': 50}},
+    }}
+    flat = run_benchmarks.flatten(baseline['sections'])
+    assert flat['extraction.results[pages=10].pages_per_s'] == 100.0
+    assert run_benchmarks.compare(baseline, baseline) == []
+    regressions = run_benchmarks.compare(baseline, current)
+    assert sorted(regressions) == ['ask.fresh_questions.p50_ms', 'extraction.results[pages=10].pages_per_s']
+    print("✅ Comparison reports only real regressions")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Benchmark Suite Test")
+    print("=" * 60)
+    test_suite_runs_and_writes_json()
+    test_compare_flags_regressions_only()
@@ -0,0 +1,122 @@
+"""
+Test script for content-addressed upload storage and upload deduplication
+(blob_store.py, ingest_jobs.py, /api/upload)
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+
+import blob_store
+import db
+from ingest_jobs import IngestQueue
+from testing import make_client, make_db, make_pdf, wait_for, wait_for_job
+
+
+def test_blob_writer_hashes_and_dedupes():
+    """Blobs are stored once under their SHA-256; uncommitted and oversized writes leave nothing behind"""
+    blob_dir = tempfile.mkdtemp(prefix='classmate-test-')
+    data = b'%PDF-1.4 ' + os.urandom(3 * blob_store.CHUNK_SIZE)
+    digest, path, created = blob_store.save_stream(io.BytesIO(data), blob_dir)
+    assert digest == hashlib.sha256(data).hexdigest() and created
+    assert path == blob_store.blob_path(blob_dir, digest) and open(path, 'rb').read() == data
+    assert blob_store.hash_file(path) == digest
+    assert blob_store.save_stream(io.BytesIO(data), blob_dir) == (digest, path, False)
+
+    with blob_store.BlobWriter(blob_dir) as writer:
+        writer.write(b'not a pdf')
+        assert not writer.looks_like_pdf()
+    try:
+        with blob_store.BlobWriter(blob_dir, max_bytes=10) as writer:
+            writer.write(b'x' * 11)
+        assert False, 'expected BlobTooLarge'
+    except blob_store.BlobTooLarge:
+        pass
+    leftovers = [name for _, _, files in os.walk(blob_dir) for name in files if name.endswith('.part')]
+    assert leftovers == []
+    print("✅ Blobs are content-addressed and temp files cleaned up")
+
+
+def test_one_active_job_per_hash():
+    """Concurrent submits of the same content queue exactly one job"""
+    db_name = make_db()
+    queue = IngestQueue(db_name, workers=1)
+    path = make_pdf(2)
+    digest = blob_store.hash_file(path)
+    # Keep the single worker busy so the job stays queued while the others arrive
+    release = threading.Event()
+    queue.executor.submit(release.wait)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def submit(n):
+        barrier.wait()
+        results.append(queue.submit(f'copy{n}.pdf', path, f'Copy {n}', digest))
+
+    threads = [threading.Thread(target=submit, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(created for _, created in results) == 1, results
+    assert len({job_id for job_id, _ in results}) == 1
+
+    job_id = results[0][0]
+    release.set()
+    wait_for(lambda: queue.get(job_id)['status'] == 'done')
+    conn = db.connect(db_name)
+    assert conn.execute('SELECT COUNT(*) FROM pdfs WHERE content_hash = ?', (digest,)).fetchone()[0] == 1
+    conn.close()
+    # Once it is done, the same content may be queued again (the job then reuses the module)
+    assert queue.submit('again.pdf', path, 'Again', digest)[1]
+    print("✅ Identical concurrent uploads share one job")
+
+
+def test_reupload_reports_existing_name():
+    """Uploading the same PDF under another name says which module it already is"""
+    client = make_client()
+    pdf = make_pdf(2, seed=61)
+    with open(pdf, 'rb') as f:
+        first = client.post('/api/upload', data={'file': (f, 'a.pdf'), 'module_name': 'Original'}).get_json()
+    with open(pdf, 'rb') as f:
+        second = client.post('/api/upload', data={'file': (f, 'b.pdf'), 'module_name': 'Renamed'}).get_json()
+    assert second['deduplicated'] and second['module_name'] == 'Original'
+    assert second['requested_module_name'] == 'Renamed' and 'Original' in second['message']
+    if 'job_id' in second:
+        assert second['job_id'] == first['job_id']
+    print("✅ Duplicate upload reports the name it is stored under")
+
+
+def test_delete_keeps_blob_used_by_queued_job():
+    """Deleting a module leaves its file alone while an unfinished job still points at it"""
+    client = make_client()
+    with open(make_pdf(2, seed=62), 'rb') as f:
+        job = client.post('/api/upload', data={'file': (f, 'c.pdf'), 'module_name': 'Shared'}).get_json()
+    job = wait_for_job(client, job['status_url'])
+
+    conn = db.connect()
+    filepath = conn.execute('SELECT filepath FROM pdfs WHERE id = ?', (job['pdf_id'],)).fetchone()[0]
+    conn.execute('''
+        INSERT INTO ingest_jobs (id, filename, filepath, module_name, status)
+        VALUES ('waiting', 'c.pdf', ?, 'Waiting', 'queued')
+    ''', (filepath,))
+    conn.commit()
+    assert client.delete(f"/api/modules/{job['pdf_id']}").status_code == 200
+    assert os.path.exists(filepath)
+
+    conn.execute("UPDATE ingest_jobs SET status = 'failed' WHERE id = 'waiting'")
+    conn.commit()
+    assert not blob_store.is_referenced(conn, filepath)
+    conn.close()
+    print("✅ Blob kept while a queued job references it")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Blob Store Test")
+    print("=" * 60)
+    test_blob_writer_hashes_and_dedupes()
+    test_one_active_job_per_hash()
+    test_reupload_reports_existing_name()
+    test_delete_keeps_blob_used_by_queued_job()
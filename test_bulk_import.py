@@ -0,0 +1,86 @@
+"""
+Test script for importing a directory of PDFs from the command line (bulk_import.py)
+"""
+import os
+import tempfile
+
+import bulk_import
+import db
+import fulltext
+import pages
+import retrieval
+from pdf_processor import join_pages
+from testing import make_db, make_pdf
+
+
+def make_library(count):
+    """A directory of `count` small PDFs, plus a fresh database and blob store"""
+    directory = tempfile.mkdtemp(prefix='classmate-test-')
+    for n in range(count):
+        make_pdf(3, seed=200 + n, directory=directory)
+    return bulk_import.find_pdfs([directory]), make_db(), tempfile.mkdtemp(prefix='classmate-blobs-')
+
+
+def add_existing_module(db_name):
+    """Module 1, already in the library before the import"""
+    conn = db.connect(db_name)
+    conn.execute("INSERT INTO pdfs (id, filename, filepath, module_name) VALUES (1, 'old.pdf', 'old.pdf', 'Old')")
+    texts = ['Section 1: ethics of an older module'] * 2
+    pages.store_pages(conn, 1, texts)
+    retrieval.index_module(conn, 1, join_pages(texts))
+    conn.commit()
+    conn.close()
+
+
+def test_import_next_to_existing_module():
+    """Imported modules get their own ids and search rows, and survive deleting another module"""
+    paths, db_name, blob_dir = make_library(2)
+    add_existing_module(db_name)
+    imported, skipped, failed = bulk_import.run_import(paths, db_name, workers=1, blob_dir=blob_dir)
+    assert (imported, skipped, failed) == (2, 0, [])
+    assert bulk_import.run_import(paths, db_name, workers=1, blob_dir=blob_dir) == (0, 2, [])
+
+    conn = db.connect(db_name)
+    assert [row[0] for row in conn.execute('SELECT id FROM pdfs ORDER BY id')] == [1, 2, 3]
+    assert conn.execute('SELECT page_count FROM pdfs WHERE id = 2').fetchone() == (3,)
+    assert 'Section 3' in pages.load_text(conn, 3)
+    if fulltext.has_table(conn):
+        hits = fulltext.search(conn, 'section', 10, pdf_id=2)
+        assert hits and {hit['pdf_id'] for hit in hits} == {2}
+        assert {hit['page'] for hit in hits} == {1, 2, 3}
+        rowids = [row[0] for row in conn.execute('SELECT rowid FROM pages_fts WHERE rowid / ? = 3 ORDER BY rowid',
+                                                 (fulltext.ROWID_STRIDE,))]
+        assert rowids == [3 * fulltext.ROWID_STRIDE + n for n in (1, 2, 3)]
+
+        retrieval.delete_module_index(conn, 1)
+        conn.commit()
+        assert fulltext.search(conn, 'section', 10, pdf_id=1) == []
+        assert len(fulltext.search(conn, 'section', 10, pdf_id=2)) == 3
+    conn.close()
+    print("✅ Imported modules indexed under their own ids")
+
+
+def test_failed_write_removes_new_blobs():
+    """Blobs stored for modules that couldn't be written are deleted again"""
+    paths, db_name, blob_dir = make_library(2)
+    original = bulk_import.write_modules
+
+    def failing_write(conn, modules):
+        raise RuntimeError('disk full')
+
+    bulk_import.write_modules = failing_write
+    try:
+        imported, skipped, failed = bulk_import.run_import(paths, db_name, workers=1, blob_dir=blob_dir)
+    finally:
+        bulk_import.write_modules = original
+    assert imported == 0 and [error for _, error in failed] == ['disk full', 'disk full']
+    assert not [name for _, _, names in os.walk(blob_dir) for name in names]
+    print("✅ Failed imports leave no blobs behind")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Bulk Import Test")
+    print("=" * 60)
+    test_import_next_to_existing_module()
+    test_failed_write_removes_new_blobs()
@@ -0,0 +1,111 @@
+"""
+Test script for prompt context compression (compression.py)
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import compression
+from retrieval import estimate_tokens
+
+FILLER = [f'Paragraph {n} talks about unrelated history of the printing press and paper mills {n}.'
+          for n in range(40)]
+
+
+def make_context():
+    sentences = list(FILLER)
+    sentences[10] = 'Osmosis moves water across a semipermeable membrane toward higher solute concentration.'
+    sentences[30] = 'Osmosis stops when the water potential on both sides of the membrane is equal.'
+    return ' '.join(sentences)
+
+
+class ScaleDownHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append((self.headers.get('x-api-key'), request))
+        status = self.server.status
+        body = json.dumps({'data': {'compressed_prompt': 'Remote summary of osmosis.'}} if status == 200
+                          else {'error': 'down'}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(status=200):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ScaleDownHandler)
+    server.daemon_threads = True
+    server.status = status
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/compress/raw/'
+
+
+def test_extractive_keeps_relevant_sentences():
+    """Sentences about the question survive, in document order, within the budget"""
+    compressed = compression.ExtractiveCompressor().compress(make_context(), 'What is osmosis?', 60)
+    assert estimate_tokens(compressed) <= 60
+    first, second = compressed.find('Osmosis moves'), compressed.find('Osmosis stops')
+    assert 0 <= first < second
+    assert compression.GAP_MARKER in compressed
+    print(f"✅ Extractive kept the relevant sentences ({estimate_tokens(compressed)} tokens)")
+
+
+def test_extractive_drops_near_duplicates():
+    """Repeated sentences are kept once"""
+    context = ' '.join(['The heart pumps blood through the arteries and veins of the body.'] * 30)
+    compressed = compression.ExtractiveCompressor().compress(context, 'heart', 200)
+    assert compressed == 'The heart pumps blood through the arteries and veins of the body.'
+    assert compression.ExtractiveCompressor().compress('', 'anything', 50) == ''
+    print("✅ Near-duplicate sentences dropped")
+
+
+def test_compress_context_skips_short_text_and_counts():
+    """Context that fits is returned untouched, even just under the budget; long context shrinks to the budget"""
+    before = compression.stats.snapshot().get('extractive', {'calls': 0, 'skipped': 0})
+    assert compression.compress_context('Short context.', 'q', 500) == 'Short context.'
+    context = make_context()
+    assert compression.compress_context(context, 'osmosis', estimate_tokens(context)) == context
+    compressed = compression.compress_context(context, 'osmosis', 100)
+    assert 50 < estimate_tokens(compressed) <= 100
+
+    after = compression.stats.snapshot()['extractive']
+    assert after['skipped'] == before['skipped'] + 2 and after['calls'] == before['calls'] + 1
+    assert after['tokens_saved'] > 0 and 0 < after['saved_ratio'] < 1
+    assert estimate_tokens(compression.NoCompressor().compress(make_context(), None, 20)) <= 20
+    print("✅ compress_context skips short text and records savings")
+
+
+def test_scaledown_uses_remote_then_falls_back():
+    """The remote result is used when the API answers; errors fall back to local compression"""
+    server, url = start_server()
+    remote = compression.ScaleDownCompressor(url=url, api_key='key', timeout=2)
+    assert remote.compress(make_context(), 'osmosis', 60) == 'Remote summary of osmosis.'
+    api_key, request = server.requests[0]
+    assert api_key == 'key' and request['prompt'] == 'osmosis' and request['context'] == make_context()
+
+    server.status = 503
+    errors = compression.stats.snapshot().get('scaledown', {}).get('errors', 0)
+    fallback = remote.compress(make_context(), 'osmosis', 60)
+    assert 'Osmosis moves' in fallback
+    assert compression.stats.snapshot()['scaledown']['errors'] == errors + 1
+
+    no_key = compression.ScaleDownCompressor(url=url, api_key=None)
+    requests_made = len(server.requests)
+    assert 'Osmosis' in no_key.compress(make_context(), 'osmosis', 60)
+    assert len(server.requests) == requests_made
+    print("✅ ScaleDown result used, local fallback on failure")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Context Compression Test")
+    print("=" * 60)
+    test_extractive_keeps_relevant_sentences()
+    test_extractive_drops_near_duplicates()
+    test_compress_context_skips_short_text_and_counts()
+    test_scaledown_uses_remote_then_falls_back()
@@ -0,0 +1,154 @@
+"""
+Test script for chat session memory (conversation_memory.py): follow-up
+detection, loading a session's history and folding old turns into its summary
+"""
+import conversation_memory
+import conversations
+import db
+import retrieval
+from answer_cache import AnswerCache
+from conversation_memory import MEMORY_RECENT_TURNS, MEMORY_SUMMARY_BATCH, Memory
+from testing import llm_provider, make_client, make_db, save_module
+
+SESSION = 'session-0001'
+TEXT = ('The French Revolution began in 1789 when the Estates-General met at Versailles.\n\n'
+        'Bread prices and royal debt fed popular anger before the storming of the Bastille.')
+
+
+def make_module():
+    """A database with one indexed module; returns (conn, pdf_id)"""
+    conn = db.connect(make_db())
+    c = conn.execute("INSERT INTO pdfs (filename, filepath, module_name, content_text) VALUES ('h', '', 'H', ?)",
+                     (TEXT,))
+    retrieval.index_module(conn, c.lastrowid, TEXT)
+    conn.commit()
+    return conn, c.lastrowid
+
+
+def add_turns(conn, pdf_id, count, start=0):
+    for n in range(start, start + count):
+        conversations.add(conn, pdf_id, f'Question {n} about the Bastille?', f'Answer {n}. More detail follows.',
+                          SESSION)
+    conn.commit()
+
+
+def test_is_follow_up():
+    """Only short questions about nothing in the module count, and only once there is history"""
+    memory = Memory(turns=[('What caused the French Revolution?', 'Debt and bread prices.')],
+                    module_terms={'french', 'revolution'}, session_id=SESSION)
+    assert memory.is_follow_up('explain that more') and memory.is_follow_up('why?')
+    assert not memory.is_follow_up('why does that matter in the French Revolution')
+    assert not memory.is_follow_up('what role did the clergy and the nobility play back then')
+    assert not Memory().is_follow_up('explain that more')
+
+    assert memory.search_query('why?') == 'What caused the French Revolution? why?'
+    assert memory.search_query('Who led the French Revolution?') == 'Who led the French Revolution?'
+    print("✅ Follow-ups are short questions off the module's topics")
+
+
+def test_cache_scope_follows_history():
+    """Answers are shared only when no history went into the prompt; any history scopes them to the session"""
+    assert Memory().cache_scope('Who led the French Revolution?') == 0
+
+    turns_only = Memory(turns=[('What caused the French Revolution?', 'Debt.')], module_terms={'revolution'},
+                        session_id=SESSION)
+    assert turns_only.cache_scope('Who led the French Revolution?') == f'{SESSION}:0'
+    assert turns_only.cache_scope('why?') is None
+
+    summarized = Memory('Asked about debt.', through_id=7, module_terms={'revolution'}, session_id=SESSION)
+    assert summarized.cache_scope('Who led the revolution?') == f'{SESSION}:7'
+    assert summarized.cache_scope('and then?') is None
+    other = Memory('Asked about debt.', through_id=7, module_terms={'revolution'}, session_id='session-0002')
+    assert other.cache_scope('Who led the revolution?') != summarized.cache_scope('Who led the revolution?')
+    print("✅ Cache scopes follow what history went into the prompt")
+
+
+def test_load():
+    """Recent turns come back oldest first within the budget, with the module terms of the question"""
+    conn, pdf_id = make_module()
+    assert not conversation_memory.load(conn, None, pdf_id)
+    add_turns(conn, pdf_id, 3)
+
+    memory = conversation_memory.load(conn, SESSION, pdf_id, question='Why did the Bastille matter?')
+    assert [q for q, _ in memory.turns] == [f'Question {n} about the Bastille?' for n in range(3)]
+    assert memory.summary == '' and memory.through_id == 0
+    assert memory.cache_scope('Why did the Bastille matter?') == f'{SESSION}:0'
+    assert memory.module_terms == {'bastille'}
+    assert not memory.is_follow_up('Why did the Bastille matter?') and memory.is_follow_up('and then?')
+
+    small = conversation_memory.load(conn, SESSION, pdf_id, budget=40)
+    assert 0 < len(small.turns) < 3 and small.turns[-1] == memory.turns[-1]
+    assert not conversation_memory.load(conn, 'other-session', pdf_id)
+    conn.close()
+    print("✅ load keeps the newest turns that fit")
+
+
+def test_fold():
+    """Turns that age out of the verbatim window are folded into the summary a batch at a time"""
+    conn, pdf_id = make_module()
+    add_turns(conn, pdf_id, MEMORY_RECENT_TURNS + MEMORY_SUMMARY_BATCH - 1)
+    with llm_provider(None):
+        assert conversation_memory.fold(conn, SESSION, pdf_id) == 0
+        add_turns(conn, pdf_id, 1, start=MEMORY_RECENT_TURNS + MEMORY_SUMMARY_BATCH - 1)
+        assert conversation_memory.fold(conn, SESSION, pdf_id) == MEMORY_SUMMARY_BATCH
+        assert conversation_memory.fold(conn, SESSION, pdf_id) == 0
+
+    memory = conversation_memory.load(conn, SESSION, pdf_id, question='Why did the Bastille matter?')
+    folded = conversations.session_turns(conn, SESSION, pdf_id, limit=MEMORY_SUMMARY_BATCH, oldest_first=True)
+    assert memory.through_id == folded[-1][0]
+    assert memory.cache_scope('Why did the Bastille matter?') == f'{SESSION}:{folded[-1][0]}'
+    assert memory.summary.splitlines()[0] == '- Asked: Question 0 about the Bastille? -> Answer 0.'
+    assert len(memory.turns) == MEMORY_RECENT_TURNS
+    assert memory.turns[0][0] == f'Question {MEMORY_SUMMARY_BATCH} about the Bastille?'
+    conn.close()
+    print("✅ fold moves old turns into the summary")
+
+
+def test_cache_scopes():
+    """Answers stored in a summary's scope are only reused in that scope"""
+    cache = AnswerCache(make_db())
+    scope = f'{SESSION}:7'
+    cache.put(1, 'What caused the revolution?', 'Shared answer.')
+    cache.put(1, 'What caused the revolution?', 'Session answer.', scope=scope)
+    assert cache.get(1, 'What caused the revolution?') == 'Shared answer.'
+    assert cache.get(1, 'What caused the revolution?', scope=scope) == 'Session answer.'
+    assert cache.get(1, 'What caused the revolution?', scope=f'{SESSION}:8') is None
+    assert cache.get(1, 'What caused the revolution?', scope='session-0002:7') is None
+
+    cache.put(1, 'How did the monarchy fall?', 'Scoped only.', scope=scope)
+    cache.memory.clear()
+    assert cache.get(1, 'How did the monarchy fall in France?') is None
+    assert cache.get(1, 'How did the monarchy fall?') is None
+    print("✅ Cache scopes keep session answers apart")
+
+
+def test_ask_with_sessions():
+    """Sessions are only used when sent; repeated questions in a session still hit the cache"""
+    client = make_client()
+    pdf_id = save_module(client, 'Session History', TEXT)
+    ask = lambda question, **extra: client.post('/api/ask', json={'pdf_id': pdf_id, 'question': question, **extra})
+
+    first = ask('When did the French Revolution begin?').get_json()
+    assert first['session_id'] is None and not first['cached']
+    # A new session has no history yet, so it shares the answer
+    assert ask('When did the French Revolution begin?', session_id='session-abc1').get_json()['cached']
+    assert ask('Why?', session_id='session-abc1').get_json()['cached'] is False
+    assert ask('Why?', session_id='session-abc1').get_json()['cached'] is False
+    assert ask('What happened at the Bastille?', session_id='session-abc1').get_json()['cached'] is False
+    assert ask('What happened at the Bastille?', session_id='session-abc1').get_json()['cached']
+    # Answered with session-abc1's history in the prompt, so not shared with other sessions
+    assert ask('What happened at the Bastille?', session_id='session-abc2').get_json()['cached'] is False
+    assert ask('Why?', session_id='bad id!').status_code == 400
+    print("✅ /api/ask uses only the sessions clients send")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Conversation Memory Test")
+    print("=" * 60)
+    test_is_follow_up()
+    test_cache_scope_follows_history()
+    test_load()
+    test_fold()
+    test_cache_scopes()
+    test_ask_with_sessions()
@@ -0,0 +1,108 @@
+"""
+Test script for paged conversation history, answer compression and archiving (conversations.py)
+"""
+import conversations
+import db
+from testing import make_db
+
+LONG_ANSWER = 'Osmosis is the movement of water across a membrane. ' * 40
+
+
+def add_rows(conn, pdf_id, count, days_old=0):
+    for n in range(count):
+        conversations.add(conn, pdf_id, f'Question {n} ({days_old} days)?', f'Answer {n}.')
+    if days_old:
+        conn.execute("UPDATE conversations SET timestamp = datetime('now', ?) WHERE question LIKE ?",
+                     (f'-{days_old} days', f'% ({days_old} days)?'))
+    conn.commit()
+
+
+def test_history_pages_by_id():
+    """Pages run newest first below a cursor; `since` returns only newer rows, oldest first"""
+    conn = db.connect(make_db())
+    add_rows(conn, 1, 5)
+    add_rows(conn, 2, 3)
+    rows, more = conversations.history(conn, 1, 2)
+    assert [r['question'] for r in rows] == ['Question 4 (0 days)?', 'Question 3 (0 days)?'] and more
+    rows, more = conversations.history(conn, 1, 10, before=rows[-1]['id'])
+    assert len(rows) == 3 and not more
+
+    first_id = rows[-1]['id']
+    newer, more = conversations.history(conn, 1, 2, since=first_id)
+    assert [r['id'] for r in newer] == [first_id + 1, first_id + 2] and more
+    assert conversations.history(conn, 3, 10) == ([], False)
+    conn.close()
+    print("✅ History pages by id and refreshes with since")
+
+
+def test_long_answers_are_compressed():
+    """Long answers are stored compressed and read back unchanged"""
+    assert conversations.encode_answer('Short.') == ('Short.', None, None)
+    answer, codec, data = conversations.encode_answer(LONG_ANSWER, 'zlib')
+    assert answer == '' and codec == 'zlib' and len(data) < len(LONG_ANSWER)
+
+    conn = db.connect(make_db())
+    conversations.add(conn, 1, 'What is osmosis?', LONG_ANSWER)
+    stored = conn.execute('SELECT answer, answer_codec FROM conversations').fetchone()
+    assert stored[0] == '' and stored[1] is not None
+    assert conversations.history(conn, 1, 1)[0][0]['answer'] == LONG_ANSWER
+    conn.close()
+    print("✅ Long answers compressed")
+
+
+def test_archive_moves_old_rows_and_history_continues():
+    """Old rows move to the archive; paging past the live rows continues into it"""
+    conn = db.connect(make_db())
+    add_rows(conn, 1, 3, days_old=200)
+    add_rows(conn, 1, 2)
+    plan = conn.execute('''
+        EXPLAIN QUERY PLAN SELECT id FROM conversations WHERE timestamp < datetime('now', '-90 days')
+        ORDER BY timestamp LIMIT 2
+    ''').fetchall()
+    assert 'idx_conversations_timestamp' in ' '.join(row[-1] for row in plan), plan
+
+    assert conversations.archive(conn, 90, batch_size=2) == 3
+    assert conversations.archive(conn, 90) == 0
+    assert conn.execute('SELECT COUNT(*) FROM conversations').fetchone()[0] == 2
+    rows, more = conversations.history(conn, 1, 4)
+    assert [r['question'] for r in rows] == ['Question 1 (0 days)?', 'Question 0 (0 days)?',
+                                             'Question 2 (200 days)?', 'Question 1 (200 days)?'] and more
+    rows, more = conversations.history(conn, 1, 4, before=rows[-1]['id'])
+    assert [r['question'] for r in rows] == ['Question 0 (200 days)?'] and not more
+
+    conversations.delete_module(conn, 1)
+    assert conversations.history(conn, 1, 10) == ([], False)
+    conn.close()
+    print("✅ Archived rows follow the live ones")
+
+
+def test_archive_goes_by_timestamp():
+    """A row newer than the cutoff stays live even below an archived id; pages still come in id order"""
+    conn = db.connect(make_db())
+    indexes = [row[1] for row in conn.execute('PRAGMA index_list(conversations)')]
+    assert 'idx_conversations_pdf_time' in indexes and 'idx_conversations_pdf_id' in indexes
+    add_rows(conn, 1, 2)
+    add_rows(conn, 1, 2, days_old=200)
+    add_rows(conn, 1, 1, days_old=300)
+
+    assert conversations.archive(conn, 90, batch_size=2) == 3
+    live = [row[0] for row in conn.execute('SELECT question FROM conversations ORDER BY id')]
+    assert live == ['Question 0 (0 days)?', 'Question 1 (0 days)?']
+    ids = [row[0] for row in conn.execute(
+        'SELECT id FROM conversations UNION ALL SELECT id FROM conversations_archive ORDER BY id DESC')]
+    rows, more = conversations.history(conn, 1, 3)
+    assert [r['id'] for r in rows] == ids[:3] and more
+    rows, more = conversations.history(conn, 1, 3, before=rows[-1]['id'])
+    assert [r['id'] for r in rows] == ids[3:] and not more
+    conn.close()
+    print("✅ Archiving goes by timestamp, history merges by id")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Conversation History Test")
+    print("=" * 60)
+    test_history_pages_by_id()
+    test_long_answers_are_compressed()
+    test_archive_moves_old_rows_and_history_continues()
+    test_archive_goes_by_timestamp()
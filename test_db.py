@@ -0,0 +1,90 @@
+"""
+Test script for the pooled SQLite layer (db.py) and the routes that borrow its connections
+"""
+import threading
+
+import db
+from testing import make_client, make_db
+
+
+def idle_count(db_name=None):
+    return db.get_pool(db_name).idle.qsize()
+
+
+def test_pool_reuses_and_resets_connections():
+    """close() returns a connection to the pool with any open transaction rolled back"""
+    db_name = make_db()
+    conn = db.connect(db_name)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    conn.execute("INSERT INTO pdfs (filename, filepath, module_name) VALUES ('x.pdf', '', 'Uncommitted')")
+    conn.close()
+    conn.close()  # a second close is harmless
+    assert idle_count(db_name) == 1
+
+    again = db.connect(db_name)
+    assert again is conn and idle_count(db_name) == 0
+    assert again.execute('SELECT COUNT(*) FROM pdfs').fetchone()[0] == 0
+    again.close()
+    print("✅ Pooled connections are reused and rolled back on release")
+
+
+def test_pool_is_bounded():
+    """More concurrent connections than the pool size are really closed when released"""
+    db_name = make_db()
+    pool = db.get_pool(db_name)
+    conns = [db.connect(db_name) for _ in range(pool.size + 3)]
+    for conn in conns:
+        conn.close()
+    assert idle_count(db_name) == pool.size
+    print(f"✅ Pool keeps at most {pool.size} idle connections")
+
+
+def test_migrate_is_idempotent():
+    """Migrating twice, or from two threads at once, ends at the latest version"""
+    db_name = make_db()
+    assert db.migrate(db_name) == len(db.MIGRATIONS)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(db.migrate(db_name))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [len(db.MIGRATIONS)] * 4
+    print("✅ Migrations apply once")
+
+
+def test_routes_return_connections():
+    """Early returns and failures inside a route still hand the connection back"""
+    client = make_client()
+    import app
+    db.connect().close()
+    before = idle_count()
+
+    for url in ('/api/modules/999999', '/api/modules/999999/pages'):
+        assert client.get(url).status_code == 404
+        assert idle_count() == before, url
+    assert client.delete('/api/modules/999999').status_code == 404
+    assert idle_count() == before
+
+    search = app.fulltext.search
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('disk on fire')
+
+    app.fulltext.search = broken
+    try:
+        assert client.get('/api/search?q=anything').status_code == 500
+    finally:
+        app.fulltext.search = search
+    assert idle_count() == before
+    print("✅ 404s and errors don't leak pooled connections")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Database Layer Test")
+    print("=" * 60)
+    test_pool_reuses_and_resets_connections()
+    test_pool_is_bounded()
+    test_migrate_is_idempotent()
+    test_routes_return_connections()
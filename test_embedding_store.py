@@ -0,0 +1,104 @@
+"""
+Test script for the local vector store (embedding_store.py)
+"""
+import tempfile
+
+import numpy as np
+
+import db
+import retrieval
+from embedding_store import EmbeddingStore, HashingEmbedder, get_embedder
+from testing import make_db
+
+
+def random_vectors(count, dim=64, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_hashing_embedder_is_deterministic():
+    """Same text, same unit vector; related texts are closer than unrelated ones"""
+    embedder = HashingEmbedder(dim=256)
+    a, b, c, empty = embedder.embed(['cell division by mitosis', 'mitosis is cell division',
+                                     'volcanic eruptions and magma', ''])
+    assert np.allclose(a, embedder.embed(['cell division by mitosis'])[0])
+    assert abs(np.linalg.norm(a) - 1.0) < 1e-5
+    assert a @ b > a @ c
+    assert not empty.any()
+    try:
+        get_embedder('nope')
+        assert False, 'expected an unknown embedder to be rejected'
+    except ValueError:
+        pass
+    print("✅ Hashing embedder is deterministic and similarity-preserving")
+
+
+def test_brute_force_search_is_exact():
+    """Brute-force top-k matches a plain NumPy ranking and maps rows to chunk ids"""
+    store = EmbeddingStore(tempfile.mkdtemp(prefix='classmate-test-'))
+    vectors = random_vectors(500)
+    ids = np.arange(500) + 1000
+    store.save(7, vectors, ids, 'test', ivf=False)
+
+    query = vectors[42]
+    results = store.search(7, query, top_k=5)
+    expected = np.argsort(-(vectors @ query))[:5]
+    assert [chunk_id for _, chunk_id in results] == list(ids[expected])
+    assert results[0][1] == 1042 and abs(results[0][0] - 1.0) < 1e-5
+    assert store.search(8, query) == []
+    print("✅ Brute-force search returns the exact top-k")
+
+
+def test_ivf_search_finds_near_neighbours():
+    """IVF search returns the same best match as exact search and can be deleted"""
+    store = EmbeddingStore(tempfile.mkdtemp(prefix='classmate-test-'))
+    vectors = random_vectors(3000, seed=1)
+    store.save(1, vectors, np.arange(3000), 'test', ivf=True)
+    meta, _, sidecar = store.load(1)
+    assert meta['ivf'] and len(sidecar['centroids']) == int(np.sqrt(3000))
+
+    hits = 0
+    for row in range(0, 3000, 150):
+        approx = store.search(1, vectors[row], top_k=1, nprobe=8)
+        hits += approx[0][1] == row
+        assert store.search(1, vectors[row], top_k=1, exact=True)[0][1] == row
+    assert hits >= 18, f'IVF recall too low: {hits}/20'
+
+    store.delete(1)
+    assert not store.has(1) and store.search(1, vectors[0]) == []
+    print(f"✅ IVF found {hits}/20 exact neighbours")
+
+
+def test_empty_module():
+    store = EmbeddingStore(tempfile.mkdtemp(prefix='classmate-test-'))
+    store.save(1, np.zeros((0, 16), dtype=np.float32), [], 'test')
+    assert store.search(1, np.ones(16)) == []
+    print("✅ A module without chunks searches to nothing")
+
+
+def test_embedding_index_ranks_chunks():
+    """retrieval.EmbeddingIndex returns the chunk about the question"""
+    conn = db.connect(make_db())
+    text = ('Mitosis divides one nucleus into two identical nuclei. ' * 30 +
+            'Volcanoes erupt when magma rises through the crust. ' * 30)
+    retrieval.index_module(conn, 1, text, embed=False)
+    store = EmbeddingStore(tempfile.mkdtemp(prefix='classmate-test-'))
+    retrieval.embed_chunks(conn, 1, store=store, embedder=HashingEmbedder())
+
+    index = retrieval.EmbeddingIndex(conn, 1, store=store, embedder=HashingEmbedder())
+    [(score, chunk)] = index.search('why do volcanoes erupt', top_k=1)
+    assert 'Volcanoes' in chunk and score > 0
+    assert index.search('', top_k=1) == []
+    conn.close()
+    print("✅ Embedding index finds the relevant chunk")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Embedding Store Test")
+    print("=" * 60)
+    test_hashing_embedder_is_deterministic()
+    test_brute_force_search_is_exact()
+    test_ivf_search_finds_near_neighbours()
+    test_empty_module()
+    test_embedding_index_ranks_chunks()
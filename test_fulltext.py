@@ -0,0 +1,129 @@
+"""
+Test script for library-wide full-text search (fulltext.py, /api/search)
+"""
+import db
+import fulltext
+from pdf_processor import join_pages
+from testing import make_client, make_db, save_module
+
+
+def add_module(conn, name, text):
+    """A module whose text lives in content_text, where snippets and deletes read it back from"""
+    pdf_id = conn.execute("INSERT INTO pdfs (filename, filepath, module_name, content_text) VALUES (?, '', ?, ?)",
+                          (f'{name}.pdf', name, text)).lastrowid
+    fulltext.index_text(conn, pdf_id, text)
+    return pdf_id
+
+
+def make_library():
+    conn = db.connect(make_db())
+    biology = add_module(conn, 'Biology', join_pages([
+        'Mitochondria produce energy for the cell.',
+        'Photosynthesis happens in chloroplasts.',
+        '   ',
+        'Enzymes speed up reactions in the cell.',
+    ]))
+    ethics = add_module(conn, 'Ethics', 'Typed notes: ethics of cell research and consent.')
+    conn.commit()
+    return conn, biology, ethics
+
+
+def test_search_ranks_pages_across_modules():
+    """Hits name their module and page; stemming and the any-word fallback apply"""
+    conn, biology, ethics = make_library()
+    hits = fulltext.search(conn, 'chloroplast')
+    assert [(h['pdf_id'], h['page']) for h in hits] == [(biology, 2)]
+    assert hits[0]['module_name'] == 'Biology' and '[' in hits[0]['snippet']
+
+    hits = fulltext.search(conn, 'cell')
+    assert {h['pdf_id'] for h in hits} == {biology, ethics}
+    assert {h['page'] for h in hits if h['pdf_id'] == ethics} == {None}
+
+    # No page has both words, so pages with either come back
+    assert {h['page'] for h in fulltext.search(conn, 'enzymes photosynthesis')} == {2, 4}
+    assert fulltext.search(conn, '?!') == []
+    assert len(fulltext.search(conn, 'cell', limit=1)) == 1
+    # Blank pages aren't indexed
+    assert conn.execute('SELECT COUNT(*) FROM pages_fts').fetchone()[0] == 4
+    conn.close()
+    print("✅ Search ranks pages across modules")
+
+
+def test_filter_and_delete_by_module():
+    """pdf_id filters and deletes only touch that module's rowid range"""
+    conn, biology, ethics = make_library()
+    assert {h['pdf_id'] for h in fulltext.search(conn, 'cell', pdf_id=ethics)} == {ethics}
+    assert fulltext.search(conn, 'chloroplast', pdf_id=ethics) == []
+
+    # Rows are removed with the text they were indexed from, so they go before the text changes
+    fulltext.delete_module(conn, biology)
+    text = join_pages(['Only one page about cells now.'])
+    conn.execute('UPDATE pdfs SET content_text = ? WHERE id = ?', (text, biology))
+    fulltext.index_text(conn, biology, text)
+    assert [h['page'] for h in fulltext.search(conn, 'cell', pdf_id=biology)] == [1]
+    fulltext.delete_module(conn, biology)
+    assert {h['pdf_id'] for h in fulltext.search(conn, 'cell')} == {ethics}
+
+    index = fulltext.PageIndex(conn, ethics)
+    assert 'consent' in index.search('consent')[0][1]
+    assert fulltext.PageIndex(conn, biology).search('cell') == []
+    # Raises if a delete left stray terms behind
+    conn.execute("INSERT INTO pages_fts (pages_fts) VALUES ('integrity-check')")
+    conn.close()
+    print("✅ Module filter and delete stay within the module")
+
+
+def test_contentless_table():
+    """pages_fts keeps no copy of the page text; snippets come from the stored pages"""
+    conn, biology, ethics = make_library()
+    assert fulltext.is_contentless(conn)
+    assert conn.execute('SELECT text FROM pages_fts LIMIT 1').fetchone() == (None,)
+    assert fulltext.make_snippet('Photosynthesis happens in chloroplasts.', 'chloroplast') == \
+        'Photosynthesis happens in [chloroplasts.]'
+    words = ' '.join(f'w{n}' for n in range(100))
+    snippet = fulltext.make_snippet(words, 'w50')
+    assert snippet.startswith('...') and snippet.endswith('...') and '[w50]' in snippet
+    assert len(snippet.strip('.').split()) == fulltext.SNIPPET_TOKENS
+    conn.close()
+    print("✅ Full-text rows hold no page text")
+
+
+def test_migration_drops_page_copies():
+    """Databases with the old pages_fts (a copy of every page) get the contentless table, refilled"""
+    db_name = make_db()
+    conn = db.open_connection(db_name)
+    conn.execute('DROP TABLE pages_fts')
+    conn.execute("CREATE VIRTUAL TABLE pages_fts USING fts5(text, pdf_id UNINDEXED, page_no UNINDEXED)")
+    conn.execute("INSERT INTO pdfs (filename, filepath, module_name, content_text) "
+                 "VALUES ('a.txt', '', 'Optics', 'Lenses bend light toward a focal point.')")
+    conn.execute(f'PRAGMA user_version = {len(db.MIGRATIONS) - 1}')
+    conn.commit()
+    conn.close()
+
+    db.migrate(db_name)
+    conn = db.connect(db_name)
+    assert fulltext.is_contentless(conn)
+    assert [h['module_name'] for h in fulltext.search(conn, 'focal lenses')] == ['Optics']
+    conn.close()
+    print("✅ Migration rebuilds pages_fts without page copies")
+
+
+def test_search_route():
+    """/api/search needs q and returns ranked results"""
+    client = make_client()
+    save_module(client, 'Thermodynamics', 'Entropy always increases in an isolated system.')
+    assert client.get('/api/search').status_code == 400
+    data = client.get('/api/search?q=entropy+isolated').get_json()
+    assert data['results'][0]['module_name'] == 'Thermodynamics' and 'took_ms' in data
+    print("✅ /api/search returns ranked results")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Full-Text Search Test")
+    print("=" * 60)
+    test_search_ranks_pages_across_modules()
+    test_filter_and_delete_by_module()
+    test_contentless_table()
+    test_migration_drops_page_copies()
+    test_search_route()
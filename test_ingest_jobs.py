@@ -0,0 +1,151 @@
+"""
+Test script for the background ingestion queue (ingest_jobs.py)
+"""
+import os
+import tempfile
+
+import db
+import pages
+import search_index
+from ingest_jobs import IngestQueue
+from testing import make_client, make_db, make_pdf, wait_for, wait_for_job
+
+
+def finished(queue, job_id):
+    job = queue.get(job_id)
+    return job if job['status'] in ('done', 'failed') else None
+
+
+def test_job_ingests_pdf_with_page_progress():
+    """A queued PDF ends up as a module with its pages, indexes and full progress"""
+    db_name = make_db()
+    ingested = []
+    queue = IngestQueue(db_name, workers=1, on_ingested=ingested.append)
+    job_id, created = queue.submit('notes.pdf', make_pdf(5), 'Notes')
+    assert created
+    assert queue.get(job_id)['status'] in ('queued', 'running', 'done')
+
+    job = wait_for(lambda: finished(queue, job_id))
+    assert job['status'] == 'done', job
+    assert job['pages_done'] == job['pages_total'] == 5 and job['progress'] == 1.0
+    assert ingested == [job['pdf_id']]
+
+    conn = db.connect(db_name)
+    assert pages.has_pages(conn, job['pdf_id'])
+    assert 'Section 5' in pages.load_text(conn, job['pdf_id'])
+    assert search_index.has_index(conn, job['pdf_id'])
+    conn.close()
+    assert queue.get('missing') is None
+    print("✅ Job ingested a 5-page PDF")
+
+
+def test_jobs_survive_restart():
+    """Jobs left queued or running by a stopped process are picked up by resume()"""
+    db_name = make_db()
+    conn = db.connect(db_name)
+    conn.execute('''
+        INSERT INTO ingest_jobs (id, filename, filepath, module_name, status, pages_done)
+        VALUES ('left-running', 'a.pdf', ?, 'A', 'running', 2), ('left-done', 'b.pdf', 'gone.pdf', 'B', 'done', 0)
+    ''', (make_pdf(3),))
+    conn.commit()
+    conn.close()
+
+    queue = IngestQueue(db_name, workers=1)
+    assert queue.resume() == 1
+    job = wait_for(lambda: finished(queue, 'left-running'))
+    assert job['status'] == 'done' and job['pages_done'] == 3
+    assert queue.get('left-done')['pdf_id'] is None
+    print("✅ Interrupted job resumed after restart")
+
+
+def test_resumed_job_reuses_its_reserved_id():
+    """A job stopped mid-ingest keeps its reserved module id and replaces the pages it left"""
+    db_name = make_db()
+    conn = db.connect(db_name)
+    conn.execute('BEGIN IMMEDIATE')
+    reserved = db.reserve_id(conn, 'pdfs')
+    pages.store_pages(conn, reserved, ['Stale page'] * 9)
+    conn.execute('''
+        INSERT INTO ingest_jobs (id, filename, filepath, module_name, status, pdf_id)
+        VALUES ('half-done', 'a.pdf', ?, 'A', 'running', ?)
+    ''', (make_pdf(3, seed=30), reserved))
+    conn.commit()
+    conn.close()
+
+    queue = IngestQueue(db_name, workers=1)
+    assert queue.get('half-done')['pdf_id'] is None, 'a reserved id is not a module yet'
+    assert queue.resume() == 1
+    job = wait_for(lambda: finished(queue, 'half-done'))
+    assert job['status'] == 'done' and job['pdf_id'] == reserved
+
+    conn = db.connect(db_name)
+    assert conn.execute('SELECT page_count FROM pdfs WHERE id = ?', (reserved,)).fetchone() == (3,)
+    assert [p['page_no'] for p in pages.load_pages(conn, reserved)] == [1, 2, 3]
+    conn.execute("INSERT INTO pdfs (filename, filepath, module_name) VALUES ('t.txt', '', 'T')")
+    assert conn.execute('SELECT MAX(id) FROM pdfs').fetchone()[0] == reserved + 1
+    conn.rollback()
+    conn.close()
+    print("✅ Resumed job finished under its reserved id")
+
+
+def test_unreadable_pdf_fails_without_leftovers():
+    """A file with no readable pages fails the job and leaves no module or pages behind"""
+    db_name = make_db()
+    path = os.path.join(tempfile.mkdtemp(prefix='classmate-test-'), 'broken.pdf')
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4 this is not really a PDF')
+    queue = IngestQueue(db_name, workers=1)
+    job_id, _ = queue.submit('broken.pdf', path, 'Broken')
+    job = wait_for(lambda: finished(queue, job_id))
+    assert job['status'] == 'failed' and job['error'] == 'no pages could be read'
+    assert job['pdf_id'] is None
+
+    conn = db.connect(db_name)
+    assert conn.execute('SELECT COUNT(*) FROM pdfs').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM pdf_pages').fetchone()[0] == 0
+    conn.close()
+    assert not os.path.exists(path)
+    print("✅ Unreadable PDF failed cleanly")
+
+
+def test_failing_callback_keeps_job_done():
+    """An error in on_ingested is reported without failing the finished job"""
+    def on_ingested(pdf_id):
+        raise RuntimeError('callback broke')
+
+    queue = IngestQueue(make_db(), workers=1, on_ingested=on_ingested)
+    queue.executor.submit = lambda *args: None   # run the job here instead
+    pdf_path = make_pdf(2, seed=44)
+    job_id, _ = queue.submit('two.pdf', pdf_path, 'Two')
+    queue._run(job_id)
+    job = queue.get(job_id)
+    assert job['status'] == 'done' and job['pdf_id'] and os.path.exists(pdf_path)
+    print("✅ Callback errors leave the job done")
+
+
+def test_upload_returns_job():
+    """/api/upload answers 202 straight away and /api/jobs reports the job until it is done"""
+    client = make_client()
+    with open(make_pdf(4, seed=40), 'rb') as f:
+        response = client.post('/api/upload', data={'file': (f, 'chapter.pdf'), 'module_name': 'Chapter'})
+    assert response.status_code == 202, response.get_json()
+    status_url = response.get_json()['status_url']
+
+    job = wait_for_job(client, status_url)
+    assert job['status'] == 'done' and job['pages_total'] == 4
+    module = client.get(f"/api/modules/{job['pdf_id']}").get_json()
+    assert module['module_name'] == 'Chapter'
+    assert client.get('/api/jobs/missing').status_code == 404
+    print("✅ Upload queued a job that finished in the background")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Ingest Queue Test")
+    print("=" * 60)
+    test_job_ingests_pdf_with_page_progress()
+    test_jobs_survive_restart()
+    test_resumed_job_reuses_its_reserved_id()
+    test_unreadable_pdf_fails_without_leftovers()
+    test_failing_callback_keeps_job_done()
+    test_upload_returns_job()
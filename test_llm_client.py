@@ -0,0 +1,185 @@
+"""
+Test script for the pooled LLM client (llm_client.py): retries, the circuit
+breaker and interrupted streams, against a scripted local HTTP server
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import llm_handler
+from llm_client import CircuitBreaker, LLMClient, LLMError, LLMUnavailable
+from testing import llm_provider
+
+CHUNK = 'data: ' + json.dumps({'choices': [{'delta': {'content': 'Partial answer'}}]}) + '\n\n'
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers each request with the next behaviour in server.script ('ok' once it runs out)"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.requests += 1
+        behaviour = self.server.script.pop(0) if self.server.script else 'ok'
+        if behaviour == 'slow':
+            # Accepted, but the reply takes longer than the client waits
+            time.sleep(0.5)
+            behaviour = 'ok'
+        if behaviour == 'drop_mid_stream':
+            # One chunk of a chunked body, then the connection goes away
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            data = CHUNK.encode()
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        status = 200 if behaviour == 'ok' else behaviour
+        body = json.dumps({'choices': [{'message': {'content': 'fine'}}]} if status == 200
+                          else {'error': {'message': 'scripted'}}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(*script):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.script = list(script)
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def make_llm_client(url, **options):
+    options = {'max_retries': 2, 'backoff_base': 0.01, 'backoff_max': 0.02, 'timeout': 5, **options}
+    return LLMClient(url, 'test-key', **options)
+
+
+def test_retries_server_errors_only():
+    """429/5xx are retried until they succeed; other client errors fail at once"""
+    server, url = start_server(503, 429, 'ok')
+    assert make_llm_client(url).chat({})['choices'][0]['message']['content'] == 'fine'
+    assert server.requests == 3
+
+    server, url = start_server(400)
+    client = make_llm_client(url)
+    try:
+        client.chat({})
+        assert False, 'expected LLMError'
+    except LLMError as e:
+        assert e.status == 400
+    assert server.requests == 1 and client.breaker.state == 'closed'
+    print("✅ 5xx/429 retried, 400 not retried")
+
+
+def test_read_timeouts_are_not_retried_and_deadline_holds():
+    """A reply that doesn't come in time fails at once; retries and backoff stay within the call's timeout"""
+    server, url = start_server('slow', 'ok')
+    started = time.monotonic()
+    try:
+        make_llm_client(url, timeout=0.2).chat({})
+        assert False, 'expected LLMError'
+    except LLMError as e:
+        assert 'timed out' in str(e)
+    assert server.requests == 1 and time.monotonic() - started < 0.45
+
+    server, url = start_server(*[503] * 10)
+    client = make_llm_client(url, max_retries=10, backoff_base=0.2, backoff_max=0.2, timeout=0.3)
+    started = time.monotonic()
+    try:
+        client.chat({})
+        assert False, 'expected LLMError'
+    except LLMError as e:
+        assert e.status == 503
+    # Without the deadline ten attempts with 0.2s backoff take over 2s
+    assert time.monotonic() - started < 0.5 and server.requests < 10
+    print("✅ Read timeouts not retried; one deadline per call")
+
+
+def test_breaker_opens_and_recovers():
+    """Repeated failures open the breaker; after the reset timeout one successful trial closes it"""
+    server, url = start_server(*[500] * 6)
+    client = make_llm_client(url, max_retries=0, breaker=CircuitBreaker(threshold=3, reset_timeout=0.2))
+    for _ in range(3):
+        try:
+            client.chat({})
+        except LLMError:
+            pass
+    assert client.breaker.state == 'open'
+    try:
+        client.chat({})
+        assert False, 'expected LLMUnavailable'
+    except LLMUnavailable:
+        pass
+    assert server.requests == 3
+
+    time.sleep(0.25)
+    server.script.clear()
+    assert client.breaker.state == 'half_open'
+    client.chat({})
+    assert client.breaker.state == 'closed'
+    print("✅ Breaker opened after 3 failures and closed after a good trial")
+
+
+def test_breaker_trial_released_after_unexpected_error():
+    """A half-open trial that dies with an unrelated exception doesn't wedge the breaker"""
+    server, url = start_server()
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.1)
+    client = make_llm_client(url, breaker=breaker)
+    post = client.session.post
+
+    def broken_post(*args, **kwargs):
+        raise ValueError('bad payload')
+
+    client.session.post = broken_post
+    try:
+        client.chat({})
+        assert False, 'expected ValueError'
+    except ValueError:
+        pass
+    client.session.post = post
+    assert breaker.state == 'half_open' and not breaker.trial_in_flight
+    client.chat({})
+    assert breaker.state == 'closed'
+    print("✅ Trial handed back after an unexpected exception")
+
+
+def test_dropped_stream_is_an_interruption():
+    """A connection lost mid-body raises LLMError, and the streamed answer ends with the interruption note"""
+    server, url = start_server('drop_mid_stream')
+    client = make_llm_client(url)
+    lines = []
+    try:
+        for line in client.chat_stream({}):
+            lines.append(line)
+        assert False, 'expected LLMError'
+    except LLMError as e:
+        assert 'interrupted' in str(e)
+    assert any('Partial answer' in line for line in lines)
+
+    server, url = start_server('drop_mid_stream')
+    with llm_provider(url):
+        deltas = list(llm_handler.stream_answer('What?', 'Some context.'))
+    assert deltas == ['Partial answer', llm_handler.INTERRUPTED_NOTE], deltas
+    print("✅ Dropped stream ends with the interruption note")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - LLM Client Test")
+    print("=" * 60)
+    test_retries_server_errors_only()
+    test_read_timeouts_are_not_retried_and_deadline_holds()
+    test_breaker_opens_and_recovers()
+    test_breaker_trial_released_after_unexpected_error()
+    test_dropped_stream_is_an_interruption()
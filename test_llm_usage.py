@@ -0,0 +1,124 @@
+"""
+Test script for token counting (token_budget.py) and LLM usage accounting (llm_usage.py)
+"""
+import contextlib
+import io
+
+import db
+import llm_usage
+import token_budget
+from testing import make_db
+
+
+def test_token_counts_and_budgets():
+    """Counting, truncation and prompt budgets stay consistent with each other"""
+    text = 'Photosynthesis converts light energy into chemical energy. ' * 20
+    tokens = token_budget.count_tokens(text)
+    assert tokens > 100 and token_budget.count_tokens('') == 0
+    cut = token_budget.truncate(text, 50)
+    assert text.startswith(cut) and token_budget.count_tokens(cut) <= 50
+    assert token_budget.truncate(text, 10 ** 6) == text and token_budget.truncate(text, 0) == ''
+
+    messages = [{'role': 'system', 'content': 'Be brief.'}, {'role': 'user', 'content': text}]
+    assert token_budget.count_message_tokens(messages) == (
+        2 * token_budget.TOKENS_PER_MESSAGE + token_budget.count_tokens('Be brief.') + tokens
+        + token_budget.TOKENS_PER_REPLY)
+
+    # The cap applies on big windows; small windows leave only what the reply doesn't need
+    assert token_budget.context_budget(2000, 500, model='gpt-4o') == 2000
+    room = token_budget.DEFAULT_CONTEXT_WINDOW - 4000 - token_budget.count_message_tokens(messages, 'unknown')
+    assert token_budget.context_budget(2000, 4000, messages, model='unknown') == max(0, room)
+    assert token_budget.cost_usd('gpt-4o-mini', 1_000_000, 1_000_000) == 0.75
+    assert token_budget.cost_usd('mystery-model', 10, 10) is None
+    print(f"✅ {tokens} tokens counted; truncation and budgets agree")
+
+
+def test_estimated_counts_keep_a_margin():
+    """Without tiktoken, budgets stop short of the window and the server says so once"""
+    room = token_budget.MODEL_CONTEXT_WINDOWS['gpt-4'] - 500 - token_budget.TOKENS_PER_REPLY
+    if not token_budget.counts_are_exact('gpt-4'):
+        room -= int(token_budget.MODEL_CONTEXT_WINDOWS['gpt-4'] * token_budget.ESTIMATE_SAFETY_MARGIN)
+    assert token_budget.context_budget(10 ** 6, 500, model='gpt-4') == room
+
+    token_budget._reported = False
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        token_budget.report_counting()
+        token_budget.report_counting()
+    assert output.getvalue().count('approximate') == (0 if token_budget.counts_are_exact() else 1)
+    print("✅ Estimated token counts leave headroom and are reported once")
+
+
+def make_recorder():
+    db_name = make_db()
+    return llm_usage.UsageRecorder(db_name), db_name
+
+
+def summarize(db_name, since=None):
+    conn = db.connect(db_name)
+    try:
+        return llm_usage.summary(conn, since)
+    finally:
+        conn.close()
+
+
+def test_calls_record_usage_and_status():
+    """Provider usage is used when sent, estimated otherwise; failures cost nothing"""
+    recorder, db_name = make_recorder()
+    payload = {'model': 'gpt-4o-mini', 'messages': [{'role': 'user', 'content': 'What is osmosis?'}]}
+    with recorder.track('answer', payload) as call:
+        call.response({'usage': {'prompt_tokens': 120, 'completion_tokens': 30}})
+    with recorder.track('answer', payload) as call:
+        call.add_text('Water moving across a membrane.')
+    try:
+        with recorder.track('answer', payload):
+            raise RuntimeError('provider down')
+    except RuntimeError:
+        pass
+    recorder.record_cache_hit(model='gpt-4o-mini')
+    recorder.flush()
+
+    conn = db.connect(db_name)
+    rows = conn.execute('''
+        SELECT prompt_tokens, completion_tokens, estimated, cached, status FROM llm_usage ORDER BY id
+    ''').fetchall()
+    conn.close()
+    assert rows[0] == (120, 30, 0, 0, 'ok')
+    assert rows[1][2] == 1 and rows[1][0] > 0 and rows[1][1] > 0
+    assert rows[2] == (0, 0, 0, 0, 'error') and rows[3][3] == 1
+
+    group = summarize(db_name)['by_kind_model'][0]
+    assert (group['calls'], group['errors'], group['cache_hits']) == (3, 1, 1)
+    assert group['cache_hit_rate'] == 0.25 and group['estimated_usage_calls'] == 1
+    assert group['cost_usd'] > 0
+    print("✅ Usage, estimates, errors and cache hits recorded")
+
+
+def test_percentiles_ignore_aborted_and_failed_calls():
+    """Latency percentiles use only successful calls, however many were aborted or failed"""
+    recorder, db_name = make_recorder()
+    for latency in (100, 200, 300, 400):
+        recorder.record('answer', 'gpt-4o', 10, 10, latency)
+    for _ in range(10):
+        recorder.record('answer', 'gpt-4o', 10, 0, 5, status='aborted')
+    recorder.record('answer', 'gpt-4o', 0, 0, 1, status='error')
+    recorder.flush()
+
+    group = summarize(db_name)['by_kind_model'][0]
+    assert group['calls'] == 15 and group['errors'] == 1
+    assert group['avg_latency_ms'] == 250.0
+    assert group['p50_latency_ms'] == 300.0 and group['p95_latency_ms'] == 400.0
+
+    totals = summarize(db_name, since=2 ** 40)['totals']
+    assert totals['calls'] == 0 and totals['cache_hit_rate'] == 0.0
+    print("✅ Percentiles are over successful calls only")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - LLM Usage Test")
+    print("=" * 60)
+    test_token_counts_and_budgets()
+    test_estimated_counts_keep_a_margin()
+    test_calls_record_usage_and_status()
+    test_percentiles_ignore_aborted_and_failed_calls()
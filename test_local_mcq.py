@@ -0,0 +1,102 @@
+"""
+Test script for offline cloze questions (local_mcq.py)
+"""
+import random
+import re
+
+import db
+import local_mcq
+from pdf_processor import join_pages
+from testing import make_db
+
+TOPICS = [
+    ('Mitochondria', 'ATP', 'respiration', 'glucose'),
+    ('Chloroplasts', 'chlorophyll', 'photosynthesis', 'sunlight'),
+    ('Ribosomes', 'proteins', 'translation', 'amino'),
+    ('Nucleus', 'chromosomes', 'transcription', 'genome'),
+]
+
+
+def make_text():
+    """One page per topic; every sentence of a page mentions that topic's terms"""
+    page_texts = []
+    for organelle, product, process, source in TOPICS:
+        sentences = [
+            f"{organelle} carry out {process} to turn {source} into {product} inside the cell.",
+            f"Without {process} the {organelle} could not supply {product} for growth of tissue.",
+            f"Scientists measure {product} made by {organelle} during {process} in cultured samples.",
+            f"The rate of {process} depends on how much {source} reaches the {organelle} each hour.",
+        ]
+        page_texts.append(' '.join(sentences))
+    return join_pages(page_texts)
+
+
+def check_mcq(mcq):
+    """Schema, a blank, and wrong options that the blanked sentence does not contain"""
+    assert mcq['question'].count(local_mcq.BLANK) >= 1
+    assert len(mcq['options']) == 4 and len({o.lower() for o in mcq['options']}) == 4
+    answer = mcq['options']['ABCD'.index(mcq['correct'])]
+    sentence = re.search(r'says: "(.*)"$', mcq['explanation']).group(1)
+    assert re.search(rf'\b{re.escape(answer)}\b', sentence, re.IGNORECASE)
+    for option in mcq['options']:
+        if option != answer:
+            assert option.lower() not in sentence.lower(), (option, sentence)
+    assert mcq['difficulty'] in ('easy', 'medium', 'hard')
+
+
+def test_analyze_picks_key_terms_and_neighbours():
+    """Key terms recur but aren't everywhere; co-occurring terms are each other's neighbours"""
+    sentences, terms = local_mcq.analyze(make_text())
+    assert sentences and all(len(row) == 4 for row in sentences)
+    assert {page for page, _, _, _ in sentences} == {1, 2, 3, 4}
+    assert terms['mitochondria'][0] == 'Mitochondria'
+    neighbours = [term for term, _ in terms['chlorophyll'][1][:3]]
+    assert set(neighbours) & {'photosynthesis', 'sunlight', 'chloroplasts'}, neighbours
+    assert local_mcq.analyze('') == ([], {})
+    assert local_mcq.split_sentences('Too short. ' + 'x' * 400) == []
+    print("✅ Key terms and similar terms found")
+
+
+def test_generate_from_stored_index():
+    """Stored-index questions are valid clozes on distinct terms, with their page"""
+    conn = db.connect(make_db())
+    local_mcq.build_sentence_index(conn, 1, make_text())
+    assert local_mcq.has_sentence_index(conn, 1)
+    mcqs = local_mcq.generate(conn, 1, 6, rng=random.Random(1))
+    assert 3 <= len(mcqs) <= 6
+    for mcq in mcqs:
+        check_mcq(mcq)
+        assert 1 <= mcq['page'] <= 4 and f"(page {mcq['page']})" in mcq['explanation']
+    answers = [mcq['options']['ABCD'.index(mcq['correct'])].lower() for mcq in mcqs]
+    assert len(answers) == len(set(answers))
+
+    local_mcq.delete_sentence_index(conn, 1)
+    assert not local_mcq.has_sentence_index(conn, 1) and local_mcq.generate(conn, 1, 5) == []
+    conn.close()
+    print(f"✅ {len(mcqs)} cloze questions from the stored index")
+
+
+def test_generate_from_text_and_missing_modules():
+    """Text without an index is analyzed in memory; modules without text have no index"""
+    mcqs = local_mcq.generate_from_text(make_text(), 4, rng=random.Random(2))
+    assert mcqs
+    for mcq in mcqs:
+        check_mcq(mcq)
+    assert local_mcq.generate_from_text('Nothing to ask about.', 3) == []
+
+    conn = db.connect(make_db())
+    assert not local_mcq.ensure_sentence_index(conn, 42)
+    conn.execute("INSERT INTO pdfs (id, filename, filepath, module_name, content_text) VALUES (7, 't', '', 'T', ?)",
+                 (make_text(),))
+    assert local_mcq.ensure_sentence_index(conn, 7) and local_mcq.has_sentence_index(conn, 7)
+    conn.close()
+    print("✅ In-memory questions and lazy index building")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Local MCQ Test")
+    print("=" * 60)
+    test_analyze_picks_key_terms_and_neighbours()
+    test_generate_from_stored_index()
+    test_generate_from_text_and_missing_modules()
@@ -0,0 +1,143 @@
+"""
+Test script for quiz generation (mcq_engine.py): lenient parsing, validation,
+deduplication and parallel batches that cover the whole module
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import db
+import mcq_engine
+import pages
+import retrieval
+from pdf_processor import join_pages
+from testing import llm_provider, make_db
+
+
+class QuizHandler(BaseHTTPRequestHandler):
+    """
+    Writes the requested number of MCQs about the first 'Topic N' in the prompt.
+    With server.repeat set, every batch asks the same questions (to exercise dedupe).
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = request['messages'][-1]['content']
+        count = int(re.search(r'Generate (\d+) MCQs', prompt).group(1))
+        section = re.search(r'Topic (\d+)', prompt).group(1)
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            self.server.requests += 1
+            serial = self.server.requests
+        time.sleep(0.1)
+        tag = 'shared' if self.server.repeat and 'Do not repeat' not in prompt else serial
+        mcqs = [{'question': f'Section {section}: {hashlib.md5(f"{tag} {n}".encode()).hexdigest()}?',
+                 'options': ['Alpha', 'Beta', 'Gamma', 'Delta'], 'correct': 'B', 'difficulty': 'hard'}
+                for n in range(count)]
+        body = json.dumps({'choices': [{'message': {'content': json.dumps(mcqs)}}],
+                           'usage': {'prompt_tokens': 10, 'completion_tokens': 10}}).encode()
+        with self.server.lock:
+            self.server.in_flight -= 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(repeat=False):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), QuizHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.in_flight = server.max_in_flight = server.requests = 0
+    server.repeat = repeat
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def make_module(sections=6):
+    """An indexed module with one distinct section per page"""
+    conn = db.connect(make_db())
+    texts = [f'Section {n}: ' + f'Topic {n} has its own facts and figures. ' * 60 for n in range(1, sections + 1)]
+    pages.store_pages(conn, 1, texts)
+    retrieval.index_module(conn, 1, join_pages(texts))
+    conn.commit()
+    return conn
+
+
+def test_parse_and_validate_lenient_replies():
+    """Fenced, wrapped and truncated replies parse; unrepairable questions are dropped"""
+    good = {'question': 'Q1?', 'options': ['a', 'b', 'c', 'd'], 'correct': 'c'}
+    reply = 'Here you go:\n```json\n{"questions": [' + json.dumps(good) + ', {"question": "Q2?", "opt'
+    assert [item['question'] for item in mcq_engine.parse_mcqs(reply)] == ['Q1?']
+    assert mcq_engine.parse_mcqs('no json here') == []
+
+    assert mcq_engine.validate_mcq(good)['correct'] == 'C'
+    assert mcq_engine.validate_mcq(good)['difficulty'] == 'medium'
+    lettered = {'question': 'Q?', 'options': {'A': 'A) one', 'B': 'two', 'C': 'three', 'D': 'four'},
+                'answer': 'two', 'difficulty': 'Hard'}
+    fixed = mcq_engine.validate_mcq(lettered)
+    assert fixed['options'][0] == 'one' and fixed['correct'] == 'B' and fixed['difficulty'] == 'hard'
+    assert mcq_engine.validate_mcq({**good, 'options': ['a', 'a', 'b', 'c']}) is None
+    assert mcq_engine.validate_mcq({**good, 'correct': 'E'}) is None
+    assert mcq_engine.validate_mcq({**good, 'options': ['a', 'b', 'c']}) is None
+    print("✅ Lenient parsing and validation")
+
+
+def test_dedupe_and_split():
+    """Near-identical questions are dropped across calls; counts split evenly"""
+    seen = []
+    first = mcq_engine.dedupe_mcqs([{'question': 'What is the function of the mitochondria?'},
+                                    {'question': 'What is the function of mitochondria?'}], seen)
+    assert len(first) == 1
+    assert mcq_engine.dedupe_mcqs([{'question': 'What is the function of the mitochondria'}], seen) == []
+    assert len(mcq_engine.dedupe_mcqs([{'question': 'Where does photosynthesis happen?'}], seen)) == 1
+    assert mcq_engine.split_count(50) == [8, 7, 7, 7, 7, 7, 7]
+    assert mcq_engine.split_count(3) == [3]
+    print("✅ Duplicates dropped and counts split evenly")
+
+
+def test_batches_cover_sections_in_parallel():
+    """A large quiz is generated concurrently, one batch per section, with each question's page"""
+    conn = make_module()
+    server, url = start_server()
+    with llm_provider(url):
+        started = time.perf_counter()
+        mcqs = mcq_engine.generate_module_mcqs(conn, 1, 40)
+        seconds = time.perf_counter() - started
+    conn.close()
+
+    assert len(mcqs) == 40 and len({m['question'] for m in mcqs}) == 40
+    assert server.requests == len(mcq_engine.split_count(40)) and server.max_in_flight > 1
+    # Each batch starts on its own page, spread from the first page to the last
+    batch_pages = sorted({m['page'] for m in mcqs})
+    assert len(batch_pages) == server.requests and batch_pages[0] == 1 and batch_pages[-1] == 6, batch_pages
+    assert seconds < 0.1 * server.requests
+    print(f"✅ {len(mcqs)} questions from {server.requests} parallel batches in {seconds:.2f}s")
+
+
+def test_duplicate_batches_are_topped_up():
+    """Batches that only repeat each other get one top-up round that avoids the kept questions"""
+    server, url = start_server(repeat=True)
+    with llm_provider(url):
+        mcqs = mcq_engine.generate_from_contexts(['Topic 1 text', 'Topic 2 text'], 12)
+    assert len(mcqs) == 12 and len({m['question'] for m in mcqs}) == 12
+    assert server.requests == 3
+    print("✅ Duplicate batch topped up")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - MCQ Engine Test")
+    print("=" * 60)
+    test_parse_and_validate_lenient_replies()
+    test_dedupe_and_split()
+    test_batches_cover_sections_in_parallel()
+    test_duplicate_batches_are_topped_up()
@@ -0,0 +1,98 @@
+"""
+Test script for latency histograms, stage timing and the /metrics endpoint (metrics.py)
+"""
+import asyncio
+import contextlib
+import io
+import os
+import re
+import tempfile
+
+import metrics
+from testing import make_client
+
+
+def test_histogram_buckets_are_cumulative():
+    """Each observation lands in its bucket; rendered buckets add up to the count"""
+    histogram = metrics.Histogram('test_seconds', 'Test latency', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value, '/a"b')
+    lines = histogram.render()
+    assert 'test_seconds_bucket{route="/a\\"b",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a\\"b",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{route="/a\\"b"} 4' in lines
+    assert 'test_seconds_sum{route="/a\\"b"} 6.250000' in lines
+    print("✅ Histogram buckets are cumulative")
+
+
+def test_sql_labels_and_stages():
+    """Statements are labelled by operation and table; stages add up per request"""
+    assert metrics._sql_label('SELECT id FROM pdfs WHERE id = ?') == ('select', 'pdfs')
+    assert metrics._sql_label('UPDATE OR IGNORE mcqs SET x = 1') == ('update', 'mcqs')
+    assert metrics._sql_label('INSERT OR REPLACE INTO answer_cache VALUES (?)') == ('insert', 'answer_cache')
+    assert metrics._sql_label('CREATE INDEX IF NOT EXISTS idx ON t(x)') == ('create', 'idx')
+    assert metrics._sql_label('COMMIT') == ('commit', '')
+    assert metrics._sql_label('VACUUM') == ('other', '')
+
+    @metrics.timed('test_stage')
+    def work():
+        return 42
+
+    @metrics.timed('test_async_stage')
+    async def async_work():
+        return 43
+
+    metrics.start_request()
+    assert work() == 42 and asyncio.run(async_work()) == 43
+    with metrics.span('test_stage'):
+        pass
+    stages = metrics.finish_request()
+    assert set(stages) >= {'test_stage'} and metrics.finish_request() == {}
+    header = metrics.server_timing({'llm call': 0.0125})
+    assert header == 'llm_call;dur=12.5'
+    print("✅ SQL labels and request stages")
+
+
+def test_metrics_endpoint_and_server_timing():
+    """Requests are timed by route, and their stages come back in Server-Timing"""
+    client = make_client()
+    response = client.get('/api/modules')
+    assert 'db;dur=' in response.headers.get('Server-Timing', '')
+    client.get('/api/modules/999999')
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert re.search(r'app_request_duration_seconds_count\{method="GET",route="/api/modules",status="200"\} \d+', body)
+    assert 'route="/api/modules/<int:pdf_id>",status="404"' in body
+    assert re.search(r'app_db_query_seconds_count\{op="select",table="pdfs"\} \d+', body)
+    print("✅ /metrics exposes request and query histograms")
+
+
+def test_profile_written_to_files():
+    """A stopped profile goes to a .prof file and a text summary beside it, not to stdout"""
+    profile_dir = tempfile.mkdtemp(prefix='classmate-test-')
+    directory, metrics.PROFILE_DIR = metrics.PROFILE_DIR, profile_dir
+    try:
+        profiler = metrics.start_profile()
+        sorted(str(n) for n in range(10000))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            path = metrics.stop_profile(profiler, 'GET /api/modules', top=5)
+    finally:
+        metrics.PROFILE_DIR = directory
+    assert output.getvalue() == ''
+    assert os.path.dirname(path) == profile_dir and os.path.getsize(path) > 0
+    with open(os.path.splitext(path)[0] + '.txt') as summary:
+        text = summary.read()
+    assert text.startswith('Profile of GET /api/modules') and 'cumulative' in text
+    print("✅ Profiles written to files, not stdout")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Metrics Test")
+    print("=" * 60)
+    test_histogram_buckets_are_cumulative()
+    test_sql_labels_and_stages()
+    test_metrics_endpoint_and_server_timing()
+    test_profile_written_to_files()
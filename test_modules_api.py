@@ -0,0 +1,62 @@
+"""
+Test script for the paginated module listing (/api/modules)
+"""
+from testing import make_client, save_module
+
+
+def list_all(client, limit):
+    """Follow next_cursor through every page; returns the pages"""
+    pages, cursor = [], None
+    while True:
+        url = f'/api/modules?limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200, response.get_json()
+        data = response.get_json()
+        pages.append(data['modules'])
+        cursor = data['next_cursor']
+        if not cursor:
+            return pages
+
+
+def test_pages_cover_every_module_once():
+    """Cursor pages are newest first, never overlap and carry no module text"""
+    client = make_client()
+    created = [save_module(client, f'Paged {n}', f'Paged module {n} about topic {n}.') for n in range(5)]
+    pages = list_all(client, limit=2)
+    ids = [module['id'] for page in pages for module in page]
+
+    assert all(len(page) <= 2 for page in pages)
+    assert len(ids) == len(set(ids))
+    assert [i for i in ids if i in created] == created[::-1]
+    assert all('content_text' not in module for page in pages for module in page)
+    print(f"✅ {len(ids)} modules listed once across {len(pages)} pages")
+
+
+def test_bad_cursor_and_limits():
+    """Garbage cursors are a 400; limits are clamped instead of rejected"""
+    client = make_client()
+    save_module(client, 'Clamp', 'Module used to check limit clamping.')
+    assert client.get('/api/modules?cursor=not-a-cursor').status_code == 400
+    assert len(client.get('/api/modules?limit=0').get_json()['modules']) == 1
+    assert client.get('/api/modules?limit=100000').status_code == 200
+    print("✅ Invalid cursor rejected and limits clamped")
+
+
+def test_listing_revalidates_with_etag():
+    """An unchanged listing answers If-None-Match with 304; a new module changes it"""
+    client = make_client()
+    first = client.get('/api/modules')
+    etag = first.headers['ETag']
+    assert client.get('/api/modules', headers={'If-None-Match': etag}).status_code == 304
+    save_module(client, 'Fresh', 'A module added after the listing was fetched.')
+    assert client.get('/api/modules', headers={'If-None-Match': etag}).status_code == 200
+    print("✅ Listing ETag revalidates")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Module Listing Test")
+    print("=" * 60)
+    test_pages_cover_every_module_once()
+    test_bad_cursor_and_limits()
+    test_listing_revalidates_with_etag()
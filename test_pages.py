@@ -0,0 +1,89 @@
+"""
+Test script for per-page text storage (pages.py)
+"""
+import db
+import pages
+from pdf_processor import join_pages
+from testing import make_db
+
+TEXTS = ['Cells are small. ' * 40, 'Short page.', '', 'Énergie et entropie. ' * 30]
+
+
+def add_module(conn, content_text=None, filepath='doc.pdf'):
+    c = conn.execute('INSERT INTO pdfs (filename, filepath, module_name, content_text) VALUES (?, ?, ?, ?)',
+                     ('doc.pdf', filepath, 'Doc', content_text))
+    return c.lastrowid
+
+
+def test_round_trip_and_offsets():
+    """Pages come back unchanged for every codec, with offsets into the joined text"""
+    for codec in ('none', 'zlib', 'zstd'):
+        codec_used, data = pages.encode(TEXTS[0], codec)
+        assert pages.decode(codec_used, data) == TEXTS[0]
+        assert codec_used != 'none' or codec == 'none'
+    assert pages.encode('Short page.', 'zlib')[0] == 'none'
+
+    conn = db.connect(make_db())
+    pdf_id = add_module(conn)
+    assert pages.store_pages(conn, pdf_id, TEXTS) == len(join_pages(TEXTS))
+    whole = pages.load_text(conn, pdf_id)
+    assert whole == join_pages(TEXTS)
+    for page in pages.load_pages(conn, pdf_id):
+        assert whole[page['start_offset']:page['end_offset']] == TEXTS[page['page_no'] - 1]
+    conn.close()
+    print("✅ Pages round-trip with correct offsets")
+
+
+def test_ranges_and_lookups():
+    """load_pages reads only the asked-for range; page_at maps offsets to pages"""
+    conn = db.connect(make_db())
+    pdf_id = add_module(conn)
+    pages.store_pages(conn, pdf_id, TEXTS)
+    assert [p['page_no'] for p in pages.load_pages(conn, pdf_id, 2, 3)] == [2, 3]
+    assert [p['page_no'] for p in pages.load_pages(conn, pdf_id, 4)] == [4]
+    assert pages.load_pages(conn, pdf_id, 9) == []
+
+    second = pages.load_pages(conn, pdf_id, 2, 2)[0]
+    assert pages.page_at(conn, pdf_id, second['start_offset']) == 2
+    assert pages.page_at(conn, pdf_id, second['end_offset'] + 1) >= 2
+    assert pages.page_at(conn, pdf_id, 0) == 1
+
+    typed = add_module(conn, content_text='A typed concept.', filepath='')
+    assert pages.page_at(conn, typed, 0) is None
+    assert pages.load_text(conn, typed) == 'A typed concept.'
+    assert pages.load_text(conn, 999) is None
+
+    # Storing again replaces the pages
+    stored = pages.store_encoded_pages(conn, pdf_id, pages.encode_pages(['Only page.']))
+    assert stored == (1, len(join_pages(['Only page.'])))
+    assert pages.load_text(conn, pdf_id) == join_pages(['Only page.'])
+    pages.delete_pages(conn, pdf_id)
+    assert not pages.has_pages(conn, pdf_id)
+    conn.close()
+    print("✅ Page ranges and offset lookups")
+
+
+def test_backfill_only_moves_exact_splits():
+    """Old content_text blobs move into pages only when they rebuild exactly"""
+    conn = db.connect(make_db())
+    joined = add_module(conn, content_text=join_pages(TEXTS))
+    odd = add_module(conn, content_text='--- Page 1 ---\nNo leading newline')
+    typed = add_module(conn, content_text=join_pages(['Typed']), filepath='')
+    pages.backfill_pages(conn)
+
+    row = conn.execute('SELECT content_text, page_count FROM pdfs WHERE id = ?', (joined,)).fetchone()
+    assert row == (None, len(TEXTS))
+    assert pages.load_text(conn, joined) == join_pages(TEXTS)
+    assert not pages.has_pages(conn, odd) and not pages.has_pages(conn, typed)
+    assert pages.split_pages('plain text') is None
+    conn.close()
+    print("✅ Backfill moves only well-formed documents")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Page Storage Test")
+    print("=" * 60)
+    test_round_trip_and_offsets()
+    test_ranges_and_lookups()
+    test_backfill_only_moves_exact_splits()
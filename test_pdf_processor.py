@@ -0,0 +1,102 @@
+"""
+Test script for page-level PDF extraction (pdf_processor.py)
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import PyPDF2
+
+import pdf_processor
+from testing import make_pdf
+
+_extract_text = PyPDF2.PageObject.extract_text
+
+
+def hang_on_page_two(page, *args, **kwargs):
+    """Stand-in for extract_text that never returns for the page starting 'Section 2'"""
+    text = _extract_text(page, *args, **kwargs)
+    if text.startswith('Section 2:'):
+        time.sleep(60)
+    return text
+
+
+def install_hang():
+    """Pool initializer: spawned workers import PyPDF2 afresh, so patch it there too"""
+    PyPDF2.PageObject.extract_text = hang_on_page_two
+
+
+def extract_with_hanging_page(**options):
+    """Extract a 3-page PDF whose second page hangs; returns (texts, seconds)"""
+    path = make_pdf(3)
+    PyPDF2.PageObject.extract_text = hang_on_page_two
+    pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=install_hang)
+    shared, pdf_processor._pool = pdf_processor._pool, pool
+    try:
+        started = time.perf_counter()
+        texts = list(pdf_processor.iter_pages(path, page_timeout=0.5, **options))
+        return texts, time.perf_counter() - started
+    finally:
+        PyPDF2.PageObject.extract_text = _extract_text
+        pdf_processor._pool = shared
+        pool.shutdown()
+
+
+def test_pages_in_order():
+    """Serial and parallel extraction return the same pages in order, with progress"""
+    path = make_pdf(12)
+    calls = []
+    serial = list(pdf_processor.iter_pages(path, parallel=False))
+    parallel = list(pdf_processor.iter_pages(path, parallel=True, workers=2,
+                                             progress=lambda done, total: calls.append((done, total))))
+    assert len(serial) == 12 and serial == parallel
+    assert all(text.startswith(f'Section {n}:') for n, text in enumerate(serial, start=1))
+    assert calls[-1] == (12, 12)
+    assert list(pdf_processor.iter_pages(path + '.missing')) == []
+    print("✅ Pages come back in order serially and in parallel")
+
+
+def test_hanging_page_times_out_in_main_thread():
+    texts, seconds = extract_with_hanging_page(parallel=False)
+    assert len(texts) == 3 and texts[1] == '' and texts[2].startswith('Section 3:')
+    assert seconds < 10
+    print(f"✅ Hanging page skipped after {seconds:.1f}s in the main thread")
+
+
+def test_hanging_page_times_out_in_worker_thread():
+    """Ingest workers are threads, where SIGALRM can't be used; the page still times out"""
+    result = []
+    thread = threading.Thread(target=lambda: result.extend(extract_with_hanging_page()))
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive(), 'extraction hung in a worker thread'
+    texts, seconds = result
+    assert len(texts) == 3 and texts[1] == '' and texts[0].startswith('Section 1:')
+    assert seconds < 10
+    print(f"✅ Hanging page skipped after {seconds:.1f}s in a worker thread")
+
+
+def test_pool_is_shared():
+    """Documents extracted off the main thread reuse one spawned pool"""
+    path = make_pdf(2)
+    pools = []
+    for _ in range(2):
+        thread = threading.Thread(target=lambda: list(pdf_processor.iter_pages(path)))
+        thread.start()
+        thread.join(30)
+        pools.append(pdf_processor._pool)
+    assert pools[0] is not None and pools[0] is pools[1]
+    assert pools[0]._mp_context.get_start_method() == 'spawn'
+    print("✅ Extraction reuses one spawned process pool")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - PDF Extraction Test")
+    print("=" * 60)
+    test_pages_in_order()
+    test_hanging_page_times_out_in_main_thread()
+    test_hanging_page_times_out_in_worker_thread()
+    test_pool_is_shared()
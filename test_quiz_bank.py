@@ -0,0 +1,180 @@
+"""
+Test script for the precomputed quiz bank (quiz_bank.py, /api/generate-mcq)
+"""
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import db
+import mcq_engine
+import quiz_bank
+import retrieval
+from quiz_bank import QuizBank
+from testing import llm_provider, make_client, make_db, save_module, wait_for
+
+NOTES = ' '.join(f'Fact {n} about plate tectonics and the movement of crust number {n}.' for n in range(200))
+
+
+class DifficultyHandler(BaseHTTPRequestHandler):
+    """Writes distinct MCQs, all labelled easy whatever was asked; records each prompt"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = request['messages'][-1]['content']
+        with self.server.lock:
+            self.server.prompts.append(prompt)
+            serial = len(self.server.prompts)
+        count = int(re.search(r'Generate (\d+) MCQs', prompt).group(1))
+        mcqs = [{'question': hashlib.md5(f'{serial} {n}'.encode()).hexdigest() + '?',
+                 'options': ['w', 'x', 'y', 'z'], 'correct': 'A', 'difficulty': 'easy'} for n in range(count)]
+        body = json.dumps({'choices': [{'message': {'content': json.dumps(mcqs)}}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DifficultyHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.prompts = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def make_bank():
+    """A bank on a new database with one indexed module (id 1)"""
+    db_name = make_db()
+    conn = db.connect(db_name)
+    conn.execute("INSERT INTO pdfs (id, filename, filepath, module_name, content_text) VALUES (1, 'n.txt', '', 'N', ?)",
+                 (NOTES,))
+    retrieval.index_module(conn, 1, NOTES)
+    conn.commit()
+    bank = QuizBank(db_name)
+    fills = []
+    bank.schedule_fill = lambda pdf_id, difficulty=None: fills.append((pdf_id, difficulty))
+    return bank, conn, fills
+
+
+def mcq(n, difficulty):
+    return {'question': f'Question {n}?', 'options': ['a', 'b', 'c', 'd'], 'correct': 'A', 'difficulty': difficulty}
+
+
+def test_draw_least_served_and_partial():
+    """Draws prefer unserved questions; a short draw returns what there is and asks for a refill"""
+    bank, conn, fills = make_bank()
+    quiz_bank.store(conn, 1, [mcq(n, 'easy') for n in range(4)] + [mcq(9, 'hard')], 'llm')
+    conn.commit()
+
+    first = bank.draw(conn, 1, 2, 'easy')
+    second = bank.draw(conn, 1, 2, 'easy')
+    assert len(first) == len(second) == 2
+    assert not {q['id'] for q in first} & {q['id'] for q in second}
+    assert quiz_bank.unserved_count(conn, 1, 'easy') == 0 and quiz_bank.unserved_count(conn, 1) == 1
+
+    hard = bank.draw(conn, 1, 5, 'hard')
+    assert [q['question'] for q in hard] == ['Question 9?'] and (1, 'hard') in fills
+    assert bank.draw(conn, 1, 5, 'medium') == [] and (1, 'medium') in fills
+    conn.close()
+    print("✅ Least-served first; short draws are partial and refill that difficulty")
+
+
+def test_fill_targets_difficulty():
+    """A refill for one difficulty asks the model for it and stores questions at it"""
+    bank, conn, _ = make_bank()
+    server, url = start_server()
+    with llm_provider(url):
+        added = bank.fill(1, target=10, difficulty='hard')
+    assert added == 10 and quiz_bank.unserved_count(conn, 1, 'hard') == 10
+    assert server.prompts and all('Every question must be hard.' in p for p in server.prompts)
+
+    # Enough hard questions now; another fill for them does nothing
+    with llm_provider(url):
+        assert bank.fill(1, target=10, difficulty='hard') == 0
+    assert len(bank.draw(conn, 1, 10, 'hard')) == 10
+    conn.close()
+    print("✅ Fill generated questions at the requested difficulty")
+
+
+def test_fill_skips_reset_bank():
+    """Questions generated from content that was reset meanwhile are not stored"""
+    bank, conn, _ = make_bank()
+    before = quiz_bank.generation(conn, 1)
+    dedupe = mcq_engine.dedupe_mcqs
+
+    def reset_then_dedupe(mcqs, seen=None):
+        other = db.connect(bank.db_name)
+        quiz_bank.delete_module(other, 1)
+        other.commit()
+        other.close()
+        return dedupe(mcqs, seen)
+
+    server, url = start_server()
+    mcq_engine.dedupe_mcqs = reset_then_dedupe
+    try:
+        with llm_provider(url):
+            assert bank.fill(1, target=5) == 0
+    finally:
+        mcq_engine.dedupe_mcqs = dedupe
+    assert quiz_bank.unserved_count(conn, 1) == 0 and quiz_bank.generation(conn, 1) > before
+    with llm_provider(url):
+        assert bank.fill(1, target=5) == 5
+    conn.close()
+    print("✅ A fill that outlives a reset stores nothing")
+
+
+def test_route_tops_up_short_draws():
+    """A bank with fewer questions than asked for is topped up with live ones"""
+    client = make_client()
+    import app
+    pdf_id = save_module(client, 'Plate Boundaries', NOTES)
+    wait_for(lambda: not app.quiz_bank._pending)
+    conn = db.connect()
+    banked = quiz_bank.unserved_count(conn, pdf_id)
+    conn.close()
+
+    server, url = start_server()
+    with llm_provider(url):
+        quiz = client.post('/api/generate-mcq', json={'pdf_id': pdf_id, 'count': banked + 6}).get_json()
+        wait_for(lambda: not app.quiz_bank._pending)
+    assert len(quiz['questions']) == banked + 6 and not quiz['from_bank']
+    assert len({q['question'] for q in quiz['questions']}) == banked + 6
+    print(f"✅ {banked} banked questions topped up to {banked + 6}")
+
+
+def test_route_honours_difficulty():
+    """The live path generates at the requested difficulty; the next request comes from the bank"""
+    client = make_client()
+    import app
+    pdf_id = save_module(client, 'Geology', NOTES)
+    wait_for(lambda: not app.quiz_bank._pending)
+    assert client.post('/api/generate-mcq', json={'pdf_id': pdf_id, 'difficulty': 'extreme'}).status_code == 400
+
+    server, url = start_server()
+    with llm_provider(url):
+        live = client.post('/api/generate-mcq', json={'pdf_id': pdf_id, 'count': 3, 'difficulty': 'hard'}).get_json()
+        wait_for(lambda: not app.quiz_bank._pending)
+        banked = client.post('/api/generate-mcq', json={'pdf_id': pdf_id, 'count': 3, 'difficulty': 'hard'}).get_json()
+    assert not live['from_bank'] and len(live['questions']) == 3
+    assert banked['from_bank'] and len(banked['questions']) == 3
+    assert all(q['difficulty'] == 'hard' for q in live['questions'] + banked['questions'])
+    assert all('Every question must be hard.' in p for p in server.prompts)
+    print("✅ Live and bank quizzes match the requested difficulty")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Quiz Bank Test")
+    print("=" * 60)
+    test_draw_least_served_and_partial()
+    test_fill_targets_difficulty()
+    test_fill_skips_reset_bank()
+    test_route_tops_up_short_draws()
+    test_route_honours_difficulty()
@@ -0,0 +1,189 @@
+"""
+Test script for chunking and prompt context selection (retrieval.py)
+"""
+import db
+import fulltext
+import local_mcq
+import pages
+import quiz_bank
+import retrieval
+import search_index
+import token_budget
+from answer_cache import AnswerCache
+from pdf_processor import join_pages
+from testing import make_client, make_db, save_module
+
+TOPICS = {
+    'photosynthesis': 'Photosynthesis in chloroplasts turns light, water and carbon dioxide into glucose. ',
+    'mitosis': 'Mitosis divides one nucleus into two identical daughter nuclei with the same chromosomes. ',
+    'volcano': 'A volcano erupts when magma rises through the crust and pressure is released at the vent. ',
+}
+
+
+def make_text():
+    """A long module with one topic per section"""
+    return '\n'.join(sentence * 40 for sentence in TOPICS.values())
+
+
+def test_chunks_overlap_and_cover_text():
+    """Chunks cover the whole text, overlap their neighbours and keep their offsets"""
+    text = make_text()
+    chunks = retrieval.chunk_text(text, chunk_size=500, overlap=100)
+    assert len(chunks) > 10
+    for start, end, piece in chunks:
+        assert text[start:end] == piece
+        assert len(piece) <= 500
+    for (_, prev_end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert start < prev_end, 'neighbouring chunks should overlap'
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(text.rstrip())
+    assert retrieval.chunk_text('') == []
+    print(f"✅ {len(chunks)} overlapping chunks cover the text")
+
+
+def test_pieces_chunk_like_the_joined_text():
+    """Chunks and paragraphs of text read in pieces match those of the joined text"""
+    text = make_text().replace('. Mitosis', '.\n\n\nMitosis')
+    for size in (7, 50, 333):
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        assert list(retrieval.iter_chunks(pieces, 500, 100)) == retrieval.chunk_text(text, 500, 100)
+        assert list(search_index.iter_paragraphs(pieces)) == search_index.split_paragraphs(text)
+    assert list(search_index.iter_paragraphs(['a\n', '\n', '\nb\n\n', 'c'])) == ['a', 'b', 'c']
+    print("✅ Chunks and paragraphs don't depend on how the text is split")
+
+
+def test_index_pages_matches_index_module():
+    """Indexing stored pages a batch at a time builds the same indexes as the whole text"""
+    page_texts = [sentence * 30 + '\n\nSummary of page.' for sentence in TOPICS.values()] * 3
+    conn = db.connect(make_db())
+    retrieval.index_module(conn, 1, join_pages(page_texts))
+    pages.store_pages(conn, 2, page_texts)
+    retrieval.index_pages(conn, 2, pages.StoredPages(conn, 2, batch_size=2))
+    conn.commit()
+
+    queries = {
+        'chunks': 'SELECT chunk_no, start_offset, end_offset, length, text FROM chunks WHERE pdf_id = ? ORDER BY 1',
+        'index_paragraphs': 'SELECT para_no, length, text FROM index_paragraphs WHERE pdf_id = ? ORDER BY 1',
+        'chunk_terms': 'SELECT term, postings FROM chunk_terms WHERE pdf_id = ? ORDER BY 1',
+    }
+    for table, query in queries.items():
+        built = conn.execute(query, (1,)).fetchall()
+        assert built and built == conn.execute(query, (2,)).fetchall(), table
+    if fulltext.has_table(conn):
+        fts = conn.execute('SELECT rowid - ? FROM pages_fts WHERE rowid / ? = 2 ORDER BY 1',
+                           (2 * fulltext.ROWID_STRIDE, fulltext.ROWID_STRIDE)).fetchall()
+        assert [row[0] for row in fts] == list(range(1, len(page_texts) + 1))
+    assert list(pages.StoredPages(conn, 2, batch_size=4)) == page_texts
+    conn.close()
+    print("✅ Page-by-page indexing matches whole-text indexing")
+
+
+def test_select_context_relevant_and_within_budget():
+    """The chunks picked for a question are about it and fit the token budget"""
+    conn = db.connect(make_db())
+    retrieval.index_module(conn, 1, make_text())
+    conn.commit()
+
+    for topic in TOPICS:
+        context = retrieval.select_context(conn, 1, f'Explain {topic}', budget=200)
+        assert topic in context.lower(), topic
+        assert token_budget.count_tokens(context) <= 200
+    # Nothing matches: the opening chunks are used instead of nothing
+    context = retrieval.select_context(conn, 1, 'quantum chromodynamics', budget=200)
+    assert context and context.startswith('Photosynthesis')
+    conn.close()
+    print("✅ Context is relevant to the question and within budget")
+
+
+def test_reindex_replaces_only_search_rows():
+    """Re-indexing leaves cached answers, banked questions and the sentence index alone"""
+    db_name = make_db()
+    conn = db.connect(db_name)
+    text = make_text()
+    conn.execute("INSERT INTO pdfs (id, filename, filepath, module_name, content_text) VALUES (1, 'n.txt', '', 'N', ?)",
+                 (text,))
+    retrieval.index_module(conn, 1, text)
+    local_mcq.build_sentence_index(conn, 1, text)
+    quiz_bank.store(conn, 1, [{'question': 'What erupts?', 'options': ['A', 'B', 'C', 'D'], 'correct': 0}], 'llm')
+    conn.commit()
+    AnswerCache(db_name).put(1, 'What does a volcano do?', 'It erupts.')
+    chunks = conn.execute('SELECT COUNT(*) FROM chunks WHERE pdf_id = 1').fetchone()
+
+    retrieval.index_module(conn, 1, text)
+    conn.commit()
+    assert conn.execute('SELECT COUNT(*) FROM chunks WHERE pdf_id = 1').fetchone() == chunks
+    for table in ('answer_cache', 'mcqs', 'mcq_sentences'):
+        assert conn.execute(f'SELECT COUNT(*) FROM {table} WHERE pdf_id = 1').fetchone()[0], table
+    conn.close()
+    print("✅ Re-indexing keeps answers, quiz questions and sentences")
+
+
+def test_delete_route_clears_module_data():
+    """Deleting a module drops its indexes, cached answers, quiz bank and sentence index"""
+    client = make_client()
+    pdf_id = save_module(client, 'Volcanoes', make_text())
+    client.post('/api/ask', json={'pdf_id': pdf_id, 'question': 'What happens when a volcano erupts?'})
+    conn = db.connect()
+    quiz_bank.store(conn, pdf_id, [{'question': 'What erupts?', 'options': ['A', 'B', 'C', 'D'], 'correct': 0}],
+                    'llm')
+    conn.commit()
+    tables = ('chunks', 'index_paragraphs', 'mcq_sentences', 'answer_cache', 'mcqs')
+    assert all(conn.execute(f'SELECT COUNT(*) FROM {t} WHERE pdf_id = ?', (pdf_id,)).fetchone()[0] for t in tables)
+
+    assert client.delete(f'/api/modules/{pdf_id}').status_code == 200
+    for table in tables:
+        assert not conn.execute(f'SELECT COUNT(*) FROM {table} WHERE pdf_id = ?', (pdf_id,)).fetchone()[0], table
+    assert fulltext.search(conn, 'volcano', pdf_id=pdf_id) == []
+    conn.close()
+    print("✅ Deleting a module clears everything built from it")
+
+
+def test_pack_reads_chunks_in_one_query():
+    """Context selection loads its candidate chunks with a single query"""
+    conn = db.connect(make_db())
+    retrieval.index_module(conn, 1, make_text())
+    conn.commit()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    context = retrieval.spread_context(conn, 1, budget=900)
+    conn.set_trace_callback(None)
+    assert context and len([s for s in statements if 'FROM chunks' in s]) == 1
+    conn.close()
+    print("✅ Candidate chunks load in one query")
+
+
+def test_oversized_chunk_is_truncated():
+    """A single chunk larger than the budget is cut down rather than dropped"""
+    conn = db.connect(make_db())
+    retrieval.index_module(conn, 1, TOPICS['mitosis'] * 40)
+    conn.commit()
+    context = retrieval.select_context(conn, 1, 'mitosis', budget=20)
+    assert context and token_budget.count_tokens(context) <= 20
+    conn.close()
+    print("✅ Oversized chunk truncated to the budget")
+
+
+def test_spread_context_samples_whole_module():
+    """MCQ context is sampled across the module, not just its start"""
+    conn = db.connect(make_db())
+    retrieval.index_module(conn, 1, make_text())
+    conn.commit()
+    context = retrieval.spread_context(conn, 1, budget=900).lower()
+    assert all(topic in context for topic in TOPICS)
+    assert retrieval.spread_context(conn, 2) == ''
+    conn.close()
+    print("✅ Spread context covers every section")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Retrieval Test")
+    print("=" * 60)
+    test_chunks_overlap_and_cover_text()
+    test_pieces_chunk_like_the_joined_text()
+    test_index_pages_matches_index_module()
+    test_select_context_relevant_and_within_budget()
+    test_reindex_replaces_only_search_rows()
+    test_delete_route_clears_module_data()
+    test_pack_reads_chunks_in_one_query()
+    test_oversized_chunk_is_truncated()
+    test_spread_context_samples_whole_module()
@@ -0,0 +1,73 @@
+"""
+Test script for BM25 keyword search (search_index.py) and the local answer
+fallback built on it (llm_handler.local_answer)
+"""
+import db
+import search_index
+from llm_handler import answer_question, local_answer
+from search_index import MemoryIndex, ParagraphIndex
+from testing import llm_provider, make_db
+
+CORPUS = '\n\n'.join([
+    'Volcanoes erupt when magma rises through the crust.',
+    'Glaciers carve valleys as the ice moves slowly downhill over many years.',
+    'Magma that cools slowly underground forms granite; magma that reaches the surface as lava cools into basalt.',
+    'Earthquakes happen when plates slip along a fault.',
+])
+
+
+def stored_index():
+    conn = db.connect(make_db())
+    search_index.build_index(conn, 1, CORPUS)
+    conn.commit()
+    return conn, ParagraphIndex(conn, 1)
+
+
+def test_memory_index_ranks_by_bm25():
+    """More matching terms rank higher, shorter paragraphs win equal matches, unmatched ones are left out"""
+    index = MemoryIndex(CORPUS)
+    results = index.search('magma cools slowly', top_k=4)
+    assert [text.split()[0] for _, text in results] == ['Magma', 'Volcanoes', 'Glaciers']
+    assert results[0][0] > results[1][0] > results[2][0] > 0
+
+    assert index.search('fault plates')[0][1].startswith('Earthquakes')
+    assert index.search('tectonic') == [] and index.search('?!') == []
+    assert MemoryIndex('').search('magma') == []
+    print("✅ In-memory BM25 ranks paragraphs by relevance")
+
+
+def test_stored_index_matches_memory_index():
+    """The SQLite-backed index scores and orders paragraphs exactly like the in-memory one"""
+    conn, stored = stored_index()
+    for query in ('magma cools slowly', 'ice valleys', 'lava basalt granite', 'tectonic'):
+        assert stored.search(query, top_k=4) == MemoryIndex(CORPUS).search(query, top_k=4), query
+    assert [unit_no for _, unit_no in stored.rank('magma', top_k=4)] == [2, 0]
+    assert ParagraphIndex(conn, 2).search('magma') == []
+    conn.close()
+    print("✅ Stored BM25 index agrees with the in-memory one")
+
+
+def test_local_answer_returns_top_passage():
+    """With no LLM configured the answer is the best-matching paragraph"""
+    answer = local_answer('Where does basalt come from?', CORPUS)
+    assert answer.startswith('[Local Search Result]') and 'lava cools into basalt' in answer
+    assert 'Glaciers' not in answer
+
+    conn, stored = stored_index()
+    with llm_provider(None):
+        answer = answer_question('How are valleys carved?', CORPUS, index=stored)
+    assert answer.startswith('[Local Search Result]') and 'Glaciers carve valleys' in answer
+    conn.close()
+
+    assert local_answer('Where does basalt come from?', '   ').startswith("I couldn't find any content")
+    assert local_answer('What about tectonics?', CORPUS).startswith("I couldn't find a specific answer")
+    print("✅ Local fallback answers with the top passage")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Keyword Search Test")
+    print("=" * 60)
+    test_memory_index_ranks_by_bm25()
+    test_stored_index_matches_memory_index()
+    test_local_answer_returns_top_passage()
@@ -0,0 +1,51 @@
+"""
+Test script for streaming answers from /api/ask/stream
+Runs the app in-process against the local stub LLM server (no network, no API key needed)
+"""
+import contextlib
+import io
+import re
+import time
+
+import stub_llm_server
+from testing import make_client, save_module, parse_sse
+
+
+def test_stream_answer():
+    """Deltas arrive as token events and the finished answer is stored"""
+    client = make_client()
+    pdf_id = save_module(client, 'Stream Test',
+                         'Photosynthesis converts light energy into chemical energy in plants.')
+
+    start = time.perf_counter()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        response = client.post('/api/ask/stream', json={'pdf_id': pdf_id, 'question': 'What is photosynthesis?'})
+        body = response.get_data(as_text=True)
+    elapsed = time.perf_counter() - start
+    assert 'time to first token' not in output.getvalue()
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    events = parse_sse(body)
+    tokens = [data['delta'] for event, data in events if event == 'token']
+    done = [data for event, data in events if event == 'done']
+    assert len(tokens) > 1, 'expected the answer in several chunks'
+    assert done and done[0]['answer'] == ''.join(tokens) == stub_llm_server.CANNED_ANSWER
+    print(f"✅ Streamed {len(tokens)} chunks, TTFT {done[0]['ttft_ms']}ms, total {elapsed * 1000:.0f}ms")
+
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert re.search(r'app_stream_first_token_seconds_count\{cached="false"\} [1-9]', metrics)
+    print("✅ Time to first token recorded in /metrics")
+
+    history = client.get(f'/api/conversations/{pdf_id}').get_json()['conversations']
+    assert history and history[0]['answer'] == stub_llm_server.CANNED_ANSWER
+    print("✅ Streamed answer saved to conversation history")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Educational Content Assistant - Streaming Test")
+    print("=" * 60)
+    test_stream_answer()
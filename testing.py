@@ -0,0 +1,113 @@
+"""
+Shared helpers for the test_*.py scripts
+Each test gets its own database in a temp directory; tests that need the whole
+app share one in-process instance talking to the local stub LLM server.
+"""
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from benchmarks.synthetic_pdf import write_pdf
+import db
+import stub_llm_server
+
+# Everything that uses the default database or folders (the app, background
+# recorders) is pointed at a temp directory, never at the working tree
+WORKDIR = tempfile.mkdtemp(prefix='classmate-test-')
+db.DB_NAME = os.path.join(WORKDIR, 'assistant.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(WORKDIR, 'uploads')
+os.environ['EMBEDDINGS_DIR'] = os.path.join(WORKDIR, 'indexes', 'embeddings')
+db.migrate()
+
+_client = None
+
+
+def make_db():
+    """Path of a new, fully migrated database in a temp directory"""
+    path = os.path.join(tempfile.mkdtemp(prefix='classmate-test-'), 'test.db')
+    db.migrate(path)
+    return path
+
+
+def make_pdf(pages, seed=0, directory=None):
+    """Path of a generated text-only PDF with `pages` pages"""
+    directory = directory or tempfile.mkdtemp(prefix='classmate-test-')
+    return write_pdf(os.path.join(directory, f'doc-{pages}-{seed}.pdf'), pages, seed)
+
+
+def wait_for(condition, timeout=30, interval=0.02):
+    """Poll until condition() returns something truthy; returns it"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(interval)
+    raise AssertionError(f'timed out after {timeout}s waiting for {condition}')
+
+
+def wait_for_job(client, status_url):
+    """Poll an ingest job through the API until it is done or failed; returns it"""
+    def finished():
+        job = client.get(status_url).get_json()
+        return job if job['status'] in ('done', 'failed') else None
+    return wait_for(finished)
+
+
+@contextmanager
+def llm_provider(base_url=None):
+    """Point get_client() at `base_url` for the duration, or at no provider (local mode) if None"""
+    names = ('OPENAI_API_KEY', 'OPENAI_BASE_URL')
+    previous = {name: os.environ.get(name) for name in names}
+    for name in names:
+        os.environ.pop(name, None)
+    if base_url:
+        os.environ.update(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=base_url)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def make_client():
+    """
+    Start the stub LLM and import the app, running in WORKDIR.
+    The app is only imported once per process, so every caller gets the same client.
+    """
+    global _client
+    if _client is None:
+        server, base_url = stub_llm_server.start_in_background(chunk_delay=0.01)
+        os.environ['OPENAI_API_KEY'] = 'stub'
+        os.environ['OPENAI_BASE_URL'] = base_url
+        os.chdir(WORKDIR)
+        import app
+        _client = app.app.test_client()
+    return _client
+
+
+def save_module(client, name, content):
+    """Create a typed-in module through the API; returns its pdf_id"""
+    response = client.post('/api/save-concept', json={'module_name': name, 'content': content})
+    data = response.get_json()
+    assert data.get('success'), data
+    return data['module_id']
+
+
+def parse_sse(body):
+    """Split a Server-Sent Events body into (event, data) pairs"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        event, data = 'message', ''
+        for line in block.split('\n'):
+            if line.startswith('event:'):
+                event = line[len('event:'):].strip()
+            elif line.startswith('data:'):
+                data += line[len('data:'):].strip()
+        events.append((event, json.loads(data) if data else None))
+    return events
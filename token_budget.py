@@ -0,0 +1,152 @@
+"""
+Token budget module - token counting and per-model prompt budgets
+Counts use tiktoken (a regular dependency, exact for OpenAI models) and otherwise,
+when it is missing or can't load its BPE file, a local approximation of BPE
+tokenization (words, numbers and punctuation runs, long pieces split every few
+characters) that stays within a few percent on English. Prompt budgets built on
+estimated counts hold back a share of the context window to absorb that error.
+"""
+import os
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
+ANSWER_MAX_TOKENS = int(os.getenv('ANSWER_MAX_TOKENS', 500))
+MCQ_MAX_TOKENS = int(os.getenv('MCQ_MAX_TOKENS', 4000))
+
+# Context window (prompt + completion) per model; unknown models get the smallest
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4': 8192,
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+# USD per million tokens (input, output); used for the cost column of /api/metrics/llm
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'gpt-4': (30.00, 60.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'text-embedding-3-small': (0.02, 0.0),
+    'text-embedding-3-large': (0.13, 0.0),
+}
+# Share of the context window held back when counts are estimated rather than exact
+ESTIMATE_SAFETY_MARGIN = float(os.getenv('TOKEN_ESTIMATE_MARGIN', 0.1))
+# Tokens the chat format adds per message (role, separators) and per reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+# Same shape as the GPT pre-tokenizer: contractions, words, numbers, punctuation, whitespace
+PIECE_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[A-Za-z]+| ?\d{1,3}| ?[^\sA-Za-z\d]+|\s+(?!\S)|\s+")
+# Typical BPE token length for pieces not in the vocabulary
+CHARS_PER_PIECE_TOKEN = 4
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+_reported = False
+
+
+def _encoding(model):
+    """tiktoken encoding for a model, or None (not installed, or the BPE file can't be loaded)"""
+    if tiktoken is None:
+        return None
+    model = model or LLM_MODEL
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding('cl100k_base')
+            except Exception as e:
+                print(f"tiktoken unavailable for {model}, estimating tokens locally: {e}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def counts_are_exact(model=None):
+    """Whether token counts for the model come from tiktoken rather than the local estimate"""
+    return _encoding(model) is not None
+
+
+def report_counting(model=None):
+    """Say once, at startup, whether token counts are exact or estimated"""
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    if not counts_are_exact(model):
+        print(f"Token counts are approximate (tiktoken is not available); prompt budgets keep "
+              f"{ESTIMATE_SAFETY_MARGIN:.0%} of the context window in reserve")
+
+
+def _piece_tokens(piece):
+    # Short common words are one token; longer pieces split into several
+    length = len(piece.strip()) or 1
+    return max(1, (length + CHARS_PER_PIECE_TOKEN - 1) // CHARS_PER_PIECE_TOKEN) if length > 6 else 1
+
+
+def count_tokens(text, model=None):
+    """Number of tokens in text for the given model"""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(_piece_tokens(piece) for piece in PIECE_RE.findall(text))
+
+
+def truncate(text, budget, model=None):
+    """Longest prefix of text that fits in `budget` tokens"""
+    if not text or budget <= 0:
+        return ''
+    encoding = _encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= budget else encoding.decode(tokens[:budget])
+    used = 0
+    end = 0
+    for match in PIECE_RE.finditer(text):
+        used += _piece_tokens(match.group(0))
+        if used > budget:
+            return text[:end]
+        end = match.end()
+    return text
+
+
+def count_message_tokens(messages, model=None):
+    """Prompt tokens of a chat completions `messages` list"""
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m.get('content') or '', model) for m in messages) + TOKENS_PER_REPLY
+
+
+def context_window(model=None):
+    return MODEL_CONTEXT_WINDOWS.get(model or LLM_MODEL, DEFAULT_CONTEXT_WINDOW)
+
+
+def context_budget(cap, max_tokens, reserved_messages=(), model=None):
+    """
+    Tokens available for module context in a prompt: the configured `cap`, or
+    whatever the model's window leaves after the other messages and the reply
+    (less ESTIMATE_SAFETY_MARGIN of the window when counts are estimated).
+    """
+    window = context_window(model)
+    room = window - max_tokens - count_message_tokens(list(reserved_messages), model)
+    if not counts_are_exact(model):
+        room -= int(window * ESTIMATE_SAFETY_MARGIN)
+    return max(0, min(cap, room))
+
+
+def cost_usd(model, prompt_tokens, completion_tokens):
+    """Spend for a number of tokens, or None for models without a known price"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000